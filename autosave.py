@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+AUTOSAVE_DELAY = 1.0  # Seconds from the first unsaved edit to its write
+
+
+def write_atomic(path, text, newline=None):
+    """Write text (or bytes) to a file through a temporary one renamed over it, so nobody sees half of it."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb' if isinstance(text, bytes) else 'w', newline=newline) as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Autosaver:
+    """Writes edits on a background thread, at most delay seconds after the first unsaved one.
+
+    mark(key, value) records the latest value of a key (the label lines of a
+    frame); edits made within the delay are coalesced into a single write per
+    key. write(pending) runs on the writer thread with {key: value} of every key
+    marked since the last write. A failed write is kept and retried after the
+    delay, and its exception is left in error.
+    """
+    def __init__(self, write, delay=AUTOSAVE_DELAY):
+        self._write = write
+        self.delay = delay
+        self._pending = {}
+        self._writing = {}  # Values the writer thread is writing right now
+        self._deadline = None  # time.monotonic() at which the pending values are written
+        self._cond = threading.Condition()
+        self._closed = False
+        self.writes = 0
+        self.error = None
+        self._worker = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._worker.start()
+
+    def mark(self, key, value):
+        with self._cond:
+            self._pending[key] = value
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.delay
+                self._cond.notify_all()
+
+    def get(self, key, default=None):
+        """Value of key not yet on disk, default when it has none."""
+        with self._cond:
+            return self._pending.get(key, self._writing.get(key, default))
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending.keys() | self._writing.keys())
+
+    def flush(self, wait=True):
+        """Write everything marked so far now; with wait, return once it is written (or failed)."""
+        with self._cond:
+            if self._pending:
+                self._deadline = time.monotonic()
+                self._cond.notify_all()
+            while wait and (self._pending or self._writing) and self._worker.is_alive():
+                self._cond.wait()
+                if self.error is not None and not self._writing:
+                    break
+
+    def close(self):
+        """Write what is pending and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._deadline = time.monotonic()
+            self._cond.notify_all()
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._pending and time.monotonic() >= self._deadline):
+                    if self._closed and (not self._pending or self.error is not None):
+                        # Nothing left, or writes keep failing: give up instead of hanging on exit
+                        return
+                    timeout = self._deadline - time.monotonic() if self._pending else None
+                    self._cond.wait(timeout)
+                self._writing, self._pending = self._pending, {}
+                self._deadline = None
+            try:
+                self._write(dict(self._writing))
+                error = None
+            except Exception as e:
+                error = e
+            with self._cond:
+                self.error = error
+                if error is None:
+                    self.writes += 1
+                else:
+                    # Keep the failed values for a retry, unless newer ones were marked meanwhile
+                    for key, value in self._writing.items():
+                        self._pending.setdefault(key, value)
+                    self._deadline = time.monotonic() + self.delay
+                self._writing = {}
+                self._cond.notify_all()
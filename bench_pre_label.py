@@ -0,0 +1,302 @@
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from pre_label_tool import (DEFAULT_MODEL, detect_batch, extract_and_detect, iter_sampled_frames, load_model,
+                            save_frame_image)
+
+# Relative slowdown of seconds per video-minute reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+class _StubTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _StubBoxes:
+    def __init__(self, boxes):
+        self.cls = _StubTensor(np.zeros(len(boxes), dtype=np.float32))
+        self.conf = _StubTensor(np.full(len(boxes), 0.9, dtype=np.float32))
+        self.xywh = _StubTensor(boxes)
+
+
+class _StubResult:
+    def __init__(self, boxes):
+        self.boxes = _StubBoxes(boxes)
+
+
+class StubDetector:
+    """Stands in for YOLO with a fixed set of person boxes, so decode and write cost can be measured alone."""
+    def __init__(self, num_boxes=5):
+        self.num_boxes = num_boxes
+
+    def __call__(self, frames, **kwargs):
+        results = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            k = np.arange(self.num_boxes, dtype=np.float32)
+            boxes = np.column_stack([(k + 0.5) * w / self.num_boxes, np.full_like(k, h / 2),
+                                     np.full_like(k, w / 20), np.full_like(k, h / 4)])
+            results.append(_StubResult(boxes))
+        return results
+
+
+def make_synthetic_video(video_path, width=1280, height=720, seconds=10, fps=30):
+    """Write a synthetic mp4 with a few moving rectangles over a noisy background."""
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(int(seconds * fps)):
+        frame = background.copy()
+        for k in range(5):
+            # Each "person" walks horizontally at its own speed
+            x = int((i * (3 + k) + k * width // 5) % width)
+            y = height // 4 + k * height // 10
+            cv2.rectangle(frame, (x, y), (x + width // 20, y + height // 4), (40 * k, 200, 255 - 40 * k), -1)
+        writer.write(frame)
+    writer.release()
+    return video_path
+
+
+def load_sampled_frames(video_path, frame_interval=0.5, max_frames=None):
+    """Decode the sampled frames (the first max_frames of them) once so the benchmark only measures inference."""
+    cap = cv2.VideoCapture(str(video_path))
+    frames = [frame for _, _, frame in itertools.islice(iter_sampled_frames(cap, frame_interval), max_frames)]
+    cap.release()
+    return frames
+
+
+def benchmark_batch_sizes(model, frames, batch_sizes=(1, 2, 4, 8, 16), imgsz=640):
+    """Time inference over all frames for each batch size, returns a list of result rows."""
+    # Warm up so the first batch size does not pay for lazy initialisation
+    detect_batch(model, frames[:1], imgsz)
+    rows = []
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(frames), batch_size):
+            detect_batch(model, frames[i:i + batch_size], imgsz)
+        elapsed = time.perf_counter() - start
+        rows.append({'batch_size': batch_size, 'frames': len(frames), 'seconds': elapsed,
+                     'fps': len(frames) / elapsed if elapsed else 0.0})
+    return rows
+
+
+def folder_size(folder):
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+
+def measure_decode(video_path, frame_interval=0.5, sampling='grab'):
+    """Sampled frames/sec of decoding alone."""
+    cap = cv2.VideoCapture(str(video_path))
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_sampled_frames(cap, frame_interval, sampling))
+    elapsed = time.perf_counter() - start
+    cap.release()
+    return count / elapsed if elapsed else 0.0
+
+
+def measure_inference(model, frames, batch_size=8, imgsz=640):
+    """Frames/sec of the detector alone, on frames already in memory."""
+    detect_batch(model, frames[:1], imgsz)  # Warm up
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        detect_batch(model, frames[i:i + batch_size], imgsz)
+    elapsed = time.perf_counter() - start
+    return len(frames) / elapsed if elapsed else 0.0
+
+
+def measure_write(frames, output_folder, image_format='png', image_quality=None):
+    """MB/s of encoding and writing frames as images on one thread."""
+    os.makedirs(output_folder, exist_ok=True)
+    start = time.perf_counter()
+    for save_count, frame in enumerate(frames):
+        save_frame_image(output_folder, save_count, frame, image_format, image_quality)
+    elapsed = time.perf_counter() - start
+    written = folder_size(output_folder)
+    shutil.rmtree(output_folder)
+    return written / 1e6 / elapsed if elapsed else 0.0
+
+
+def run_case(case):
+    """Benchmark one (video, detector) case; runs in a fresh process so its peak RSS is its own."""
+    video_path, seconds, detector, options, work_dir = case
+    model = StubDetector() if detector == 'stub' else load_model(detector, imgsz=options['imgsz'])
+
+    frame_output_folder = os.path.join(work_dir, 'images')
+    label_output_folder = os.path.join(work_dir, 'labels')
+    start = time.perf_counter()
+    extract_and_detect(video_path, frame_output_folder, label_output_folder, options['frame_interval'],
+                       options['sampling'], options['batch_size'], options['imgsz'], model=model,
+                       pipeline=options['pipeline'], image_format=options['image_format'], progress=False)
+    end_to_end = time.perf_counter() - start
+    # Read before the frames for the inference and write measurements are loaded, so it is the pipeline's peak
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is in KB on Linux
+    output_mb = (folder_size(frame_output_folder) + folder_size(label_output_folder)) / 1e6
+    shutil.rmtree(work_dir)
+    frames = load_sampled_frames(video_path, options['frame_interval'], options['max_frames'])
+
+    return {
+        'video': os.path.basename(video_path),
+        'detector': detector,
+        'decode_fps': measure_decode(video_path, options['frame_interval'], options['sampling']),
+        'inference_fps': measure_inference(model, frames, options['batch_size'], options['imgsz']),
+        'write_mb_s': measure_write(frames, work_dir, options['image_format']),
+        'end_to_end_s': end_to_end,
+        'seconds_per_video_minute': end_to_end / (seconds / 60),
+        'output_mb': output_mb,
+        'peak_rss_mb': peak_rss_mb,
+    }
+
+
+def run_suite(resolutions, lengths, detectors, options, output_path, video_dir=None):
+    """Benchmark every resolution x length x detector and save the results as JSON."""
+    tmp_dir = tempfile.mkdtemp()
+    video_dir = video_dir or tmp_dir
+    os.makedirs(video_dir, exist_ok=True)
+    cases = []
+    for width, height in resolutions:
+        for seconds in lengths:
+            video_path = os.path.join(video_dir, f"synthetic_{width}x{height}_{seconds}s.mp4")
+            if not os.path.exists(video_path):
+                make_synthetic_video(video_path, width, height, seconds)
+            for detector in detectors:
+                cases.append((video_path, seconds, detector, options, os.path.join(tmp_dir, f"out_{len(cases)}")))
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    try:
+        for case in cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_case, case).result()
+            print(f"{result['video']:>32} {result['detector']:>12}: {result['seconds_per_video_minute']:.2f}s "
+                  f"per video-minute")
+            results.append(result)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(),
+                     'processor': platform.processor(), 'cpu_count': os.cpu_count(), 'opencv': cv2.__version__},
+        'options': options,
+        'results': results,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Saved benchmark results to {output_path}")
+    return report
+
+
+def print_suite_table(results):
+    print(f"{'video':>32} | {'detector':>12} | {'decode fps':>10} | {'infer fps':>9} | {'write MB/s':>10} | "
+          f"{'peak RSS MB':>11} | {'s/video-min':>11}")
+    print("-" * 115)
+    for r in results:
+        print(f"{r['video']:>32} | {r['detector']:>12} | {r['decode_fps']:>10.1f} | {r['inference_fps']:>9.1f} | "
+              f"{r['write_mb_s']:>10.1f} | {r['peak_rss_mb']:>11.0f} | {r['seconds_per_video_minute']:>11.2f}")
+
+
+def compare_reports(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Print the change in seconds per video-minute of every case found in both reports.
+
+    Returns the cases that got slower by more than threshold.
+    """
+    previous = {(r['video'], r['detector']): r for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        old = previous.get((r['video'], r['detector']))
+        if old is None:
+            continue
+        change = r['seconds_per_video_minute'] / old['seconds_per_video_minute'] - 1
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"{r['video']:>32} {r['detector']:>12}: {old['seconds_per_video_minute']:.2f}s -> "
+              f"{r['seconds_per_video_minute']:.2f}s ({change:+.1%}) {flag}")
+        if change > threshold:
+            regressions.append(r)
+    return regressions
+
+
+def print_table(rows):
+    print(f"{'batch':>6} | {'frames':>6} | {'seconds':>8} | {'frames/sec':>10}")
+    print("-" * 40)
+    for row in rows:
+        print(f"{row['batch_size']:>6} | {row['frames']:>6} | {row['seconds']:>8.2f} | {row['fps']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the video pre-labeling pipeline on synthetic videos")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch_parser = subparsers.add_parser('batch', help="frames/sec of YOLO inference for each batch size")
+    batch_parser.add_argument('--model', default=DEFAULT_MODEL)
+    batch_parser.add_argument('--imgsz', type=int, default=640)
+    batch_parser.add_argument('--batch-sizes', default='1,2,4,8,16')
+    batch_parser.add_argument('--width', type=int, default=1280)
+    batch_parser.add_argument('--height', type=int, default=720)
+    batch_parser.add_argument('--seconds', type=float, default=20)
+    batch_parser.add_argument('--frame-interval', type=float, default=0.5)
+
+    suite_parser = subparsers.add_parser('suite', help="decode/inference/write speed, peak RSS and end-to-end time")
+    suite_parser.add_argument('--resolutions', default='640x360,1280x720,1920x1080')
+    suite_parser.add_argument('--lengths', default='30,120', help="Video lengths in seconds")
+    suite_parser.add_argument('--detectors', default=f'stub,{DEFAULT_MODEL}',
+                              help="'stub' for a no-op detector, otherwise YOLO model names")
+    suite_parser.add_argument('--frame-interval', type=float, default=0.5)
+    suite_parser.add_argument('--sampling', default='grab')
+    suite_parser.add_argument('--batch-size', type=int, default=8)
+    suite_parser.add_argument('--imgsz', type=int, default=640)
+    suite_parser.add_argument('--pipeline', action='store_true')
+    suite_parser.add_argument('--image-format', default='png')
+    suite_parser.add_argument('--max-frames', type=int, default=64,
+                              help="Frames kept in memory for the inference and write measurements")
+    suite_parser.add_argument('--video-dir', default=None, help="Keep the synthetic videos here between runs")
+    suite_parser.add_argument('--output', default='bench_results.json')
+    suite_parser.add_argument('--compare', default=None, help="Earlier results JSON to check for regressions")
+    args = parser.parse_args()
+
+    if args.command == 'batch':
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            video_path = make_synthetic_video(os.path.join(tmp_dir, 'synthetic.mp4'), args.width, args.height,
+                                              args.seconds)
+            frames = load_sampled_frames(video_path, args.frame_interval)
+
+        model = load_model(args.model, imgsz=args.imgsz)  # Reports its own startup time
+        batch_sizes = [int(b) for b in args.batch_sizes.split(',')]
+        print_table(benchmark_batch_sizes(model, frames, batch_sizes, args.imgsz))
+        return
+
+    resolutions = [tuple(int(v) for v in r.split('x')) for r in args.resolutions.split(',')]
+    lengths = [float(s) for s in args.lengths.split(',')]
+    options = {'frame_interval': args.frame_interval, 'sampling': args.sampling, 'batch_size': args.batch_size,
+               'imgsz': args.imgsz, 'pipeline': args.pipeline, 'image_format': args.image_format,
+               'max_frames': args.max_frames}
+    report = run_suite(resolutions, lengths, args.detectors.split(','), options, args.output, args.video_dir)
+    print_suite_table(report['results'])
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare_reports(json.load(f), report)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} benchmark case(s) regressed by more than {REGRESSION_THRESHOLD:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from detector_backends import BACKENDS
+from pre_label_tool import DEFAULT_MODEL, detect_batch, iter_sampled_frames, load_model, person_boxes
+from tracker import iou_matrix, match_boxes
+
+
+def run_backend(model, frames, batch_size=8, imgsz=640, conf=0.25):
+    """Detect people on every frame, returns the per-frame person boxes and the frames/sec."""
+    boxes = []
+    detect_batch(model, frames[:1], imgsz, conf)  # Warm up
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        batch = frames[i:i + batch_size]
+        for frame, result in zip(batch, detect_batch(model, batch, imgsz, conf)):
+            boxes.append(person_boxes(result, frame.shape)[0])
+    elapsed = time.perf_counter() - start
+    return boxes, len(frames) / elapsed if elapsed else 0.0
+
+
+def box_agreement(reference, candidate, min_iou=0.5):
+    """Compare a backend's person boxes with the reference backend, frame by frame.
+
+    Boxes are paired one-to-one by IoU; recall is the share of reference boxes
+    found again, precision the share of candidate boxes that have a reference.
+    """
+    matched = reference_total = candidate_total = 0
+    ious = []
+    for ref_boxes, cand_boxes in zip(reference, candidate):
+        iou = iou_matrix(ref_boxes, cand_boxes)
+        matches, _, _ = match_boxes(iou, min_iou)
+        matched += len(matches)
+        reference_total += len(ref_boxes)
+        candidate_total += len(cand_boxes)
+        ious.extend(iou[matches[:, 0], matches[:, 1]])
+    return {
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+        'recall': matched / reference_total if reference_total else 1.0,
+        'precision': matched / candidate_total if candidate_total else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare speed and box agreement of the detector backends")
+    parser.add_argument('video')
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--backends', default='torch,onnx,onnx-int8,openvino,openvino-int8',
+                        help="Comma separated, a -int8 suffix quantizes; the first one is the reference")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--frame-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frames = [frame for _, _, frame in iter_sampled_frames(cap, args.frame_interval)]
+    cap.release()
+
+    reference = None
+    print(f"{'backend':>14} | {'frames/sec':>10} | {'mean IoU':>8} | {'recall':>6} | {'precision':>9}")
+    print("-" * 60)
+    for name in args.backends.split(','):
+        backend, _, quantized = name.partition('-')
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {name}")
+        model = load_model(args.model, backend, quantized == 'int8', args.imgsz)
+        boxes, fps = run_backend(model, frames, args.batch_size, args.imgsz, args.conf)
+        if reference is None:
+            reference = boxes
+        agreement = box_agreement(reference, boxes)
+        print(f"{name:>14} | {fps:>10.2f} | {agreement['mean_iou']:>8.3f} | {agreement['recall']:>6.3f} | "
+              f"{agreement['precision']:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import os
+
+from ultralytics import YOLO
+
+# 'torch' runs the .pt weights in PyTorch eager mode, the others run an exported copy of them
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+
+def _quantize_onnx(onnx_path, int8_path):
+    """Dynamic int8 quantization of the weights of an ONNX model with ONNX Runtime."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def export_model(model_name, backend='torch', imgsz=640, int8=False, data=None):
+    """Export the PyTorch weights for a backend once and return the path YOLO() should load.
+
+    Exports are written next to the .pt file and reused on later runs. ONNX is
+    exported with a dynamic batch axis so batched inference keeps working, and
+    int8 uses ONNX Runtime dynamic quantization. For OpenVINO, int8 is done by
+    ultralytics' NNCF post-training quantization, calibrated on data (a dataset
+    yaml, ultralytics' default when None).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {backend} (expected one of {BACKENDS})")
+    if backend == 'torch':
+        if int8:
+            raise ValueError("int8 is only supported by the onnx and openvino backends")
+        return model_name
+
+    stem = os.path.splitext(model_name)[0]
+    if backend == 'onnx':
+        onnx_path = f"{stem}.onnx"
+        if not os.path.exists(onnx_path):
+            onnx_path = YOLO(model_name).export(format='onnx', imgsz=imgsz, dynamic=True)
+        if not int8:
+            return onnx_path
+        int8_path = f"{stem}_int8.onnx"
+        return int8_path if os.path.exists(int8_path) else _quantize_onnx(onnx_path, int8_path)
+
+    export_dir = f"{stem}_int8_openvino_model" if int8 else f"{stem}_openvino_model"
+    if os.path.isdir(export_dir):
+        return export_dir
+    export_options = {'format': 'openvino', 'imgsz': imgsz, 'dynamic': True, 'int8': int8}
+    if data is not None:
+        export_options['data'] = data
+    exported_dir = YOLO(model_name).export(**export_options)
+    if os.path.abspath(exported_dir) != os.path.abspath(export_dir):
+        # Keep int8 and fp32 exports apart whatever name this ultralytics version picked
+        os.replace(exported_dir, export_dir)
+    return export_dir
+
+
+def create_detector(model_name, backend='torch', imgsz=640, int8=False, data=None):
+    """YOLO handle running on the given backend.
+
+    ultralytics wraps ONNX Runtime and OpenVINO models in the same YOLO API, so
+    the results (and therefore the label files) have the same format whatever
+    the backend.
+    """
+    path = export_model(model_name, backend, imgsz, int8, data)
+    return YOLO(path) if backend == 'torch' else YOLO(path, task='detect')
@@ -0,0 +1,130 @@
+import json
+import os
+
+JOURNAL_NAME = ".edit_journal.jsonl"
+TRASH_NAME = ".trash"
+
+
+def read_last_line(path, chunk_size=4096):
+    """Last complete line of a file, read backwards from the end; a torn last write is cut off the file."""
+    with open(path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b''
+        while end > 0:
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            if data.count(b'\n') >= 2 or (end == 0 and b'\n' in data):
+                break
+        if b'\n' not in data:
+            # Nothing but a partial first line
+            f.truncate(0)
+            return None
+        complete = data[:data.rindex(b'\n')]
+        if not data.endswith(b'\n'):
+            f.truncate(end + len(complete) + 1)
+        return complete[complete.rfind(b'\n') + 1:].decode()
+
+
+def applied_edits(path):
+    """Edits of a journal in effect (made or redone, not undone), oldest first; the file is only read."""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        data = f.read()
+    end = data.rfind(b'\n')
+    if end < 0:
+        return []
+    # A torn last write is ignored, as EditJournal would cut it off
+    head = json.loads(data[data.rfind(b'\n', 0, end) + 1:end])['head']
+    edits = []
+    while head is not None:
+        edit = json.loads(data[head:data.index(b'\n', head)])
+        edits.append(edit)
+        head = edit['prev']
+    return edits[::-1]
+
+
+class EditJournal:
+    """Append-only on-disk log of edits, with unlimited undo and redo.
+
+    Every edit is one JSON line. The undo and redo stacks are linked lists
+    through the file: an edit points at the edit before it ('prev'), and an
+    undo marker points at the redo entry before it. Every line also carries
+    the resulting stack heads, so the state after a crash is the last line of
+    the file, and memory use does not grow with the session.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.head = None  # Offset of the edit undo() reverts next
+        self.redo_head = None  # Offset of the undo marker redo() replays next
+        self.last_type = None  # Type of the last line: 'edit', 'undo' or 'redo'
+        if os.path.exists(path):
+            line = read_last_line(path)
+            if line:
+                state = json.loads(line)
+                self.head, self.redo_head, self.last_type = state['head'], state['redo_head'], state['type']
+        self._file = open(path, 'a+b')
+
+    def record(self, op, **data):
+        """Log a new edit; it becomes the next one to undo and clears the redo stack."""
+        offset = self._end()
+        self._write({'type': 'edit', 'op': op, 'prev': self.head, **data, 'head': offset, 'redo_head': None})
+        self.head, self.redo_head = offset, None
+        return offset
+
+    def last_edit(self):
+        """The edit undo() would revert, None when there is none."""
+        return None if self.head is None else self._read(self.head)
+
+    def last_applied(self):
+        """(edit, undone) for the last line of the file: the edit it made or redid, or the one it undid.
+
+        That is the state the files should be in; None when the journal is empty.
+        """
+        if self.last_type == 'undo':
+            # The undo marker just written is the head of the redo stack
+            return self._read(self._read(self.redo_head)['edit']), True
+        if self.last_type in ('edit', 'redo'):
+            return self.last_edit(), False
+        return None
+
+    def undo(self, apply):
+        """Call apply(edit) with the edit to revert, then log the undo; returns the edit, None when there is none."""
+        if self.head is None:
+            return None
+        edit = self._read(self.head)
+        apply(edit)
+        offset = self._end()
+        self._write({'type': 'undo', 'edit': self.head, 'redo_prev': self.redo_head, 'head': edit['prev'],
+                     'redo_head': offset})
+        self.head, self.redo_head = edit['prev'], offset
+        return edit
+
+    def redo(self, apply):
+        """Call apply(edit) with the last undone edit to replay, then log the redo; None when there is none."""
+        if self.redo_head is None:
+            return None
+        marker = self._read(self.redo_head)
+        edit = self._read(marker['edit'])
+        apply(edit)
+        self._write({'type': 'redo', 'edit': marker['edit'], 'head': marker['edit'], 'redo_head': marker['redo_prev']})
+        self.head, self.redo_head = marker['edit'], marker['redo_prev']
+        return edit
+
+    def close(self):
+        self._file.close()
+
+    def _end(self):
+        return self._file.seek(0, os.SEEK_END)
+
+    def _write(self, entry):
+        self._file.seek(0, os.SEEK_END)
+        self._file.write((json.dumps(entry) + '\n').encode())
+        self._file.flush()
+        self.last_type = entry['type']
+
+    def _read(self, offset):
+        self._file.seek(offset)
+        return json.loads(self._file.readline())
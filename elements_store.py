@@ -0,0 +1,200 @@
+import bisect
+import csv
+import io
+import os
+import threading
+
+from autosave import write_atomic
+
+ELEMENT_FIELDS = ['frame_id', 'class_id', 'type', 'color', 'gender']
+ATTRIBUTES = ('type', 'color', 'gender')
+
+
+class ElementsStore:
+    """The rows of one elements_NNNN.csv, loaded once and kept in memory.
+
+    Rows are keyed by (frame_id, class_id). Every class also keeps the sorted
+    list of frames it has attributes in, so the nearest frame before or after a
+    given one is a bisect instead of a scan. Changes are tracked: new rows are
+    appended to the CSV on flush(), and the file is only rewritten when
+    existing rows changed or were removed. A row torn by a crash during an
+    append is dropped on load, and the file is then rewritten on the next
+    flush(). With a LabelDB (see label_db), the rows of video are read from and
+    flushed to the database instead.
+
+    One thread edits the rows; flush() may run on another (the autosave writer),
+    and only holds the lock while it copies the changes, not while it writes.
+    """
+    def __init__(self, csv_path, db=None, video=None):
+        self.csv_path = csv_path
+        self.db = db
+        self.video = video
+        self.rows = {}  # (frame_id, class_id) -> {'type': ..., 'color': ..., 'gender': ...}
+        self._frames = {}  # class_id -> sorted frame_ids that have a row for that class
+        self._fieldnames = list(ELEMENT_FIELDS)
+        self._added = {}  # Keys of new rows not yet written, in insertion order
+        self._changed = set()  # Keys of written rows whose values changed
+        self._removed = set()  # Keys of written rows that were removed
+        self._rewrite = False  # The CSV header or a torn row is unusable, so the whole file must be written
+        self._lock = threading.RLock()  # Guards the change tracking against flush() on another thread
+        self._flush_lock = threading.Lock()  # Keeps flushes, and so the writes, in order
+        self.load()
+
+    def load(self):
+        self.rows = {}
+        self._frames = {}
+        self._added = {}
+        self._changed = set()
+        self._removed = set()
+        self._rewrite = False
+        if self.db is not None:
+            self._load_rows(self.db.element_rows(self.video))
+            return
+        if not os.path.exists(self.csv_path):
+            return
+        with open(self.csv_path, mode='r', newline='') as file:
+            text = file.read()
+        reader = csv.DictReader(io.StringIO(text))
+        # Keep the file's own column order, so appended rows line up with the header
+        if reader.fieldnames and set(ELEMENT_FIELDS) <= set(reader.fieldnames):
+            self._fieldnames = reader.fieldnames
+        else:
+            self._rewrite = True
+        self._load_rows(reader)
+        if text and not text.endswith('\n'):
+            # An append cut short: the next one would run into its last line
+            self._rewrite = True
+
+    def _load_rows(self, rows):
+        for row in rows:
+            try:
+                key = (int(row['frame_id']), int(row['class_id']))
+            except (TypeError, ValueError):
+                # Torn by a crash during an append; the rewrite leaves it out
+                self._rewrite = True
+                continue
+            if key not in self.rows:
+                bisect.insort(self._frames.setdefault(key[1], []), key[0])
+            self.rows[key] = {name: row.get(name) or '' for name in ATTRIBUTES}
+
+    def get(self, frame_id, class_id):
+        return self.rows.get((frame_id, class_id))
+
+    def latest_before(self, class_id, frame_id):
+        """Attributes of class_id in the nearest frame before frame_id, None when there is none."""
+        frames = self._frames.get(class_id)
+        if not frames:
+            return None
+        i = bisect.bisect_left(frames, frame_id)
+        return self.rows[(frames[i - 1], class_id)] if i else None
+
+    def nearest(self, class_id, frame_id):
+        """Attributes of class_id in frame_id, else the latest frame before it, else the first one after it."""
+        frames = self._frames.get(class_id)
+        if not frames:
+            return None
+        i = bisect.bisect_right(frames, frame_id)
+        return self.rows[(frames[i - 1 if i else 0], class_id)]
+
+    def frames_in(self, class_id, start=0, end=None):
+        """Sorted frame_ids in start..end (inclusive, end defaults to the last one) where class_id has a row."""
+        frames = self._frames.get(class_id, [])
+        i = bisect.bisect_left(frames, start)
+        j = len(frames) if end is None else bisect.bisect_right(frames, end)
+        return frames[i:j]
+
+    def set(self, frame_id, class_id, attributes):
+        """Add or update the attributes of class_id in frame_id; unchanged values are not marked dirty."""
+        key = (frame_id, class_id)
+        values = {name: attributes.get(name) or '' for name in ATTRIBUTES}
+        with self._lock:
+            old = self.rows.get(key)
+            if old == values:
+                return
+            if old is None:
+                bisect.insort(self._frames.setdefault(class_id, []), frame_id)
+                self._added[key] = None
+            elif key not in self._added:
+                self._changed.add(key)
+            # Values are replaced, never changed in place, so a flush can write them without copying
+            self.rows[key] = values
+
+    def remove(self, frame_id, class_id):
+        key = (frame_id, class_id)
+        with self._lock:
+            if key not in self.rows:
+                return
+            del self.rows[key]
+            frames = self._frames[class_id]
+            del frames[bisect.bisect_left(frames, frame_id)]
+            if not frames:
+                del self._frames[class_id]
+            if key in self._added:
+                del self._added[key]
+            else:
+                self._changed.discard(key)
+                self._removed.add(key)
+
+    def prune(self, frame_count):
+        """Drop the rows of frames past the last one (frame_id >= frame_count)."""
+        with self._lock:
+            for class_id, frames in list(self._frames.items()):
+                while frames and frames[-1] >= frame_count:
+                    self.remove(frames[-1], class_id)
+
+    def is_dirty(self):
+        return self._rewrite or bool(self._added or self._changed or self._removed)
+
+    def take_changes(self):
+        """Pending changes as (upserts, deletes) for LabelDB; they count as written afterwards."""
+        with self._lock:
+            upserts = [key + (self.rows[key],) for key in list(self._added) + sorted(self._changed)]
+            deletes = sorted(self._removed)
+            self._added = {}
+            self._changed = set()
+            self._removed = set()
+            self._rewrite = False
+            return upserts, deletes
+
+    def restore_changes(self, upserts, deletes):
+        """Mark changes returned by take_changes() as pending again, after writing them failed."""
+        with self._lock:
+            self._changed.update(upsert[:2] for upsert in upserts if upsert[:2] in self.rows)
+            self._removed.update(key for key in deletes if key not in self.rows)
+
+    def flush(self):
+        """Write pending changes: append new rows, or rewrite the file (atomically) when existing rows changed."""
+        with self._flush_lock:
+            with self._lock:
+                if not self.is_dirty():
+                    return
+                if self.db is not None:
+                    upserts, deletes = self.take_changes()
+                else:
+                    rewrite = self._rewrite or self._changed or self._removed or not os.path.exists(self.csv_path)
+                    keys = list(self.rows) if rewrite else list(self._added)
+                    rows = [(key, self.rows[key]) for key in keys]
+                    self.take_changes()
+            try:
+                if self.db is not None:
+                    self.db.save_elements(self.video, upserts, deletes)
+                    return
+                file = io.StringIO()
+                writer = csv.DictWriter(file, fieldnames=self._fieldnames)
+                if rewrite:
+                    writer.writeheader()
+                for (frame_id, class_id), values in rows:
+                    writer.writerow({'frame_id': frame_id, 'class_id': class_id, **values})
+                if rewrite:
+                    write_atomic(self.csv_path, file.getvalue(), newline='')
+                else:
+                    with open(self.csv_path, mode='a', newline='') as csv_file:
+                        csv_file.write(file.getvalue())
+            except Exception:
+                # Keep the changes pending, so the next flush retries them
+                if self.db is not None:
+                    self.restore_changes(upserts, deletes)
+                else:
+                    with self._lock:
+                        self._rewrite = True
+                raise
@@ -5,16 +5,18 @@ import openai
 import re
 import random
 from prompt_gen import generate_prompts
+from label_db import LabelDB
 # Configuration
 openai.api_key   # Replace with your OpenAI API key
 prompts_output_folder = "prompt_gen"  # Replace with the actual path
 labels_folder = "labels_with_ids"  # Replace with the actual path
 elements_folder = "elements"  # Replace with the actual path
 output_folder = "expression"  # Replace with the actual path
+label_db_path = None  # Path of a labels.sqlite to read the elements from instead of the CSV files
 
 def main():
     # Generate prompts using generate_prompts function
-    prompt_file_paths = generate_prompts(elements_folder, prompts_output_folder)
+    prompt_file_paths = generate_prompts(elements_folder, prompts_output_folder, label_db_path)
     # Process each generated prompt file
     for prompt_file_path in prompt_file_paths:
 
@@ -97,50 +99,55 @@ def find_matching_ids(prompt, element_data):
 
     return list(matching_ids)
 
-def parse_elements(elements_folder,subfolder_name):
-    """Parse the elements CSV files to collect the data."""
-    element_data = []
+def read_element_rows(elements_folder, subfolder_name):
+    """Rows of a video's elements, from its CSV files or from the label database when label_db_path is set."""
+    if label_db_path:
+        db = LabelDB(label_db_path, readonly=True)
+        try:
+            return db.element_rows(subfolder_name)
+        finally:
+            db.close()
+    rows = []
     for file in os.listdir(elements_folder):
         if file.endswith(f"{subfolder_name}.csv"):
             file_path = os.path.join(elements_folder, file)
             with open(file_path, mode='r') as csv_file:
-                reader = csv.DictReader(csv_file)
-                for row in reader:
-                    # Strip and convert to lowercase
-                    color = row['color'].strip().lower() if row['color'] else ''
-                    type = row['type'].strip().lower() if row['type'] else ''
-                    gender = row['gender'].strip().lower() if row['gender'] else ''
-                    
-                    # Only include rows where both color and type are not empty
-                    if color and type and gender:
-                        element_data.append({
-                            'frame_id': int(row['frame_id']),
-                            'class_id': int(row['class_id']),
-                            'color': color,
-                            'type': type,
-                            'gender': gender
-                        })
+                rows.extend(csv.DictReader(csv_file))
+    return rows
+
+def parse_elements(elements_folder,subfolder_name):
+    """Parse the elements CSV files to collect the data."""
+    element_data = []
+    for row in read_element_rows(elements_folder, subfolder_name):
+        # Strip and convert to lowercase
+        color = row['color'].strip().lower() if row['color'] else ''
+        type = row['type'].strip().lower() if row['type'] else ''
+        gender = row['gender'].strip().lower() if row['gender'] else ''
+        
+        # Only include rows where both color and type are not empty
+        if color and type and gender:
+            element_data.append({
+                'frame_id': int(row['frame_id']),
+                'class_id': int(row['class_id']),
+                'color': color,
+                'type': type,
+                'gender': gender
+            })
     return element_data
 
 def filter_frames( matching_ids, subfolder_name):
     """Filter frames to find all IDs matching the attributes."""
     frame_data = {}
-    # Iterate through each CSV file in the elements folder
-    for file in os.listdir(elements_folder):
-        if file.endswith(f"{subfolder_name}.csv"):
-            file_path = os.path.join(elements_folder, file)
-            
-            with open(file_path, 'r') as csv_file:
-                reader = csv.DictReader(csv_file)
-                for row in reader:
-                    frame_number = int(row['frame_id'])
-                    class_id = int(row['class_id'])
-
-                    # Check if the class_id is in matching_ids
-                    if class_id in matching_ids:
-                        if frame_number not in frame_data:
-                            frame_data[frame_number] = []
-                        frame_data[frame_number].append(class_id)
+    # Iterate through the element rows of the video
+    for row in read_element_rows(elements_folder, subfolder_name):
+        frame_number = int(row['frame_id'])
+        class_id = int(row['class_id'])
+
+        # Check if the class_id is in matching_ids
+        if class_id in matching_ids:
+            if frame_number not in frame_data:
+                frame_data[frame_number] = []
+            frame_data[frame_number].append(class_id)
 
     # Sort class_ids for each frame_number
     for frame_number in frame_data:
@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+
+
+def image_nbytes(image):
+    """Approximate memory used by a decoded PIL image."""
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class FrameCache:
+    """Size-bounded LRU cache of decoded frames, filled ahead of navigation by a worker thread.
+
+    load(name) returns (image, boxes) for one frame and runs on the worker
+    thread for prefetches and on the caller's thread for misses. get() returns
+    a copy of the boxes, so callers can edit them without touching the cache.
+    """
+    def __init__(self, load, max_bytes=256 << 20):
+        self._load = load
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # name -> (image, boxes, nbytes), least recently used first
+        self._bytes = 0
+        self._wanted = []  # Names to prefetch, nearest to the current frame first
+        self._window = set()  # Last get() plus every name of the last prefetch() call
+        self._loading = None  # Name the worker is decoding right now
+        self._generation = {}  # Bumped by put_boxes/discard, so a prefetch racing an edit is dropped
+        self._cond = threading.Condition()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0  # get() calls that waited for the worker to finish the same frame
+        self.prefetched = 0
+        self._worker = threading.Thread(target=self._run, name="frame-prefetch", daemon=True)
+        self._worker.start()
+
+    def get(self, name):
+        with self._cond:
+            self._window = {name}
+            while self._loading == name and name not in self._entries:
+                self.waits += 1
+                self._cond.wait()
+            if name in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(name)
+                image, boxes, _ = self._entries[name]
+                return image, [dict(box) for box in boxes]
+            self.misses += 1
+            generation = self._generation.get(name, 0)
+        image, boxes = self._load(name)
+        with self._cond:
+            self._insert(name, image, boxes, generation)
+        return image, [dict(box) for box in boxes]
+
+    def prefetch(self, names):
+        """Replace the prefetch list; frames already cached are only marked as recently used."""
+        with self._cond:
+            self._wanted = []
+            self._window.update(names)
+            for name in names:
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                else:
+                    self._wanted.append(name)
+            self._cond.notify_all()
+
+    def put_boxes(self, name, boxes):
+        """Replace the cached boxes of a frame after its labels were saved."""
+        with self._cond:
+            self._generation[name] = self._generation.get(name, 0) + 1
+            if name in self._entries:
+                image, _, nbytes = self._entries[name]
+                self._entries[name] = (image, [dict(box) for box in boxes], nbytes)
+
+    def discard(self, name):
+        with self._cond:
+            self._generation[name] = self._generation.get(name, 0) + 1
+            if name in self._entries:
+                self._bytes -= self._entries.pop(name)[2]
+
+    def stats(self):
+        with self._cond:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'waits': self.waits, 'prefetched': self.prefetched,
+                    'hit_rate': self.hits / lookups if lookups else 0.0, 'frames': len(self._entries),
+                    'bytes': self._bytes}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+    def _insert(self, name, image, boxes, generation):
+        if self._generation.get(name, 0) != generation or name in self._entries:
+            return False
+        nbytes = image_nbytes(image)
+        self._entries[name] = (image, [dict(box) for box in boxes], nbytes)
+        self._bytes += nbytes
+        # Evict least recently used frames, but always keep the newest one
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._bytes -= self._entries.popitem(last=False)[1][2]
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._wanted:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                name = self._wanted.pop(0)
+                if name in self._entries:
+                    continue
+                if self._bytes >= self.max_bytes and next(iter(self._entries)) in self._window:
+                    # Full of frames around the current one: going further would evict nearer frames
+                    self._wanted = []
+                    continue
+                self._loading = name
+                generation = self._generation.get(name, 0)
+            try:
+                image, boxes = self._load(name)
+            except Exception:
+                # A frame that fails to load is left to the UI thread, which reports the error
+                image = None
+            with self._cond:
+                self._loading = None
+                if image is not None and self._insert(name, image, boxes, generation):
+                    self.prefetched += 1
+                self._cond.notify_all()
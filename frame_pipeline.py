@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Marks the end of a stage's output in a queue
+_END = object()
+
+
+class _StageError:
+    """Carries an exception raised in a producer thread over to the consuming stage."""
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(out_queue, item, stop):
+    # Block while the queue is full, but give up once the consumer has stopped
+    while True:
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+
+def start_producer(iterable, out_queue, stats, stop, name="producer"):
+    """Run iterable in a daemon thread, feeding each item into the bounded out_queue.
+
+    stats, here and below, is the StageStats of the stage (see instrumentation.VideoStats.stage).
+
+    put() blocks while the queue is full, so the producer never runs more than
+    the queue size ahead of its consumer. Setting stop makes the thread exit
+    instead of waiting for a consumer that is gone.
+    """
+    def run():
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                produced = time.perf_counter()
+                if not _put(out_queue, item, stop):
+                    return
+                stats.add(busy=produced - start, blocked=time.perf_counter() - produced, items=1)
+        except Exception as e:
+            _put(out_queue, _StageError(e), stop)
+            return
+        _put(out_queue, _END, stop)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def iter_queue(in_queue, stats):
+    """Yield items from a queue filled by start_producer until it is exhausted."""
+    while True:
+        stats.sample_occupancy(in_queue.qsize())
+        start = time.perf_counter()
+        item = in_queue.get()
+        stats.add(starved=time.perf_counter() - start)
+        if item is _END:
+            return
+        if isinstance(item, _StageError):
+            raise item.error
+        yield item
+
+
+class BoundedExecutor:
+    """Thread pool whose submit() blocks once max_pending tasks are queued or running.
+
+    The first exception raised by a task is re-raised by the next submit() or by
+    shutdown(), so failed writes are never silently dropped.
+    """
+    def __init__(self, workers, max_pending=None, stats=None, caller_stats=None):
+        self.stats = stats  # Busy time of the pool's tasks
+        self.caller_stats = caller_stats  # Stage that submits work, charged for time blocked in submit()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 2)
+        self._error = None
+
+    def _run(self, fn, args):
+        start = time.perf_counter()
+        try:
+            fn(*args)
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+        finally:
+            if self.stats is not None:
+                self.stats.add(busy=time.perf_counter() - start, items=1)
+            self._slots.release()
+
+    def submit(self, fn, *args):
+        if self._error is not None:
+            raise self._error
+        start = time.perf_counter()
+        self._slots.acquire()
+        if self.caller_stats is not None:
+            self.caller_stats.add(blocked=time.perf_counter() - start)
+        self._executor.submit(self._run, fn, args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.shutdown()
+        else:
+            self._executor.shutdown(wait=True)
+        return False
+
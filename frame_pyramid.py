@@ -0,0 +1,106 @@
+import os
+import threading
+
+from PIL import Image
+
+# Inside a video's image folder, one subfolder per downscale factor: .pyramid/2/000000.jpg, .pyramid/4/...
+PYRAMID_NAME = ".pyramid"
+PYRAMID_FACTORS = (2, 4, 8)
+PYRAMID_QUALITY = 90
+
+
+def pyramid_factor(scale, factors=PYRAMID_FACTORS):
+    """Largest downscale factor whose level still has the resolution displayed at scale, 1 for the original."""
+    return max((factor for factor in factors if 1 / factor >= scale), default=1)
+
+
+def decode_scaled(source, size):
+    """Decode an image (path or file object) to exactly size.
+
+    JPEGs are decoded at the smallest DCT reduction (1/2, 1/4, 1/8) still at
+    least as large as size, so only the remaining downscale is done by resize().
+    """
+    image = Image.open(source)
+    image.draft('RGB', size)  # No-op for formats other than JPEG
+    image.load()
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+class FramePyramid:
+    """Downscaled copies of a video's frames, built once in the background and kept on disk.
+
+    open_frame(name) returns the original frame as a path or file object. A
+    worker thread writes every missing level of every frame from one decode;
+    load() reads the cheapest level that still has the requested resolution,
+    and falls back to the original frame until that level exists.
+    """
+    def __init__(self, frame_folder, open_frame, factors=PYRAMID_FACTORS):
+        self.folder = os.path.join(frame_folder, PYRAMID_NAME)
+        self._open_frame = open_frame
+        self.factors = tuple(sorted(factors))
+        self.built = 0  # Frames whose levels all exist, out of the frames given to start()
+        self.total = 0
+        self._stop = threading.Event()
+        self._worker = None
+
+    def level_path(self, frame_name, factor):
+        return os.path.join(self.folder, str(factor), os.path.splitext(frame_name)[0] + '.jpg')
+
+    def load(self, frame_name, scale):
+        """Frame at scale times its original size."""
+        source = self._open_frame(frame_name)
+        with Image.open(source) as header:
+            width, height = header.size  # Only the header is read
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        factor = pyramid_factor(scale, self.factors)
+        level_path = self.level_path(frame_name, factor)
+        if factor > 1 and os.path.exists(level_path):
+            return decode_scaled(level_path, size)
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return decode_scaled(source, size)
+
+    def start(self, frame_names):
+        """Build the missing levels of frame_names on a background thread."""
+        self.stop()
+        self._stop.clear()
+        self.built = 0
+        self.total = len(frame_names)
+        self._worker = threading.Thread(target=self._build, args=(list(frame_names),), name="frame-pyramid",
+                                        daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        if self._worker is not None:
+            self._stop.set()
+            self._worker.join()
+            self._worker = None
+
+    def _build(self, frame_names):
+        for frame_name in frame_names:
+            if self._stop.is_set():
+                return
+            missing = [factor for factor in self.factors if not os.path.exists(self.level_path(frame_name, factor))]
+            if missing:
+                try:
+                    self._build_frame(frame_name, missing)
+                except (OSError, ValueError):
+                    # Unreadable frames are reported by the viewer when it loads them
+                    continue
+            self.built += 1
+
+    def _build_frame(self, frame_name, factors):
+        image = Image.open(self._open_frame(frame_name))
+        width, height = image.size
+        image.draft('RGB', (width // factors[0], height // factors[0]))
+        image = image.convert('RGB')
+        # Each level is downscaled from the previous one, not from the original
+        for factor in factors:
+            image = image.resize((max(1, width // factor), max(1, height // factor)), Image.LANCZOS)
+            path = self.level_path(frame_name, factor)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + '.tmp'
+            image.save(tmp_path, 'JPEG', quality=PYRAMID_QUALITY)
+            os.replace(tmp_path, path)
@@ -0,0 +1,102 @@
+from collections import defaultdict
+
+# Checked in this order when a point is near several corners of the same box
+CORNERS = ('top-left', 'bottom-right', 'top-right', 'bottom-left')
+
+
+def box_corners(x, y, w, h):
+    return {'top-left': (x, y), 'bottom-right': (x + w, y + h), 'top-right': (x + w, y), 'bottom-left': (x, y + h)}
+
+
+class BoxGridIndex:
+    """Uniform grid over the boxes drawn on the canvas, for hit tests under the mouse.
+
+    Every box is registered in the cells its rectangle overlaps, and separately
+    in the cells its four resize handles (handle_size around each corner)
+    overlap, so a lookup only tests the few boxes sharing the cell of the
+    point. Boxes are any objects, keyed by identity, with display coordinates
+    (x, y, w, h). Ties are broken deterministically: the nearest handle, then
+    the smallest box, then the topmost (most recently added) one.
+    """
+    def __init__(self, cell_size=64, handle_size=8):
+        self.cell_size = cell_size
+        self.handle_size = handle_size
+        self.clear()
+
+    def clear(self):
+        self._entries = {}  # id(item) -> (item, (x, y, w, h), order, box cells, handle cells)
+        self._box_cells = defaultdict(set)
+        self._handle_cells = defaultdict(set)
+        self._order = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set(self, item, rect):
+        """Add an item, or move it after its rectangle changed; only its own cells are touched."""
+        key = id(item)
+        old = self._entries.get(key)
+        if old is not None:
+            self._unlink(key, old)
+            order = old[2]
+        else:
+            self._order += 1
+            order = self._order
+        x, y, w, h = rect
+        box_cells = self._cells(x, y, x + w, y + h)
+        handle_cells = set()
+        r = self.handle_size
+        for cx, cy in box_corners(x, y, w, h).values():
+            handle_cells.update(self._cells(cx - r, cy - r, cx + r, cy + r))
+        for cell in box_cells:
+            self._box_cells[cell].add(key)
+        for cell in handle_cells:
+            self._handle_cells[cell].add(key)
+        self._entries[key] = (item, (x, y, w, h), order, box_cells, handle_cells)
+
+    def remove(self, item):
+        entry = self._entries.pop(id(item), None)
+        if entry is not None:
+            self._unlink(id(item), entry)
+
+    def handle_at(self, x, y):
+        """(item, corner name) of the resize handle under (x, y), None when there is none."""
+        best = None
+        for key in self._handle_cells.get(self._cell(x, y), ()):
+            item, (bx, by, bw, bh), order, _, _ = self._entries[key]
+            corners = box_corners(bx, by, bw, bh)
+            for corner in CORNERS:
+                cx, cy = corners[corner]
+                if abs(x - cx) <= self.handle_size and abs(y - cy) <= self.handle_size:
+                    rank = ((x - cx) ** 2 + (y - cy) ** 2, bw * bh, -order)
+                    if best is None or rank < best[0]:
+                        best = (rank, item, corner)
+                    break
+        return None if best is None else (best[1], best[2])
+
+    def box_at(self, x, y):
+        """The smallest (then topmost) item whose rectangle contains (x, y), None when there is none."""
+        best = None
+        for key in self._box_cells.get(self._cell(x, y), ()):
+            item, (bx, by, bw, bh), order, _, _ = self._entries[key]
+            if bx <= x <= bx + bw and by <= y <= by + bh:
+                rank = (bw * bh, -order)
+                if best is None or rank < best[0]:
+                    best = (rank, item)
+        return None if best is None else best[1]
+
+    def _cell(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def _cells(self, x0, y0, x1, y1):
+        i0, j0 = self._cell(x0, y0)
+        i1, j1 = self._cell(x1, y1)
+        return {(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)}
+
+    def _unlink(self, key, entry):
+        for cells, grid in ((entry[3], self._box_cells), (entry[4], self._handle_cells)):
+            for cell in cells:
+                keys = grid[cell]
+                keys.discard(key)
+                if not keys:
+                    del grid[cell]
@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+
+# Stages timed for every video; the write stages run on writer threads, so their seconds add up across threads
+STAGES = ('decode', 'infer', 'image_write', 'label_write')
+
+
+class StageStats:
+    """Time spent working, starved for input and blocked on output by one pipeline stage.
+
+    Made by VideoStats.stage(); the busy time of a stage that is also one of
+    STAGES counts towards that stage's seconds of the video.
+    """
+    def __init__(self, name, capacity=0, video_stats=None):
+        self.name = name
+        self.video_stats = video_stats
+        self.capacity = capacity  # Size of the queue feeding this stage (0 = no queue)
+        self.items = 0
+        self.busy = 0.0  # Seconds spent doing the stage's own work
+        self.starved = 0.0  # Seconds waiting for input from the previous stage
+        self.blocked = 0.0  # Seconds waiting because the next stage was full (backpressure)
+        self.occupancy_total = 0  # Sum of the input queue length, sampled on every get
+        self.occupancy_samples = 0
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, starved=0.0, blocked=0.0, items=0):
+        with self._lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            self.items += items
+        if busy and self.video_stats is not None and self.name in STAGES:
+            self.video_stats.add_time(self.name, busy)
+
+    def sample_occupancy(self, length):
+        with self._lock:
+            self.occupancy_total += length
+            self.occupancy_samples += 1
+
+    def as_dict(self):
+        total = self.busy + self.starved + self.blocked
+        return {
+            'stage': self.name,
+            'items': self.items,
+            'busy_s': round(self.busy, 4),
+            'starved_s': round(self.starved, 4),
+            'blocked_s': round(self.blocked, 4),
+            'utilisation': round(self.busy / total, 3) if total else 0.0,
+            'mean_queue': round(self.occupancy_total / self.occupancy_samples, 2) if self.occupancy_samples else 0.0,
+            'queue_capacity': self.capacity,
+        }
+
+
+class VideoStats:
+    """Per-stage timers and counters of one video, and the StageStats of its pipeline stages.
+
+    Every timed call costs two perf_counter() reads and a lock, so it can stay
+    on in production. Safe to update from the decoder and writer threads. One
+    VideoStats is passed through the whole processing of a video.
+    """
+    def __init__(self, video_name):
+        self.video_name = video_name
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.counters = {'frames_kept': 0, 'frames_skipped': 0, 'boxes': 0}
+        self.stages = {}  # Pipeline stages by name, see stage()
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def stage(self, name, capacity=0):
+        """StageStats of a pipeline stage, made on first use; capacity is the size of its input queue."""
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats(name, capacity, self)
+            return self.stages[name]
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def call(self, stage, fn, *args):
+        """Run fn(*args) and charge its duration to stage."""
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed_iter(self, iterable, stage):
+        """Yield from iterable, charging the time spent producing each item to stage."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def summary(self, **extra):
+        """Machine-readable summary of the video, extra keys are added as-is."""
+        wall = time.perf_counter() - self.started
+        with self._lock:
+            summary = {
+                'video': self.video_name,
+                'wall_s': round(wall, 3),
+                'stage_s': {stage: round(seconds, 3) for stage, seconds in self.seconds.items()},
+                **self.counters,
+                'frames_per_s': round(self.counters['frames_kept'] / wall, 2) if wall else 0.0,
+            }
+            stages = list(self.stages.values())
+        if stages:
+            summary['pipeline'] = [stage.as_dict() for stage in stages]
+        summary.update(extra)
+        return summary
+
+
+def format_summary(summary):
+    """One human-readable line for a video summary."""
+    stages = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in summary['stage_s'].items())
+    return (f"{summary['video']}: {summary['frames_kept']} frames kept, {summary['frames_skipped']} skipped, "
+            f"{summary['boxes']} boxes in {summary['wall_s']:.1f}s ({stages})")
+
+
+def append_summary(summary, summary_path):
+    """Append a summary as one JSON line."""
+    with open(summary_path, 'a') as f:
+        f.write(json.dumps(summary) + '\n')
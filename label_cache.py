@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from autosave import write_atomic
+from label_db import format_label_line
+
+# Inside a video's label folder, next to the NNNNNN.txt files it mirrors
+CACHE_NAME = ".label_cache.bin"
+CACHE_MAGIC = b"LABELCACHE1\n"
+# One array per column; frame is the position of the box's label file in the sorted list of names
+COLUMNS = (('frame', '<i4'), ('label', '<i4'), ('class_id', '<i4'),
+           ('x_center', '<f8'), ('y_center', '<f8'), ('width', '<f8'), ('height', '<f8'))
+
+
+def parse_label_text(text, name=""):
+    """(n, 6) float array of the 'label class_id xc yc w h' lines of a label file."""
+    values = text.split()
+    if len(values) % 6:
+        raise ValueError(f"{name}: label lines must have 6 values")
+    return np.array(values, dtype=float).reshape(-1, 6)
+
+
+def parse_label_lines(text, name=""):
+    """(n, 6) float array of the well-formed lines of a label file, and the list of its malformed lines."""
+    try:
+        return parse_label_text(text, name), []
+    except ValueError:
+        pass
+    rows, malformed = [], []
+    for line in text.splitlines():
+        values = line.split()
+        if not values:
+            continue
+        try:
+            if len(values) != 6:
+                raise ValueError(f"{name}: label lines must have 6 values")
+            rows.append([float(value) for value in values])
+        except ValueError:
+            malformed.append(line)
+    return np.array(rows, dtype=float).reshape(-1, 6), malformed
+
+
+def _padded(nbytes):
+    return (nbytes + 7) // 8 * 8
+
+
+class LabelCache:
+    """The boxes of every label file of one video, as memory-mapped columns in one file.
+
+    The file holds a JSON header (the label file names, with the mtime and size
+    each was read at), the COLUMNS arrays, and offsets: the boxes of the i-th
+    name are rows offsets[i]:offsets[i + 1], so a frame is found in O(1).
+    Opening the cache stats the label files and re-parses only those that
+    changed; update() keeps it in sync, in memory, after label files are
+    written, and save() rewrites the file as a whole, through a temporary file.
+    Saving once per session is enough: label files written after the last
+    save() are re-parsed on the next open, as their stats changed. A readonly
+    cache never writes its file. Malformed lines are left out and kept in
+    malformed; their files are re-parsed on every open until they are rewritten.
+    """
+    def __init__(self, label_folder, readonly=False):
+        self.label_folder = label_folder
+        self.path = os.path.join(label_folder, CACHE_NAME)
+        self.readonly = readonly
+        self._lock = threading.Lock()  # Serializes updates; readers use whichever state they picked up
+        # (names, {name: position}, stats, {column: array}, offsets), swapped as a whole
+        self._state = ([], {}, [], {name: np.zeros(0, dtype) for name, dtype in COLUMNS}, np.zeros(1, np.int64))
+        self.parsed = 0  # Label files parsed by the last refresh() or update()
+        self.malformed = {}  # name -> lines of its label file that could not be parsed
+        self._unsaved = False  # update() changed the state since the file was written
+        self.refresh()
+
+    def refresh(self):
+        """Bring the cache in line with the label files, parsing only new and changed ones."""
+        with self._lock:
+            if not os.path.isdir(self.label_folder):
+                return
+            stats = {}
+            for entry in os.scandir(self.label_folder):
+                if entry.name.endswith('.txt') and entry.is_file():
+                    stat = entry.stat()
+                    stats[entry.name[:-len('.txt')]] = [stat.st_mtime_ns, stat.st_size]
+            state = self._load() or self._state
+            names = state[0]
+            known = dict(zip(names, state[2]))
+            changed = [name for name, stat in stats.items() if known.get(name) != stat]
+            removed = [name for name in names if name not in stats]
+            self.parsed = len(changed)
+            self.malformed = {}
+            if not changed and not removed:
+                self._state = state
+                return
+            tables = {}
+            for name in changed:
+                with open(os.path.join(self.label_folder, f"{name}.txt"), 'r') as f:
+                    tables[name], malformed = parse_label_lines(f.read(), f"{name}.txt")
+                if malformed:
+                    self.malformed[name] = malformed
+                    # A stat no file has, so the file is parsed (and its lines reported) again on the next open
+                    stats[name] = [0, 0]
+            self._state = self._merged(state, tables, removed, stats)
+            # Let go of the mapped columns of the old state before _save() replaces their file
+            state = None
+            if not self.readonly:
+                self._save()
+
+    def update(self, frames):
+        """Replace the boxes of frames ({name: label lines}) after their label files were written; see save()."""
+        with self._lock:
+            stats = {}
+            for name in frames:
+                stat = os.stat(os.path.join(self.label_folder, f"{name}.txt"))
+                stats[name] = [stat.st_mtime_ns, stat.st_size]
+            tables = {name: parse_label_text("\n".join(lines), name) for name, lines in frames.items()}
+            self.parsed = len(tables)
+            for name in frames:
+                self.malformed.pop(name, None)
+            self._state = self._merged(self._state, tables, (), stats)
+            self._unsaved = True
+
+    def save(self):
+        """Write the updates made since the last save() to the cache file."""
+        with self._lock:
+            if self._unsaved and not self.readonly:
+                self._save()
+            self._unsaved = False
+
+    def names(self):
+        """Sorted names of the label files (frame names without extension)."""
+        return list(self._state[0])
+
+    def columns(self):
+        """{column: array} of every box of the video, ordered by frame."""
+        return dict(self._state[3])
+
+    def frame_rows(self, name):
+        """{column: array} of the boxes of one label file, None when there is no such file."""
+        _, index, _, columns, offsets = self._state
+        i = index.get(name)
+        if i is None:
+            return None
+        start, end = offsets[i], offsets[i + 1]
+        return {column: array[start:end] for column, array in columns.items()}
+
+    def frame_lines(self, name):
+        """Lines of one label file, as LabelTool writes them, None when there is no such file."""
+        rows = self.frame_rows(name)
+        if rows is None:
+            return None
+        return [format_label_line(*values) for values in zip(
+            *(rows[column].tolist() for column in ('label', 'class_id', 'x_center', 'y_center', 'width', 'height')))]
+
+    def _merged(self, state, tables, removed, stats):
+        """New state: state with the boxes of tables ({name: (n, 6) array}) replaced and removed names dropped."""
+        old_names, _, old_stats, old_columns, _ = state
+        stats = {**dict(zip(old_names, old_stats)), **stats}
+        gone = set(removed)
+        names = sorted((set(old_names) | set(tables)) - gone)
+        index = {name: i for i, name in enumerate(names)}
+        # Old frame positions in the new name list, -1 for names whose boxes are dropped or replaced
+        moved = np.array([-1 if name in gone or name in tables else index[name] for name in old_names],
+                         dtype=np.int64)
+        new_frame = moved[old_columns['frame']]
+        keep = new_frame >= 0
+        parts = [np.column_stack([new_frame[keep]] + [old_columns[column][keep] for column, _ in COLUMNS[1:]])]
+        for name, table in tables.items():
+            parts.append(np.column_stack([np.full(len(table), index[name]), table]))
+        table = np.concatenate(parts)
+        table = table[np.argsort(table[:, 0], kind='stable')]
+        columns = {column: table[:, i].astype(dtype) for i, (column, dtype) in enumerate(COLUMNS)}
+        offsets = np.searchsorted(columns['frame'], np.arange(len(names) + 1)).astype(np.int64)
+        return names, index, [stats[name] for name in names], columns, offsets
+
+    def _save(self):
+        self._unsaved = False
+        names, index, stats, columns, offsets = self._state
+        if isinstance(offsets, np.memmap) or any(isinstance(array, np.memmap) for array in columns.values()):
+            # Windows cannot replace a file that is still mapped, so the state moves to memory first
+            columns = {column: np.array(array) for column, array in columns.items()}
+            offsets = np.array(offsets)
+            self._state = (names, index, stats, columns, offsets)
+        header = json.dumps({'names': names, 'stats': stats, 'count': len(columns['frame'])}).encode()
+        data = [CACHE_MAGIC, len(header).to_bytes(8, 'little'), header,
+                b'\0' * (_padded(len(CACHE_MAGIC) + 8 + len(header)) - len(CACHE_MAGIC) - 8 - len(header))]
+        for array in list(columns.values()) + [offsets]:
+            raw = array.tobytes()
+            data += [raw, b'\0' * (_padded(len(raw)) - len(raw))]
+        write_atomic(self.path, b''.join(data))
+
+    def _load(self):
+        """State read from the cache file, with the columns memory-mapped; None when it is missing or unreadable."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                    return None
+                header_size = int.from_bytes(f.read(8), 'little')
+                header = json.loads(f.read(header_size))
+            offset = _padded(len(CACHE_MAGIC) + 8 + header_size)
+            count = header['count']
+            columns = {}
+            for column, dtype in COLUMNS + (('offsets', '<i8'),):
+                length = len(header['names']) + 1 if column == 'offsets' else count
+                if length:
+                    columns[column] = np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=(length,))
+                else:
+                    columns[column] = np.zeros(0, dtype)
+                offset += _padded(length * np.dtype(dtype).itemsize)
+        except (OSError, ValueError, KeyError):
+            return None
+        names = header['names']
+        offsets = columns.pop('offsets')
+        return names, {name: i for i, name in enumerate(names)}, header['stats'], columns, offsets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the binary label caches of a dataset's videos")
+    parser.add_argument('--label-base', default="labels_with_ids")
+    args = parser.parse_args()
+    for video in sorted(os.listdir(args.label_base)):
+        label_folder = os.path.join(args.label_base, video)
+        if os.path.isdir(label_folder):
+            cache = LabelCache(label_folder)
+            print(f"{video}: {len(cache.names())} label files, {len(cache.columns()['frame'])} boxes, "
+                  f"{cache.parsed} parsed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from elements_store import ELEMENT_FIELDS
+
+# Optional store of a whole dataset, next to its images/, labels_with_ids/ and elements/ folders
+DB_NAME = "labels.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    video TEXT NOT NULL,
+    frame_name TEXT NOT NULL,
+    PRIMARY KEY (video, frame_name)
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    video TEXT NOT NULL,
+    frame_name TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    label INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    x_center REAL NOT NULL,
+    y_center REAL NOT NULL,
+    width REAL NOT NULL,
+    height REAL NOT NULL,
+    PRIMARY KEY (video, frame_name, line)
+);
+CREATE INDEX IF NOT EXISTS boxes_by_class ON boxes (video, class_id, frame_name);
+CREATE TABLE IF NOT EXISTS elements (
+    video TEXT NOT NULL,
+    frame_id INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    color TEXT NOT NULL DEFAULT '',
+    gender TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (video, frame_id, class_id)
+);
+CREATE INDEX IF NOT EXISTS elements_by_class ON elements (video, class_id, frame_id);
+"""
+
+
+def parse_label_line(line):
+    """(label, class_id, x_center, y_center, width, height) of one 'label class_id xc yc w h' line."""
+    parts = line.split()
+    return (int(parts[0]), int(parts[1])) + tuple(float(value) for value in parts[2:6])
+
+
+def format_label_line(label, class_id, x_center, y_center, width, height):
+    return f"{label} {class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}"
+
+
+def find_label_db(dataset_folder):
+    """Path of the dataset's SQLite store, None when the dataset only uses the txt/CSV files."""
+    db_path = os.path.join(dataset_folder, DB_NAME)
+    return db_path if os.path.exists(db_path) else None
+
+
+class LabelDB:
+    """Boxes and elements of every video of a dataset in one SQLite file.
+
+    The database runs in WAL mode, so readers (a prefetch thread, prompt
+    generation, another annotator) never block the writer. Every save is a
+    single transaction, so a crash leaves each frame either saved or untouched.
+    One connection is shared by the threads of a process, behind a lock.
+    A readonly connection (for checks) neither creates tables nor writes.
+    """
+    def __init__(self, db_path, readonly=False):
+        self.db_path = db_path
+        if readonly:
+            self._conn = sqlite3.connect(f"{Path(db_path).absolute().as_uri()}?mode=ro", uri=True, timeout=30,
+                                         check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def videos(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT video FROM frames UNION SELECT video FROM elements ORDER BY video")
+            return [video for video, in rows]
+
+    def frame_names(self, video):
+        """Names of the frames of a video that have labels (empty or not)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT frame_name FROM frames WHERE video = ? ORDER BY frame_name", (video,))
+            return [frame_name for frame_name, in rows]
+
+    def frame_lines(self, video, frame_name):
+        """Label lines of one frame in the txt format, None when the frame has no labels."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM frames WHERE video = ? AND frame_name = ?",
+                                  (video, frame_name)).fetchone() is None:
+                return None
+            rows = self._conn.execute("SELECT label, class_id, x_center, y_center, width, height FROM boxes "
+                                      "WHERE video = ? AND frame_name = ? ORDER BY line", (video, frame_name))
+            return [format_label_line(*row) for row in rows]
+
+    def element_rows(self, video, sort=False):
+        """Rows of a video's elements as csv.DictReader would return them, in insertion or frame order."""
+        order = "frame_id, rowid" if sort else "rowid"
+        with self._lock:
+            rows = self._conn.execute(f"SELECT frame_id, class_id, type, color, gender FROM elements "
+                                      f"WHERE video = ? ORDER BY {order}", (video,)).fetchall()
+        return [dict(zip(ELEMENT_FIELDS, (str(frame_id), str(class_id), type, color, gender)))
+                for frame_id, class_id, type, color, gender in rows]
+
+    def save_frame(self, video, frame_name, lines, element_upserts=(), element_deletes=()):
+        """Replace the boxes of one frame and apply element changes, in one transaction."""
+        with self._lock, self._conn:
+            self._replace_frame(video, frame_name, lines)
+            self._write_elements(video, element_upserts, element_deletes)
+
+    def save_frames(self, video, frames, element_upserts=(), element_deletes=()):
+        """Replace the boxes of several frames (frame names to label lines) and apply element changes, in one transaction."""
+        with self._lock, self._conn:
+            for frame_name, lines in frames.items():
+                self._replace_frame(video, frame_name, lines)
+            self._write_elements(video, element_upserts, element_deletes)
+
+    def save_elements(self, video, upserts=(), deletes=()):
+        """Apply element changes in one transaction; upserts are (frame_id, class_id, attributes) tuples."""
+        with self._lock, self._conn:
+            self._write_elements(video, upserts, deletes)
+
+    def replace_video(self, video, frames, element_upserts):
+        """Replace everything stored for a video in one transaction; frames maps frame names to label lines."""
+        with self._lock, self._conn:
+            for table in ('frames', 'boxes', 'elements'):
+                self._conn.execute(f"DELETE FROM {table} WHERE video = ?", (video,))
+            for frame_name, lines in frames.items():
+                self._replace_frame(video, frame_name, lines)
+            self._write_elements(video, element_upserts, ())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _replace_frame(self, video, frame_name, lines):
+        self._conn.execute("INSERT OR IGNORE INTO frames (video, frame_name) VALUES (?, ?)", (video, frame_name))
+        self._conn.execute("DELETE FROM boxes WHERE video = ? AND frame_name = ?", (video, frame_name))
+        self._conn.executemany("INSERT INTO boxes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               [(video, frame_name, i) + parse_label_line(line)
+                                for i, line in enumerate(line for line in lines if line.strip())])
+
+    def _write_elements(self, video, upserts, deletes):
+        # ON CONFLICT keeps the row (and its rowid), so updated rows stay in place, as in the CSV
+        self._conn.executemany(
+            "INSERT INTO elements (video, frame_id, class_id, type, color, gender) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (video, frame_id, class_id) DO UPDATE SET "
+            "type = excluded.type, color = excluded.color, gender = excluded.gender",
+            [(video, frame_id, class_id, attributes.get('type') or '', attributes.get('color') or '',
+              attributes.get('gender') or '') for frame_id, class_id, attributes in upserts])
+        self._conn.executemany("DELETE FROM elements WHERE video = ? AND frame_id = ? AND class_id = ?",
+                               [(video, frame_id, class_id) for frame_id, class_id in deletes])
+
+
+def import_dataset(db_path, labels_base, elements_folder):
+    """Load every labels_with_ids/NNNN/*.txt and elements/elements_NNNN.csv into the store, one video per transaction.
+
+    Videos already in the store are replaced.
+    """
+    db = LabelDB(db_path)
+    videos = set(os.listdir(labels_base)) if os.path.isdir(labels_base) else set()
+    videos = {video for video in videos if os.path.isdir(os.path.join(labels_base, video))}
+    element_files = {}
+    if os.path.isdir(elements_folder):
+        for file in os.listdir(elements_folder):
+            if file.startswith('elements_') and file.endswith('.csv'):
+                element_files[file[len('elements_'):-len('.csv')]] = os.path.join(elements_folder, file)
+    try:
+        for video in sorted(videos | set(element_files)):
+            frames = {}
+            if video in videos:
+                label_folder = os.path.join(labels_base, video)
+                for file in sorted(os.listdir(label_folder)):
+                    if file.endswith('.txt'):
+                        with open(os.path.join(label_folder, file), 'r') as f:
+                            frames[os.path.splitext(file)[0]] = f.readlines()
+            element_upserts = []
+            if video in element_files:
+                with open(element_files[video], mode='r', newline='') as file:
+                    element_upserts = [(int(row['frame_id']), int(row['class_id']), row)
+                                       for row in csv.DictReader(file)]
+            db.replace_video(video, frames, element_upserts)
+    finally:
+        db.close()
+    return sorted(videos | set(element_files))
+
+
+def export_dataset(db_path, labels_base, elements_folder):
+    """Write the store back out as labels_with_ids/NNNN/*.txt and elements/elements_NNNN.csv."""
+    db = LabelDB(db_path, readonly=True)
+    try:
+        videos = db.videos()
+        for video in videos:
+            label_folder = os.path.join(labels_base, video)
+            os.makedirs(label_folder, exist_ok=True)
+            for frame_name in db.frame_names(video):
+                with open(os.path.join(label_folder, f"{frame_name}.txt"), 'w') as f:
+                    f.writelines(line + '\n' for line in db.frame_lines(video, frame_name))
+            rows = db.element_rows(video)
+            if rows:
+                os.makedirs(elements_folder, exist_ok=True)
+                with open(os.path.join(elements_folder, f"elements_{video}.csv"), mode='w', newline='') as file:
+                    writer = csv.DictWriter(file, fieldnames=ELEMENT_FIELDS)
+                    writer.writeheader()
+                    writer.writerows(rows)
+    finally:
+        db.close()
+    return videos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a dataset's labels and elements into or out of SQLite")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('--db', default=DB_NAME)
+    parser.add_argument('--label-base', default="labels_with_ids")
+    parser.add_argument('--elements-folder', default="elements")
+    args = parser.parse_args()
+    if args.command == 'import':
+        videos = import_dataset(args.db, args.label_base, args.elements_folder)
+    else:
+        videos = export_dataset(args.db, args.label_base, args.elements_folder)
+    print(f"{args.command.capitalize()}ed {len(videos)} videos ({args.db})")
+
+
+if __name__ == '__main__':
+    main()
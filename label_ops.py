@@ -0,0 +1,366 @@
+import argparse
+import os
+
+import numpy as np
+
+from autosave import write_atomic
+from edit_journal import JOURNAL_NAME, EditJournal
+from elements_store import ATTRIBUTES, ElementsStore
+from label_cache import LabelCache, parse_label_lines
+from label_db import LabelDB, find_label_db, format_label_line
+from shard_io import ShardReader, find_shard
+
+# Frame image formats pre_label_tool can write (png, jpg, webp and raw bmp)
+FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+
+def list_frames(frame_folder, shard=None):
+    """Sorted frame names of an images folder; their positions are the frame_ids of the elements CSV."""
+    if shard is not None:
+        return shard.frame_names(FRAME_EXTENSIONS)
+    return sorted(f for f in os.listdir(frame_folder) if f.lower().endswith(FRAME_EXTENSIONS))
+
+
+def format_ranges(frame_ids):
+    """'3-7, 12, 20-22' for sorted frame_ids."""
+    ranges = []
+    for frame_id in frame_ids:
+        if ranges and frame_id == ranges[-1][1] + 1:
+            ranges[-1][1] = frame_id
+        else:
+            ranges.append([frame_id, frame_id])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def duplicate_id_frames(frame, class_id):
+    """Sorted frame_ids in which a non-zero class ID has more than one box."""
+    assigned = class_id != 0
+    pairs = np.stack([frame[assigned], class_id[assigned]], axis=1)
+    if not len(pairs):
+        return np.zeros(0, dtype=np.int64)
+    unique, counts = np.unique(pairs, axis=0, return_counts=True)
+    return np.unique(unique[counts > 1, 0])
+
+
+class VideoLabels:
+    """Every box of one video as flat NumPy columns, in frame order.
+
+    frame holds the frame_id of each box, so an edit over a frame range is one
+    mask over all boxes instead of a loop over label files. Labels are read as
+    LabelTool reads them (label database, else txt file, else shard); txt files
+    come from the video's LabelCache, which save() keeps in sync. save() only
+    writes the frames whose boxes changed; their lines from before the first
+    change are kept until then, for the edit journal (see range_edit()). Label
+    lines that cannot be parsed are left out of the columns and kept in
+    malformed; a frame written by save() loses them.
+    """
+    def __init__(self, frame_names, label_folder, db=None, video=None, shard=None, cache=None):
+        self.frame_names = frame_names
+        self.label_folder = label_folder
+        self.db = db
+        self.video = video
+        self.cache = None
+        self._dirty = {}  # frame_id -> label lines before its first change since loading or the last save()
+        self.malformed = {}  # frame_id -> lines of its label file that could not be parsed
+        frames, tables = [], []
+        if db is None:
+            self.cache = cache if cache is not None else LabelCache(label_folder)
+            # Every label file at once: map the cache's names to frame_ids, dropping files without a frame
+            position = {os.path.splitext(frame_name)[0]: frame_id for frame_id, frame_name in enumerate(frame_names)}
+            names = self.cache.names()
+            columns = self.cache.columns()
+            frame = np.array([position.get(name, -1) for name in names], dtype=np.int64)[columns['frame']]
+            keep = frame >= 0
+            frames.append(frame[keep])
+            tables.append(np.column_stack([columns[column][keep] for column in
+                                           ('label', 'class_id', 'x_center', 'y_center', 'width', 'height')]))
+            self.malformed = {position[name]: list(lines) for name, lines in self.cache.malformed.items()
+                              if name in position}
+            names = set(names)
+            missing = [(frame_id, frame_name) for frame_id, frame_name in enumerate(frame_names)
+                       if os.path.splitext(frame_name)[0] not in names]
+        else:
+            missing = list(enumerate(frame_names))
+        for frame_id, frame_name in missing:
+            text = self._read(frame_name, shard)
+            if text:
+                table, malformed = parse_label_lines(text, frame_name)
+                if malformed:
+                    self.malformed[frame_id] = malformed
+                frames.append(np.full(len(table), frame_id, dtype=np.int64))
+                tables.append(table)
+        table = np.concatenate(tables) if tables else np.zeros((0, 6))
+        frame = np.concatenate(frames) if frames else np.zeros(0, dtype=np.int64)
+        order = np.argsort(frame, kind='stable')
+        self.frame = frame[order]
+        self.label = table[order, 0].astype(np.int64)
+        self.class_id = table[order, 1].astype(np.int64)
+        self.boxes = table[order, 2:]  # x_center, y_center, width, height
+
+    def _read(self, frame_name, shard):
+        stem = os.path.splitext(frame_name)[0]
+        if self.db is not None:
+            lines = self.db.frame_lines(self.video, stem)
+            if lines is not None:
+                return "\n".join(lines)
+            txt_path = os.path.join(self.label_folder, f"{stem}.txt")
+            if os.path.exists(txt_path):
+                with open(txt_path, 'r') as f:
+                    return f.read()
+        return shard.label_text(frame_name) if shard is not None else ""
+
+    def frame_range(self, start=0, end=None):
+        """Mask of the boxes in frames start..end (inclusive, end defaults to the last frame)."""
+        mask = self.frame >= start
+        if end is not None:
+            mask &= self.frame <= end
+        return mask
+
+    def frames_with(self, class_id, start=0, end=None):
+        """Sorted frame_ids in start..end that have a box of class_id."""
+        return np.unique(self.frame[self.frame_range(start, end) & (self.class_id == class_id)])
+
+    def ids(self):
+        """Assigned (non-zero) class IDs, in order of first appearance."""
+        unique, first = np.unique(self.class_id, return_index=True)
+        order = unique[np.argsort(first)]
+        return order[order != 0]
+
+    def remap(self, mapping, start=0, end=None):
+        """Replace class IDs ({old: new}) in frames start..end; returns the sorted changed frame_ids.
+
+        Raises ValueError, leaving the labels untouched, when an ID would get
+        two boxes in a frame that did not already have that problem.
+        """
+        olds = np.array(sorted(mapping), dtype=np.int64)
+        news = np.array([mapping[old] for old in olds], dtype=np.int64)
+        mask = self.frame_range(start, end) & np.isin(self.class_id, olds)
+        changed = np.unique(self.frame[mask])
+        if not len(changed):
+            return changed
+        class_id = self.class_id.copy()
+        class_id[mask] = news[np.searchsorted(olds, class_id[mask])]
+        clashes = np.setdiff1d(np.intersect1d(duplicate_id_frames(self.frame, class_id), changed),
+                               duplicate_id_frames(self.frame, self.class_id))
+        if len(clashes):
+            raise ValueError(f"An ID would appear twice in frames {format_ranges(clashes.tolist())}")
+        self._mark_dirty(changed.tolist())
+        self.class_id = class_id
+        return changed
+
+    def set_class_ids(self, rows, class_ids):
+        """Give the boxes at rows (indices into the columns) new class IDs."""
+        self._mark_dirty(np.unique(self.frame[rows]).tolist())
+        self.class_id[rows] = class_ids
+
+    def remove_rows(self, rows):
+        """Drop the boxes at rows (indices into the columns)."""
+        self._mark_dirty(np.unique(self.frame[rows]).tolist())
+        keep = np.ones(len(self.frame), dtype=bool)
+        keep[rows] = False
+        self.frame, self.label, self.class_id, self.boxes = (self.frame[keep], self.label[keep],
+                                                             self.class_id[keep], self.boxes[keep])
+
+    def drop_malformed(self):
+        """Have save() rewrite the frames with malformed lines without them; returns the number of lines dropped."""
+        dropped = sum(len(lines) for lines in self.malformed.values())
+        self._mark_dirty(list(self.malformed))
+        self.malformed = {}
+        return dropped
+
+    def _mark_dirty(self, frame_ids):
+        """Remember the lines of frames about to change, unless they already changed since the last save()."""
+        for frame_id in frame_ids:
+            if frame_id not in self._dirty:
+                # Malformed lines are in the file too, so an undo brings them back
+                self._dirty[frame_id] = self.frame_lines(frame_id) + self.malformed.get(frame_id, [])
+
+    def frame_lines(self, frame_id):
+        """Label lines of one frame, as its label file holds them."""
+        start, end = np.searchsorted(self.frame, [frame_id, frame_id + 1])
+        rows = zip(self.label[start:end].tolist(), self.class_id[start:end].tolist(), self.boxes[start:end].tolist())
+        return [format_label_line(label, class_id, *box) for label, class_id, box in rows]
+
+    def changes(self):
+        """{frame_id: (lines before, lines now)} of the frames changed since loading or the last save()."""
+        return {frame_id: (before, self.frame_lines(frame_id)) for frame_id, before in sorted(self._dirty.items())}
+
+    def save(self, elements=None):
+        """Write the changed frames, one file each, and flush elements; returns the names of the written frames.
+
+        With a label database the frames and the element changes go in a single transaction.
+        """
+        frames = {self.frame_names[frame_id]: self.frame_lines(frame_id) for frame_id in sorted(self._dirty)}
+        if self.db is not None:
+            changes = elements.take_changes() if elements is not None else ((), ())
+            self.db.save_frames(self.video, {os.path.splitext(name)[0]: lines for name, lines in frames.items()},
+                                *changes)
+        else:
+            os.makedirs(self.label_folder, exist_ok=True)
+            for frame_name, lines in frames.items():
+                write_atomic(os.path.join(self.label_folder, f"{os.path.splitext(frame_name)[0]}.txt"),
+                             ''.join(line + '\n' for line in lines))
+            self.cache.update({os.path.splitext(name)[0]: lines for name, lines in frames.items()})
+            self.cache.save()
+            if elements is not None:
+                elements.flush()
+        self._dirty = {}
+        return list(frames)
+
+
+def range_edit(labels, rows_before, elements):
+    """Journal entry of a range operation, from the labels before save() and the elements rows it started from.
+
+    frames holds the label lines of every changed frame before and after the
+    operation; elements holds [frame_id, class_id, before, after] of every
+    elements row it changed, with None where there was or is no row.
+    """
+    frames = [{'frame': labels.frame_names[frame_id], 'frame_id': frame_id, 'before': before, 'after': after}
+              for frame_id, (before, after) in labels.changes().items()]
+    rows = elements.rows
+    keys = sorted(key for key in rows_before.keys() | rows.keys() if rows_before.get(key) != rows.get(key))
+    return {'frames': frames, 'elements': [[frame_id, class_id, rows_before.get((frame_id, class_id)),
+                                            rows.get((frame_id, class_id))] for frame_id, class_id in keys]}
+
+
+def set_attributes(labels, elements, class_id, start, end, attributes):
+    """Set attributes of class_id in every frame of start..end it has a box in; returns those frame_ids.
+
+    Attributes left empty keep the values LabelTool shows for the frame.
+    """
+    attributes = {name: value for name, value in attributes.items() if name in ATTRIBUTES and value}
+    frame_ids = labels.frames_with(class_id, start, end).tolist()
+    for frame_id in frame_ids:
+        current = elements.nearest(class_id, frame_id) or {}
+        elements.set(frame_id, class_id, {**current, **attributes})
+    return frame_ids
+
+
+def remap_ids(labels, elements, mapping, start=0, end=None):
+    """Replace class IDs ({old: new}) in frames start..end, in the labels and the elements together.
+
+    Where the new ID already has an elements row in a frame, that row is kept.
+    """
+    frame_ids = labels.remap(mapping, start, end)
+    moved = []
+    # Take every row out first, so swapped IDs do not overwrite each other
+    for old, new in mapping.items():
+        for frame_id in elements.frames_in(old, start, end):
+            moved.append((frame_id, new, elements.get(frame_id, old)))
+            elements.remove(frame_id, old)
+    for frame_id, new, attributes in moved:
+        if elements.get(frame_id, new) is None:
+            elements.set(frame_id, new, attributes)
+    return frame_ids.tolist()
+
+
+def merge_ids(labels, elements, keep_id, merge_id, start=0, end=None):
+    """Relabel merge_id as keep_id in frames start..end."""
+    return remap_ids(labels, elements, {merge_id: keep_id}, start, end)
+
+
+def next_free_id(labels, elements):
+    ids = labels.class_id.tolist() + [class_id for _, class_id in elements.rows]
+    return max(ids, default=0) + 1
+
+
+def split_id(labels, elements, class_id, frame_id, new_id=None, end=None):
+    """Give class_id a new ID from frame_id on (to end); returns (new_id, changed frame_ids)."""
+    if new_id is None:
+        new_id = next_free_id(labels, elements)
+    return new_id, remap_ids(labels, elements, {class_id: new_id}, frame_id, end)
+
+
+def renumber_ids(labels, elements, first=1):
+    """Number the IDs of the video first, first + 1, ... in order of first appearance; returns the mapping.
+
+    IDs that only appear in the elements are numbered after the others.
+    """
+    ids = labels.ids().tolist()
+    seen = set(ids)
+    ids += sorted({class_id for _, class_id in elements.rows if class_id != 0 and class_id not in seen})
+    mapping = {old: new for new, old in enumerate(ids, first) if old != new}
+    if mapping:
+        remap_ids(labels, elements, mapping)
+    return mapping
+
+
+def open_video(frame_folder, readonly=False):
+    """(VideoLabels, ElementsStore) of the video in frame_folder, with its labels and elements found as LabelTool does.
+
+    Opening a video readonly writes nothing, not even its label cache; it cannot be saved.
+    """
+    frame_folder = os.path.abspath(frame_folder)
+    video = os.path.basename(frame_folder)
+    dataset_folder = os.path.abspath(os.path.join(frame_folder, os.pardir, os.pardir))
+    label_folder = os.path.join(dataset_folder, "labels_with_ids", video)
+    db_path = find_label_db(dataset_folder)
+    db = LabelDB(db_path, readonly) if db_path else None
+    cache = LabelCache(label_folder, readonly) if db is None else None
+    shard_path = find_shard(frame_folder)
+    shard = ShardReader(shard_path) if shard_path else None
+    try:
+        labels = VideoLabels(list_frames(frame_folder, shard), label_folder, db, video, shard, cache)
+    finally:
+        if shard is not None:
+            shard.close()
+    elements = ElementsStore(os.path.join(dataset_folder, "elements", f"elements_{video}.csv"), db, video)
+    return labels, elements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edit the IDs and attributes of a labeled video over frame ranges")
+    parser.add_argument('images', help="Images folder of the video (images/NNNN)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    attrs_parser = subparsers.add_parser('set-attrs', help="set attributes of an ID in every frame of a range")
+    attrs_parser.add_argument('--id', type=int, required=True)
+    for name in ATTRIBUTES:
+        attrs_parser.add_argument(f'--{name}', default='')
+
+    merge_parser = subparsers.add_parser('merge', help="relabel the boxes of one ID as another")
+    merge_parser.add_argument('--keep', type=int, required=True)
+    merge_parser.add_argument('--merge', type=int, required=True)
+
+    split_parser = subparsers.add_parser('split', help="give an ID a new one from a frame on")
+    split_parser.add_argument('--id', type=int, required=True)
+    split_parser.add_argument('--new-id', type=int, help="Defaults to the next unused ID")
+
+    subparsers.add_parser('renumber', help="number the IDs 1, 2, ... in order of first appearance")
+    for subparser in (attrs_parser, merge_parser, split_parser):
+        subparser.add_argument('--start', type=int, default=0, help="First frame_id of the range")
+        subparser.add_argument('--end', type=int, help="Last frame_id of the range (default: last frame)")
+    args = parser.parse_args()
+
+    labels, elements = open_video(args.images)
+    rows_before = dict(elements.rows)  # Rows are replaced, never changed in place, so a shallow copy keeps them
+    try:
+        if args.command == 'set-attrs':
+            frame_ids = set_attributes(labels, elements, args.id, args.start, args.end,
+                                       {name: getattr(args, name) for name in ATTRIBUTES})
+            summary = f"Set attributes of ID {args.id} in {len(frame_ids)} frames"
+        elif args.command == 'merge':
+            frame_ids = merge_ids(labels, elements, args.keep, args.merge, args.start, args.end)
+            summary = f"Merged ID {args.merge} into {args.keep} in {len(frame_ids)} frames"
+        elif args.command == 'split':
+            new_id, frame_ids = split_id(labels, elements, args.id, args.start, args.new_id, args.end)
+            summary = f"Split ID {args.id} into {new_id} in {len(frame_ids)} frames"
+        else:
+            mapping = renumber_ids(labels, elements)
+            summary = f"Renumbered {len(mapping)} IDs"
+    except ValueError as e:
+        parser.exit(1, f"Error: {e}\n")
+    # Journaled like LabelTool's own range operations, so they can be undone there
+    edit = range_edit(labels, rows_before, elements)
+    if edit['frames'] or edit['elements']:
+        journal = EditJournal(os.path.join(args.images, JOURNAL_NAME))
+        journal.record(args.command, **edit)
+        journal.close()
+    written = labels.save(elements)
+    if labels.db is not None:
+        labels.db.close()
+    print(f"{summary}, wrote {len(written)} label files")
+
+
+if __name__ == '__main__':
+    main()
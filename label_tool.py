@@ -1,9 +1,27 @@
 import tkinter as tk
 from tkinter import messagebox, simpledialog, Toplevel, Entry, Button, filedialog, Menu
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import os
+import io
 from pathlib import Path
 import csv
+import time
+from autosave import Autosaver, write_atomic
+from edit_journal import JOURNAL_NAME, TRASH_NAME, EditJournal
+from elements_store import ATTRIBUTES, ElementsStore
+from frame_cache import FrameCache
+from frame_pyramid import FramePyramid, pyramid_factor
+from hit_index import BoxGridIndex
+from label_cache import LabelCache
+from label_db import LabelDB, find_label_db
+from label_ops import (VideoLabels, list_frames, merge_ids, next_free_id, range_edit, renumber_ids, set_attributes,
+                       split_id)
+from shard_io import ShardReader, find_shard
+
+PREFETCH_FRAMES = 4  # Frames decoded ahead on each side of the current one
+FRAME_CACHE_BYTES = 256 << 20  # Memory budget of the decoded frame cache
+DEFAULT_SCALE = 0.75  # Display scale a frame opens at; the canvas keeps this size when zooming
+ZOOM_LEVELS = (0.125, 0.25, 0.375, 0.5, 0.75, 1.0, 1.5, 2.0)
 
 class LabelTool:
     def __init__(self, root):
@@ -12,11 +30,21 @@ class LabelTool:
         self.output_folder = ""
         self.elements_folder = ""  # Folder path for elements
         self.elements_file = ""  # Full path to elements CSV file
+        self.elements = None  # ElementsStore holding the rows of elements_file
+        self.label_db = None  # LabelDB when the dataset has a labels.sqlite, which then replaces the txt/CSV files
+        self.video = ""  # Subfolder name of the open video, its key in label_db
+        self.label_cache = None  # LabelCache of the labels folder, when the labels are txt files
+        self.journal = None  # EditJournal of the open video, for undo/redo and crash recovery
+        self.autosave = None  # Autosaver writing the saved frames and elements off the UI thread
+        self.press_state = None  # Frame state when a resize started, journaled on release
         self.frames = []
+        self.shard = None  # ShardReader when the images folder holds a shard.tar instead of loose images
+        self.frame_cache = None  # Decoded, scaled frames and their boxes, prefetched around the current frame
+        self.pyramid = None  # FramePyramid of the video, decoding frames at the displayed resolution
         self.current_frame_index = 0
         self.bboxes = []
         self.current_bbox = None
-        self.scale_factor = 0.75  # Scale factor for image resizing
+        self.scale_factor = DEFAULT_SCALE  # Scale factor for image resizing, one of ZOOM_LEVELS
 
         # Variables to handle drawing new bounding boxes
         self.drawing = False
@@ -31,6 +59,11 @@ class LabelTool:
         self.resize_corner = None
         self.resize_margin = 10  # Margin to detect corners for resizing
         self.handle_size = 8  # Size of the resize handle
+        # Boxes and resize handles of the current frame by canvas position, for hover and click hit tests
+        self.hit_index = BoxGridIndex(handle_size=self.handle_size)
+
+        # Redraw timings per kind ('frame', 'drag', 'edit'): (count, total seconds, longest seconds)
+        self.redraw_stats = {}
 
         # Setup GUI
         self.canvas = tk.Canvas(root, bg='white')  # Set canvas background to white
@@ -41,6 +74,15 @@ class LabelTool:
         self.canvas.bind("<Motion>", self.on_mouse_move)  # Track mouse movement for cursor change
         self.root.bind("<KeyPress-h>", self.enable_drawing)
         self.root.bind("<KeyRelease-h>", self.disable_drawing)
+        # Zoom with +/- or Ctrl+wheel, pan by dragging with the middle button
+        self.root.bind("<plus>", lambda event: self.zoom(1))
+        self.root.bind("<equal>", lambda event: self.zoom(1))
+        self.root.bind("<minus>", lambda event: self.zoom(-1))
+        self.canvas.bind("<Control-MouseWheel>", lambda event: self.zoom(1 if event.delta > 0 else -1))
+        self.canvas.bind("<Control-Button-4>", lambda event: self.zoom(1))
+        self.canvas.bind("<Control-Button-5>", lambda event: self.zoom(-1))
+        self.canvas.bind("<ButtonPress-2>", lambda event: self.canvas.scan_mark(event.x, event.y))
+        self.canvas.bind("<B2-Motion>", lambda event: self.canvas.scan_dragto(event.x, event.y, gain=1))
 
         # Create a text box for showing bounding box information
         self.info_text = tk.Text(root, height=10, width=100)
@@ -53,13 +95,10 @@ class LabelTool:
         self.info_label = tk.Label(self.details_frame, text="Details:\n", justify=tk.LEFT, anchor="w")
         self.info_label.pack(anchor="nw")
 
-        # List to store deleted bounding boxes for undo functionality
-        self.deleted_bboxes = {}
-
         # Navigation buttons
         btn_frame = tk.Frame(root)
         btn_frame.pack(side=tk.BOTTOM, fill=tk.X)
-        self.save_button = tk.Button(btn_frame, text="Save", command=self.save)
+        self.save_button = tk.Button(btn_frame, text="Save", command=self.save_now)
         self.save_button.pack(side=tk.RIGHT)
         self.next_button = tk.Button(btn_frame, text="Next", command=self.next_frame)
         self.next_button.pack(side=tk.RIGHT)
@@ -68,12 +107,14 @@ class LabelTool:
 
         self.prev_button = tk.Button(btn_frame, text="Previous", command=self.prev_frame)
         self.prev_button.pack(side=tk.RIGHT)
-        self.undo_button = tk.Button(btn_frame, text="Undo", command=self.undo_delete)
+        self.undo_button = tk.Button(btn_frame, text="Undo", command=self.undo)
         self.undo_button.pack(side=tk.RIGHT)
+        self.root.bind('<Control-z>', lambda event: self.undo())
+        self.root.bind('<Control-y>', lambda event: self.redo())
         self.delete_frame_button = tk.Button(btn_frame, text="Delete Frame", command=self.delete_frame)
         self.delete_frame_button.pack(side=tk.LEFT)
-        self.undo_delete_frame_button = tk.Button(btn_frame, text="Undo Delete Frame", command=self.undo_delete_frame)
-        self.undo_delete_frame_button.pack(side=tk.LEFT)
+        self.redo_button = tk.Button(btn_frame, text="Redo", command=self.redo)
+        self.redo_button.pack(side=tk.LEFT)
 
         # Initially hide navigation buttons until folders are selected
         self.toggle_navigation_buttons(False)
@@ -85,6 +126,7 @@ class LabelTool:
 
         # Create a menu for browsing folders later
         self.create_menu()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_menu(self):
         """Create a menu bar for browsing folders."""
@@ -93,11 +135,24 @@ class LabelTool:
         browse_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Browse", menu=browse_menu)
         browse_menu.add_command(label="Browse Images Folder", command=self.browse_images_folder)
+        # Edits of an ID over a range of frames, applied to the whole video at once
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+        edit_menu.add_command(label="Set Attributes Over Frames...", command=self.set_attributes_over_frames)
+        edit_menu.add_command(label="Merge IDs...", command=self.merge_ids)
+        edit_menu.add_command(label="Split ID From This Frame...", command=self.split_id)
+        edit_menu.add_command(label="Renumber IDs", command=self.renumber_ids)
 
     def browse_images_folder(self):
         """Browse and select the images folder and automatically find labels and elements folders."""
         self.frame_folder = filedialog.askdirectory(title="Select Images Folder")
         if self.frame_folder:
+            if self.autosave is not None:
+                # Pending saves belong to the previous video
+                self.autosave.close()
+                self.autosave = None
+            if self.label_cache is not None:
+                self.label_cache.save()
             # Extract subfolder name and automatically select corresponding labels folder
             subfolder_name = os.path.basename(self.frame_folder)
             subfolder_number = subfolder_name
@@ -106,10 +161,21 @@ class LabelTool:
             # Now look for labels_with_ids at the same level as the grandparent of images
             potential_labels_folder = os.path.join(images_grandparent_folder, "labels_with_ids", subfolder_name)
             potential_elements_folder = os.path.join(images_grandparent_folder, "elements")
-
-            # Check if the corresponding labels folder exists
-            if os.path.exists(potential_labels_folder):
+            self.video = subfolder_name
+            if self.label_db is not None:
+                self.label_db.close()
+            db_path = find_label_db(images_grandparent_folder)
+            self.label_db = LabelDB(db_path) if db_path else None
+
+            # Check if the corresponding labels folder exists (with a label database it is only read as a fallback)
+            if os.path.exists(potential_labels_folder) or self.label_db is not None:
                 self.output_folder = potential_labels_folder
+                # All boxes of the video in one file, re-parsing only label files changed since the last session
+                self.label_cache = LabelCache(self.output_folder) if self.label_db is None else None
+                if self.label_cache is not None and self.label_cache.malformed:
+                    names = sorted(self.label_cache.malformed)
+                    messagebox.showwarning("Warning", f"Skipped malformed label lines in {len(names)} files: "
+                                                      f"{', '.join(names[:5])}{' ...' if len(names) > 5 else ''}")
             else:
                 messagebox.showerror("Error", f"Labels folder not found: {potential_labels_folder}")
                 self.output_folder = ""
@@ -118,22 +184,42 @@ class LabelTool:
             if os.path.exists(potential_elements_folder):
                 self.elements_folder = potential_elements_folder
                 self.elements_file = os.path.join(self.elements_folder, f"elements_{subfolder_number}.csv")
-                if not os.path.exists(self.elements_file):
+                if not os.path.exists(self.elements_file) and self.label_db is None:
                     # Create the CSV file if it doesn't exist
                     with open(self.elements_file, mode='w', newline='') as file:
                         writer = csv.writer(file)
                         writer.writerow(['frame_id', 'class_id', 'color', 'type', 'gender'])
+                # Read the CSV once per video; frame changes and saves then work on the in-memory rows
+                self.elements = ElementsStore(self.elements_file, self.label_db, self.video)
             else:
                 messagebox.showerror("Error", f"Elements folder not found: {potential_elements_folder}")
                 self.elements_folder = ""
 
-            self.frames = sorted([f for f in os.listdir(self.frame_folder) if f.endswith('.png')])
+            if self.frame_cache is not None:
+                self.frame_cache.close()
+            if self.pyramid is not None:
+                self.pyramid.stop()
+            if self.shard is not None:
+                self.shard.close()
+            shard_path = find_shard(self.frame_folder)
+            self.shard = ShardReader(shard_path) if shard_path else None
+            # With a shard, frames are read from it; label edits are saved as loose files in the labels folder
+            self.frames = list_frames(self.frame_folder, self.shard)
+            # Downscaled levels of every frame are written once, next to the frames, while labeling goes on
+            self.pyramid = FramePyramid(self.frame_folder, self.open_frame)
+            self.pyramid.start(self.frames)
+            self.frame_cache = self.new_frame_cache()
             self.current_frame_index = 0
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = EditJournal(os.path.join(self.frame_folder, JOURNAL_NAME))
+            self.autosave = Autosaver(self.write_frames)
 
             # Check and load frame if both labels and elements folders are set
             if self.output_folder and self.elements_folder:
                 self.folder_frame.pack_forget()  # Hide the folder selection buttons
                 self.toggle_navigation_buttons(True)  # Show navigation buttons
+                self.recover_unsaved_edit()
                 self.load_frame()
 
     def toggle_navigation_buttons(self, show):
@@ -144,14 +230,14 @@ class LabelTool:
             self.prev_button.pack(side=tk.RIGHT)
             self.undo_button.pack(side=tk.RIGHT)
             self.delete_frame_button.pack(side=tk.LEFT)
-            self.undo_delete_frame_button.pack(side=tk.LEFT)
+            self.redo_button.pack(side=tk.LEFT)
         else:
             self.save_button.pack_forget()
             self.next_button.pack_forget()
             self.prev_button.pack_forget()
             self.undo_button.pack_forget()
             self.delete_frame_button.pack_forget()
-            self.undo_delete_frame_button.pack_forget()
+            self.redo_button.pack_forget()
 
     def load_frame(self):
         if not self.frames or not self.output_folder or not self.elements_file:
@@ -159,27 +245,11 @@ class LabelTool:
 
         frame_name = self.frames[self.current_frame_index]
         self.frame_path = os.path.join(self.frame_folder, frame_name)
-        self.current_frame = Image.open(self.frame_path)
-        self.img_w, self.img_h = self.current_frame.size
-
-        # Set the scale factor manually
-        self.scale_factor = self.scale_factor  
-
-        # Apply the scaling to the image
-        new_w = int(self.img_w * self.scale_factor)
-        new_h = int(self.img_h * self.scale_factor)
-        self.current_frame = self.current_frame.resize((new_w, new_h), Image.LANCZOS)
-        self.img_w, self.img_h = self.current_frame.size
-
-        # Load corresponding bounding boxes from the file
         self.txt_path = os.path.join(self.output_folder, f"{os.path.splitext(frame_name)[0]}.txt")
-        self.bboxes = []
-        if os.path.exists(self.txt_path):
-            self.bboxes = get_bounding_boxes(self.txt_path, self.img_w / self.scale_factor, self.img_h / self.scale_factor)
-
-        # Initialize the undo list for this frame if not already done
-        if frame_name not in self.deleted_bboxes:
-            self.deleted_bboxes[frame_name] = []
+        # Scaled image and bounding boxes come from the cache when the prefetch worker already decoded them
+        self.current_frame, self.bboxes = self.frame_cache.get(frame_name)
+        self.img_w, self.img_h = self.current_frame.size
+        self.prefetch_neighbours()
 
         # Load elements if they exist   
         self.load_elements()
@@ -190,22 +260,58 @@ class LabelTool:
         # Update detail information
         self.update_info_label()
 
+    def new_frame_cache(self):
+        """Frame cache decoding at the current scale; replaced when the zoom changes."""
+        scale = self.scale_factor
+        return FrameCache(lambda frame_name: self.decode_frame(frame_name, scale), FRAME_CACHE_BYTES)
+
+    def open_frame(self, frame_name):
+        """The original image of a frame, as a path or file object."""
+        if self.shard is not None:
+            return io.BytesIO(self.shard.read(frame_name))
+        return os.path.join(self.frame_folder, frame_name)
+
+    def decode_frame(self, frame_name, scale):
+        """Open, scale and parse the boxes of one frame; runs on the prefetch thread for cache misses ahead."""
+        # Decoded straight at the displayed size, from the smallest pyramid level that is still sharp
+        image = self.pyramid.load(frame_name, scale)
+        new_w, new_h = image.size
+
+        # Load corresponding bounding boxes from the database or the file
+        stem = os.path.splitext(frame_name)[0]
+        lines = self.autosave.get(frame_name)  # Saved, but not written yet
+        if lines is None and self.label_db is not None:
+            lines = self.label_db.frame_lines(self.video, stem)
+        if lines is None and self.label_cache is not None:
+            lines = self.label_cache.frame_lines(stem)
+        boxes = []
+        if lines is not None:
+            boxes = parse_bounding_boxes(lines, new_w / scale, new_h / scale)
+        elif os.path.exists(os.path.join(self.output_folder, f"{stem}.txt")):
+            boxes = get_bounding_boxes(os.path.join(self.output_folder, f"{stem}.txt"), new_w / scale, new_h / scale)
+        elif self.shard is not None:
+            # Not edited yet: use the pre-labels stored in the shard
+            boxes = parse_bounding_boxes(self.shard.label_text(frame_name).splitlines(), new_w / scale, new_h / scale)
+        return image, boxes
+
+    def prefetch_neighbours(self):
+        """Queue the next and previous PREFETCH_FRAMES frames for decoding, nearest first."""
+        names = []
+        for step in range(1, min(PREFETCH_FRAMES, len(self.frames) // 2) + 1):
+            # Navigation wraps around, so do the neighbours
+            names.append(self.frames[(self.current_frame_index + step) % len(self.frames)])
+            names.append(self.frames[(self.current_frame_index - step) % len(self.frames)])
+        self.frame_cache.prefetch(names)
+
     def load_elements(self):
         """Load elements information from the single CSV file."""
         self.frame_actions = {}  # Store actions for the current frame
-        if os.path.exists(self.elements_file):
-            with open(self.elements_file, mode='r', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    frame_id = int(row['frame_id'])
-                    cls_id = int(row['class_id'])
-                    if frame_id == self.current_frame_index:
-                        # Load type and color for the current frame
-                        self.frame_actions[cls_id] = {'color': row['color'], 'type': row['type'], 'gender': row['gender']}
-                    elif cls_id not in self.frame_actions:
-                        # Load the latest type if not set in the current frame
-                        self.frame_actions[cls_id] = {'color': row['color'], 'type': row['type'], 'gender': row['gender']}
-        
+        for bbox in self.bboxes:
+            # Attributes of the current frame, else the latest ones set for this ID
+            attributes = self.elements.nearest(bbox['class_id'], self.current_frame_index)
+            if attributes is not None:
+                self.frame_actions[bbox['class_id']] = attributes
+
         for bbox in self.bboxes:
             cls_id = bbox['class_id']
             if cls_id in self.frame_actions:
@@ -214,15 +320,49 @@ class LabelTool:
                 bbox['gender'] = self.frame_actions[cls_id]['gender']
 
     def display_frame(self):
+        """Redraw everything; only needed when the frame changes, box edits update their own canvas items."""
+        start = time.perf_counter()
         # Clear the canvas before displaying the new frame
         self.canvas.delete("all")
-        # Resize canvas to fit the image
-        self.canvas.config(width=self.img_w, height=self.img_h)
+        # The canvas keeps the size of the frame at DEFAULT_SCALE, and scrolls over a zoomed in frame
+        self.canvas.config(width=int(self.img_w / self.scale_factor * DEFAULT_SCALE),
+                           height=int(self.img_h / self.scale_factor * DEFAULT_SCALE),
+                           scrollregion=(0, 0, self.img_w, self.img_h))
         # Convert to PhotoImage
         self.photo = ImageTk.PhotoImage(self.current_frame)
-        self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
+        self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW, tags="frame")
+        self.hit_index.clear()
         self.draw_bboxes()
         self.display_bbox_info()
+        self.record_redraw('frame', start)
+
+    def zoom(self, step):
+        """Zoom in (step 1) or out (step -1) through ZOOM_LEVELS, keeping the unsaved boxes of the frame."""
+        i = ZOOM_LEVELS.index(self.scale_factor) + step
+        if not self.frames or not self.output_folder or not 0 <= i < len(ZOOM_LEVELS):
+            return
+        view_x, view_y = self.canvas.xview()[0], self.canvas.yview()[0]
+        self.scale_factor = ZOOM_LEVELS[i]
+        # Cached frames are at the old scale
+        self.frame_cache.close()
+        self.frame_cache = self.new_frame_cache()
+        self.current_frame = self.frame_cache.get(self.frames[self.current_frame_index])[0]
+        self.img_w, self.img_h = self.current_frame.size
+        self.prefetch_neighbours()
+        self.display_frame()
+        self.canvas.xview_moveto(view_x)
+        self.canvas.yview_moveto(view_y)
+        self.update_info_label()
+
+    def canvas_point(self, event):
+        """Canvas coordinates of a mouse event, which differ from the window ones once the view is panned."""
+        return self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+
+    def record_redraw(self, kind, start):
+        """Add the time since start to the redraw stats of kind."""
+        elapsed = time.perf_counter() - start
+        count, total, longest = self.redraw_stats.get(kind, (0, 0, 0))
+        self.redraw_stats[kind] = (count + 1, total + elapsed, max(longest, elapsed))
 
     def update_info_label(self):
         """Update the information label with the current frame and labels details."""
@@ -237,32 +377,70 @@ class LabelTool:
             f"Current Image: {frame_name}\n"
             f"Label File: {os.path.basename(self.txt_path) if os.path.exists(self.txt_path) else 'No label file'}\n"
         )
+        info_text += "Redraw: " + ", ".join(
+            f"{kind} {total / count * 1000:.1f} ms avg ({longest * 1000:.1f} max, {count}x)"
+            for kind, (count, total, longest) in sorted(self.redraw_stats.items())) + "\n"
+        cache_stats = self.frame_cache.stats()
+        info_text += (f"Frame Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                      f"({cache_stats['hit_rate']:.0%}), {cache_stats['frames']} frames, "
+                      f"{cache_stats['bytes'] / (1 << 20):.0f} MB\n")
+        factor = pyramid_factor(self.scale_factor, self.pyramid.factors)
+        if self.autosave.error is not None:
+            info_text += f"Autosave: failed ({self.autosave.error}), retrying\n"
+        else:
+            info_text += f"Autosave: {self.autosave.pending_count()} frames pending, {self.autosave.writes} writes\n"
+        info_text += (f"Zoom: {self.scale_factor:.0%}, decoded from "
+                      f"{'the original' if factor == 1 else f'the 1/{factor} level'} "
+                      f"(pyramid {self.pyramid.built}/{self.pyramid.total} frames)\n")
         self.info_label.config(text=info_text)
 
     def draw_bboxes(self):
         for bbox in self.bboxes:
-            # Scale bounding box coordinates for display
-            x = int(bbox['coords'][0] * self.scale_factor)
-            y = int(bbox['coords'][1] * self.scale_factor)
-            w = int(bbox['coords'][2] * self.scale_factor)
-            h = int(bbox['coords'][3] * self.scale_factor)
-            cls_id = bbox['class_id']
-            bbox['rect'] = self.canvas.create_rectangle(x, y, x + w, y + h, outline="red", width=2)
-            bbox['text'] = self.canvas.create_text(x, y - 10, text=f"ID: {cls_id}", fill="red")
-            # Draw handles on each corner
-            self.draw_resize_handles(x, y, w, h)
-
-    def draw_resize_handles(self, x, y, w, h):
-        """Draw small squares at the corners of the bounding box for resizing."""
+            self.draw_bbox(bbox)
+
+    def scaled_coords(self, bbox):
+        """Scale bounding box coordinates for display."""
+        return tuple(int(value * self.scale_factor) for value in bbox['coords'])
+
+    def draw_bbox(self, bbox):
+        """Create the canvas items of one box; their ids are kept in the box so edits can move them."""
+        x, y, w, h = self.scaled_coords(bbox)
+        cls_id = bbox['class_id']
+        bbox['rect'] = self.canvas.create_rectangle(x, y, x + w, y + h, outline="red", width=2, tags="bbox")
+        bbox['text'] = self.canvas.create_text(x, y - 10, text=f"ID: {cls_id}", fill="red", tags="bbox")
+        # Draw handles on each corner
+        bbox['handles'] = self.draw_resize_handles(x, y, w, h)
+        self.hit_index.set(bbox, (x, y, w, h))
+
+    def update_bbox_items(self, bbox):
+        """Move and relabel the existing canvas items of one box, without redrawing anything else."""
+        x, y, w, h = self.scaled_coords(bbox)
+        self.canvas.coords(bbox['rect'], x, y, x + w, y + h)
+        self.canvas.coords(bbox['text'], x, y - 10)
+        self.canvas.itemconfig(bbox['text'], text=f"ID: {bbox['class_id']}")
+        for handle, corner in zip(bbox['handles'], self.handle_corners(x, y, w, h)):
+            self.canvas.coords(handle, *corner)
+        self.hit_index.set(bbox, (x, y, w, h))
+
+    def erase_bbox(self, bbox):
+        """Remove the canvas items of one box."""
+        self.canvas.delete(bbox['rect'], bbox['text'], *bbox['handles'])
+        self.hit_index.remove(bbox)
+
+    def handle_corners(self, x, y, w, h):
+        """Rectangles of the four resize handles of a box."""
         handle_radius = self.handle_size // 2
-        corners = [
+        return [
             (x - handle_radius, y - handle_radius, x + handle_radius, y + handle_radius),  # top-left
             (x + w - handle_radius, y - handle_radius, x + w + handle_radius, y + handle_radius),  # top-right
             (x - handle_radius, y + h - handle_radius, x + handle_radius, y + h + handle_radius),  # bottom-left
             (x + w - handle_radius, y + h - handle_radius, x + w + handle_radius, y + h + handle_radius)  # bottom-right
         ]
-        for cx, cy, ex, ey in corners:
-            self.canvas.create_rectangle(cx, cy, ex, ey, outline="blue", fill="blue")
+
+    def draw_resize_handles(self, x, y, w, h):
+        """Draw small squares at the corners of the bounding box for resizing, returns their item ids."""
+        return [self.canvas.create_rectangle(cx, cy, ex, ey, outline="blue", fill="blue", tags="bbox")
+                for cx, cy, ex, ey in self.handle_corners(x, y, w, h)]
 
     def display_bbox_info(self):
         self.info_text.config(state='normal')
@@ -280,44 +458,32 @@ class LabelTool:
         """Delete the current frame from both images and labels."""
         if not self.frames:
             return
+        if self.shard is not None:
+            messagebox.showerror("Error", "Frames cannot be deleted from a shard, export it to loose files first "
+                                          "(python shard_io.py)")
+            return
         
         # Get the current frame name
         frame_name = self.frames[self.current_frame_index]
-        image_path = os.path.join(self.frame_folder, frame_name)
-        label_path = os.path.join(self.output_folder, f"{os.path.splitext(frame_name)[0]}.txt")
-
-        # Store the frame info for undo
-        self.deleted_frame_info = {
-            'index': self.current_frame_index,
-            'frame_name': frame_name,
-            'image_data': None,
-            'label_data': None
-        }
-
-        # Read and store the image data
-        with open(image_path, 'rb') as img_file:
-            self.deleted_frame_info['image_data'] = img_file.read()
-
-        # Read and store the label data if it exists
-        if os.path.exists(label_path):
-            with open(label_path, 'r') as lbl_file:
-                self.deleted_frame_info['label_data'] = lbl_file.read()
-        
-        # Delete image file
+        # The files are only moved to the trash, so undo is a rename too
+        trash_name = f"{time.time_ns()}_{os.path.splitext(frame_name)[0]}"
+        edit = {'frame': frame_name, 'index': self.current_frame_index, 'trash_name': trash_name}
+        # Journaled before the files move, so a crash in between is finished on recovery
+        self.journal.record('delete_frame', **edit)
         try:
-            os.remove(image_path)
+            self.move_frame_files(edit, to_trash=True)
         except OSError as e:
-            messagebox.showerror("Error", f"Error deleting image file: {e}")
-
-        # Delete label file if it exists
-        if os.path.exists(label_path):
-            try:
-                os.remove(label_path)
-            except OSError as e:
-                messagebox.showerror("Error", f"Error deleting label file: {e}")
+            # Put back whatever did move, and log it as undone
+            self.journal.undo(lambda edit: self.move_frame_files(edit, to_trash=False))
+            messagebox.showerror("Error", f"Error deleting frame: {e}")
+            return
+        self.remove_frame(frame_name)
 
+    def remove_frame(self, frame_name):
+        """Drop a frame from the list and show the one that takes its place."""
         # Remove frame from the list and update the current frame index
-        del self.frames[self.current_frame_index]
+        self.frame_cache.discard(frame_name)
+        del self.frames[self.frames.index(frame_name)]
 
         if self.current_frame_index >= len(self.frames):
             self.current_frame_index = len(self.frames) - 1
@@ -330,34 +496,136 @@ class LabelTool:
             self.canvas.delete("all")
             messagebox.showinfo("Info", "All frames deleted.")
 
-    def undo_delete_frame(self):
-        """Undo the last frame deletion."""
-        if not self.deleted_frame_info:
-            messagebox.showerror("Error", "No frame to undo.")
-            return
-        
-        # Restore the image file
-        image_path = os.path.join(self.frame_folder, self.deleted_frame_info['frame_name'])
-        with open(image_path, 'wb') as img_file:
-            img_file.write(self.deleted_frame_info['image_data'])
+    def move_frame_files(self, edit, to_trash):
+        """Move the image and label file of a deleted frame into the trash folders, or back out of them."""
+        # A pending save of the frame must not land after its label file moved
+        self.autosave.flush()
+        stem, ext = os.path.splitext(edit['frame'])
+        moves = [(os.path.join(self.frame_folder, edit['frame']),
+                  os.path.join(self.frame_folder, TRASH_NAME, edit['trash_name'] + ext)),
+                 (os.path.join(self.output_folder, f"{stem}.txt"),
+                  os.path.join(self.output_folder, TRASH_NAME, edit['trash_name'] + ".txt"))]
+        for path, trash_path in moves:
+            source, target = (path, trash_path) if to_trash else (trash_path, path)
+            # A frame has no label file until it is saved once
+            if os.path.exists(source):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+
+    def frame_state(self):
+        """Label lines and attributes of the current frame, as recorded in the journal."""
+        return {'lines': bbox_lines(self.bboxes, self.img_w / self.scale_factor, self.img_h / self.scale_factor),
+                'attributes': {str(bbox['class_id']): {name: bbox.get(name, '') for name in ATTRIBUTES}
+                               for bbox in self.bboxes if bbox['class_id'] != 0}}
+
+    def journal_edit(self, op, before):
+        """Record a box or attribute edit of the current frame, given the frame state before it."""
+        after = self.frame_state()
+        if after != before:
+            self.journal.record(op, frame=self.frames[self.current_frame_index], frame_id=self.current_frame_index,
+                                before=before, after=after)
+            self.save()
 
-        # Restore the label file if it was present
-        if self.deleted_frame_info['label_data']:
-            label_path = os.path.join(self.output_folder, f"{os.path.splitext(self.deleted_frame_info['frame_name'])[0]}.txt")
-            with open(label_path, 'w') as lbl_file:
-                lbl_file.write(self.deleted_frame_info['label_data'])
+    def write_frame_state(self, frame_name, frame_id, state, replaced):
+        """Store a journaled frame state: its label lines, and its attributes in place of those of replaced."""
+        for cls_id in replaced['attributes']:
+            if cls_id not in state['attributes']:
+                self.elements.remove(frame_id, int(cls_id))
+        for cls_id, attributes in state['attributes'].items():
+            self.elements.set(frame_id, int(cls_id), attributes)
+        self.autosave.mark(frame_name, state['lines'])
+        self.frame_cache.discard(frame_name)
+
+    def write_range_state(self, edit, undo):
+        """Store the label lines and elements rows of a journaled range operation from before (undo) or after it."""
+        state = 'before' if undo else 'after'
+        for frame in edit['frames']:
+            self.autosave.mark(frame['frame'], frame[state])
+            self.frame_cache.discard(frame['frame'])
+        for frame_id, class_id, before, after in edit['elements']:
+            attributes = before if undo else after
+            if attributes is None:
+                self.elements.remove(frame_id, class_id)
+            else:
+                self.elements.set(frame_id, class_id, attributes)
+        # Written at once, like the operation itself; the elements too when no label line changed
+        self.autosave.flush()
+        self.elements.flush()
+
+    def apply_edit(self, edit, undo):
+        """Revert (undo=True) or replay a journaled edit, then show the frame it touched."""
+        if 'frames' in edit:
+            # A range operation (see label_ops.range_edit) over many frames: stay on the current one
+            self.save()
+            self.write_range_state(edit, undo)
+            self.load_frame()
+            return
+        if edit['op'] == 'delete_frame':
+            if undo:
+                self.move_frame_files(edit, to_trash=False)
+                # Insert the frame back into the list at the original index
+                self.frames.insert(min(edit['index'], len(self.frames)), edit['frame'])
+                self.current_frame_index = self.frames.index(edit['frame'])
+                self.load_frame()
+            else:
+                self.move_frame_files(edit, to_trash=True)
+                self.remove_frame(edit['frame'])
+            return
+        if edit['frame'] != self.frames[self.current_frame_index]:
+            # Keep the edits of the frame on screen before jumping to the one being undone
+            self.save()
+        state, replaced = (edit['before'], edit['after']) if undo else (edit['after'], edit['before'])
+        self.write_frame_state(edit['frame'], edit['frame_id'], state, replaced)
+        if edit['frame'] in self.frames:
+            self.current_frame_index = self.frames.index(edit['frame'])
+            self.load_frame()
 
-        # Insert the frame back into the list at the original index
-        self.frames.insert(self.deleted_frame_info['index'], self.deleted_frame_info['frame_name'])
+    def undo(self):
+        """Undo the last edit, on whichever frame it was made."""
+        if self.journal is None or self.journal.undo(lambda edit: self.apply_edit(edit, undo=True)) is None:
+            self.show_temporary_message("Nothing to undo.", duration=1000)
 
-        # Set the current frame index to the restored frame
-        self.current_frame_index = self.deleted_frame_info['index']
+    def redo(self):
+        """Redo the last undone edit."""
+        if self.journal is None or self.journal.redo(lambda edit: self.apply_edit(edit, undo=False)) is None:
+            self.show_temporary_message("Nothing to redo.", duration=1000)
 
-        # Load the restored frame
-        self.load_frame()
+    def recover_unsaved_edit(self):
+        """After a crash, store the state left by the last journal line (edit, undo or redo) if it was not written.
 
-        # Clear the deleted frame info after undo
-        self.deleted_frame_info = None
+        Saves are delayed by the autosave thread and frame deletes move files
+        after they are journaled, so the files can lag behind the journal.
+        """
+        last = self.journal.last_applied()
+        if last is None:
+            return
+        edit, undone = last
+        if 'frames' in edit:
+            # Writing the frames of a range operation again is harmless, so it is not compared first
+            self.write_range_state(edit, undone)
+            return
+        if edit['op'] == 'delete_frame':
+            # Only files still on the wrong side of the trash are moved
+            self.move_frame_files(edit, to_trash=not undone)
+            if undone and edit['frame'] not in self.frames:
+                self.frames.insert(min(edit['index'], len(self.frames)), edit['frame'])
+            elif not undone and edit['frame'] in self.frames:
+                self.frames.remove(edit['frame'])
+            return
+        if edit['frame'] not in self.frames:
+            return
+        state, replaced = (edit['before'], edit['after']) if undone else (edit['after'], edit['before'])
+        stem = os.path.splitext(edit['frame'])[0]
+        if self.label_db is not None:
+            stored = self.label_db.frame_lines(self.video, stem)
+        else:
+            txt_path = os.path.join(self.output_folder, f"{stem}.txt")
+            stored = None
+            if os.path.exists(txt_path):
+                with open(txt_path, 'r') as f:
+                    stored = f.read().splitlines()
+        if stored != state['lines']:
+            self.write_frame_state(edit['frame'], edit['frame_id'], state, replaced)
 
     def show_temporary_message(self, message, duration=1000):
         """Show a temporary message for a specified duration in milliseconds."""
@@ -370,69 +638,172 @@ class LabelTool:
 
     def prev_frame(self):
         self.save()
+        # Leaving a frame writes its edits right away, without waiting for them
+        self.autosave.flush(wait=False)
         # Move to the last frame if currently at the first frame
         self.current_frame_index = (self.current_frame_index - 1) % len(self.frames)
         self.load_frame()
     
     def next_frame(self):
         self.save()
+        self.autosave.flush(wait=False)
         # Move to the first frame if currently at the last frame
         self.current_frame_index = (self.current_frame_index + 1) % len(self.frames)
         self.load_frame()
 
     def save(self):
-        """Save the bounding boxes and elements for the current frame."""
-        # Save bounding boxes to the txt file
-        update_txt_file(self.txt_path, self.bboxes, self.img_w / self.scale_factor, self.img_h / self.scale_factor)
-        # Save elements information
-        self.save_elements()
-        self.show_temporary_message("Bounding boxes and elements saved successfully.", duration=1000)
-
-    def save_elements(self):
-        """Save elements information to the single CSV file."""
-        elements_data = []
-        
-        # Load existing elements from the file
-        if os.path.exists(self.elements_file):
-            with open(self.elements_file, mode='r', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    frame_id = int(row['frame_id'])
-                    class_id = int(row['class_id'])
-                    # Filter out invalid frame_id
-                    if 0 <= frame_id < len(self.frames):
-                        elements_data.append(row)
-
-        # Create a dictionary to quickly find existing (frame_id, class_id) pairs
-        elements_dict = {(int(row['frame_id']), int(row['class_id'])): row for row in elements_data}
+        """Save the bounding boxes and elements for the current frame; the autosave thread writes them shortly."""
+        frame_name = self.frames[self.current_frame_index]
+        lines = bbox_lines(self.bboxes, self.img_w / self.scale_factor, self.img_h / self.scale_factor)
+        self.update_elements()
+        self.autosave.mark(frame_name, lines)
+        # Keep the cached copy in step, so coming back to this frame shows the saved boxes
+        self.frame_cache.put_boxes(frame_name, parse_bounding_boxes(lines, self.img_w / self.scale_factor,
+                                                                    self.img_h / self.scale_factor))
+
+    def save_now(self):
+        """Save the current frame and wait until everything pending is written."""
+        self.save()
+        self.autosave.flush()
+        if self.autosave.error is not None:
+            messagebox.showerror("Error", f"Saving failed: {self.autosave.error}")
+        else:
+            self.show_temporary_message("Bounding boxes and elements saved successfully.", duration=1000)
+
+    def write_frames(self, frames):
+        """Write the label lines of frames and the pending element changes; runs on the autosave thread."""
+        if self.label_db is not None:
+            # Boxes and elements of the frames are committed in one transaction
+            changes = self.elements.take_changes()
+            try:
+                self.label_db.save_frames(self.video, {os.path.splitext(frame_name)[0]: lines
+                                                       for frame_name, lines in frames.items()}, *changes)
+            except Exception:
+                self.elements.restore_changes(*changes)
+                raise
+            return
+        for frame_name, lines in frames.items():
+            write_label_file(os.path.join(self.output_folder, f"{os.path.splitext(frame_name)[0]}.txt"), lines)
+        # Kept in memory; the cache file is written when the video is closed
+        self.label_cache.update({os.path.splitext(frame_name)[0]: lines for frame_name, lines in frames.items()})
+        # Append the new rows to the CSV, rewriting it only when existing rows changed
+        self.elements.flush()
+
+    def on_close(self):
+        """Write the pending edits before the window closes."""
+        if self.autosave is not None:
+            self.autosave.close()
+            if self.autosave.error is not None:
+                messagebox.showerror("Error", f"Saving failed: {self.autosave.error}")
+        if self.label_cache is not None:
+            self.label_cache.save()
+        self.root.destroy()
+
+    def update_elements(self):
+        """Copy the attributes of the current frame's boxes into the elements store."""
+        # Filter out invalid frame_id
+        self.elements.prune(len(self.frames))
 
         # Add or update with current frame's data
         frame_id = self.current_frame_index
         for bbox in self.bboxes:
-            cls_id = bbox['class_id']
-            
             # Skip adding this bounding box if class_id is 0
-            if cls_id == 0:
+            if bbox['class_id'] == 0:
                 continue
+            self.elements.set(frame_id, bbox['class_id'], bbox)
 
-            color = bbox.get('color', '')
-            type = bbox.get('type', '')
-            gender = bbox.get('gender', '')
+    def video_labels(self):
+        """Boxes of every frame of the video, for the label_ops range operations."""
+        return VideoLabels(self.frames, self.output_folder, self.label_db, self.video, self.shard, self.label_cache)
 
-            # Check if the (frame_id, class_id) already exists
-            if (frame_id, cls_id) in elements_dict:
-                # Update the existing entry
-                elements_dict[(frame_id, cls_id)] = {'frame_id': frame_id, 'class_id': cls_id, 'type': type, 'color': color, 'gender': gender}
-            else:
-                # Add new entry if not existing
-                elements_dict[(frame_id, cls_id)] = {'frame_id': frame_id, 'class_id': cls_id, 'type': type, 'color': color, 'gender': gender}
+    def run_range_op(self, name, op, *args, labels=None):
+        """Save the current frame, apply a label_ops range operation to the whole video, journal it, then reload."""
+        if not self.frames:
+            return None
+        self.save()
+        # The operation reads and writes the label files itself
+        self.autosave.flush()
+        if labels is None:
+            labels = self.video_labels()
+        rows_before = dict(self.elements.rows)  # Rows are replaced, never changed in place
+        try:
+            result = op(labels, self.elements, *args)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return None
+        # One journal entry for the whole operation, so a single undo reverts it
+        edit = range_edit(labels, rows_before, self.elements)
+        if edit['frames'] or edit['elements']:
+            self.journal.record(name, **edit)
+        # One write per changed label file and one for the elements
+        for frame_name in labels.save(self.elements):
+            self.frame_cache.discard(frame_name)
+        self.load_frame()
+        return result
+
+    def ask_frame_range(self):
+        """(start, end) frame_ids asked from the user, from the current frame to the last by default."""
+        start = simpledialog.askinteger("Frames", "First frame:", initialvalue=self.current_frame_index,
+                                        minvalue=0, maxvalue=len(self.frames) - 1, parent=self.root)
+        if start is None:
+            return None
+        end = simpledialog.askinteger("Frames", "Last frame:", initialvalue=len(self.frames) - 1,
+                                      minvalue=start, maxvalue=len(self.frames) - 1, parent=self.root)
+        return None if end is None else (start, end)
+
+    def set_attributes_over_frames(self):
+        """Set type/color/gender of one ID in every frame of a range it appears in."""
+        class_id = simpledialog.askinteger("Set Attributes", "ID:", minvalue=1, parent=self.root)
+        frame_range = self.ask_frame_range() if class_id is not None else None
+        if frame_range is None:
+            return
+        attributes = {}
+        for name in ATTRIBUTES:
+            value = simpledialog.askstring("Set Attributes", f"{name.capitalize()} (empty keeps the current one):",
+                                           parent=self.root)
+            if value is None:
+                return
+            attributes[name] = value
+        frame_ids = self.run_range_op('set-attrs', set_attributes, class_id, *frame_range, attributes)
+        if frame_ids is not None:
+            self.show_temporary_message(f"Attributes of ID {class_id} set in {len(frame_ids)} frames.", duration=2000)
+
+    def merge_ids(self):
+        """Relabel the boxes of one ID as another over a range of frames."""
+        merge_id = simpledialog.askinteger("Merge IDs", "ID to merge:", minvalue=1, parent=self.root)
+        keep_id = simpledialog.askinteger("Merge IDs", f"Merge ID {merge_id} into ID:", minvalue=1,
+                                          parent=self.root) if merge_id is not None else None
+        frame_range = self.ask_frame_range() if keep_id is not None else None
+        if frame_range is None:
+            return
+        frame_ids = self.run_range_op('merge', merge_ids, keep_id, merge_id, *frame_range)
+        if frame_ids is not None:
+            self.show_temporary_message(f"ID {merge_id} merged into {keep_id} in {len(frame_ids)} frames.",
+                                        duration=2000)
+
+    def split_id(self):
+        """Give an ID a new one from the current frame to the end of the video."""
+        class_id = simpledialog.askinteger("Split ID", "ID to split from this frame on:", minvalue=1, parent=self.root)
+        if class_id is None:
+            return
+        self.save()
+        self.autosave.flush()
+        labels = self.video_labels()
+        new_id = simpledialog.askinteger("Split ID", "New ID:", initialvalue=next_free_id(labels, self.elements),
+                                         minvalue=1, parent=self.root)
+        if new_id is None:
+            return
+        result = self.run_range_op('split', split_id, class_id, self.current_frame_index, new_id, labels=labels)
+        if result is not None:
+            self.show_temporary_message(f"ID {class_id} is ID {new_id} in {len(result[1])} frames.", duration=2000)
 
-        # Write back to CSV with updated elements
-        with open(self.elements_file, mode='w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=['frame_id', 'class_id', 'type', 'color', 'gender'])
-            writer.writeheader()
-            for data in elements_dict.values():
-                writer.writerow(data)
+    def renumber_ids(self):
+        """Number the IDs of the video 1, 2, ... in order of first appearance."""
+        if not messagebox.askyesno("Renumber IDs", "Renumber every ID of this video in order of first appearance?"):
+            return
+        mapping = self.run_range_op('renumber', renumber_ids)
+        if mapping is not None:
+            self.show_temporary_message(f"Renumbered {len(mapping)} IDs.", duration=2000)
 
     def enable_drawing(self, event):
         """Enable drawing mode when 'H' key is pressed.""" 
@@ -443,36 +814,33 @@ class LabelTool:
         self.allow_drawing = False
 
     def on_mouse_click(self, event):
+        x, y = self.canvas_point(event)
         if self.allow_drawing:
             self.drawing = True
-            self.start_x = event.x
-            self.start_y = event.y
+            self.start_x = x
+            self.start_y = y
         else:
+            # Check if click is near a corner for resizing
+            handle = self.hit_index.handle_at(x, y)
+            if handle is not None:
+                self.resizing = True
+                self.resizing_bbox, self.resize_corner = handle
+                self.press_state = self.frame_state()
+                self.start_x = x
+                self.start_y = y
+                return
             # Check if a bounding box was clicked for editing
-            for bbox in self.bboxes:
-                bx = int(bbox['coords'][0] * self.scale_factor)
-                by = int(bbox['coords'][1] * self.scale_factor)
-                bw = int(bbox['coords'][2] * self.scale_factor)
-                bh = int(bbox['coords'][3] * self.scale_factor)
-                # Check if click is near a corner for resizing
-                if self.is_near_corner(event.x, event.y, bx, by, bw, bh):
-                    self.resizing = True
-                    self.resizing_bbox = bbox
-                    self.resize_corner = self.get_resize_corner(event.x, event.y, bx, by, bw, bh)
-                    self.start_x = event.x
-                    self.start_y = event.y
-                    return
-                # Check if click is inside the bounding box for editing
-                if bx <= event.x <= bx + bw and by <= event.y <= by + bh:
-                    self.open_edit_dialog(bbox)
-                    return
+            bbox = self.hit_index.box_at(x, y)
+            if bbox is not None:
+                self.open_edit_dialog(bbox)
 
     def on_mouse_drag(self, event):
+        x, y = self.canvas_point(event)
         if self.drawing:
             if self.current_rect:
                 self.canvas.delete(self.current_rect)
             self.current_rect = self.canvas.create_rectangle(
-                self.start_x, self.start_y, event.x, event.y, outline="blue", width=2
+                self.start_x, self.start_y, x, y, outline="blue", width=2
             )
         elif self.resizing:
             # Update bounding box size based on mouse drag
@@ -482,55 +850,56 @@ class LabelTool:
                 bw = int(self.resizing_bbox['coords'][2] * self.scale_factor)
                 bh = int(self.resizing_bbox['coords'][3] * self.scale_factor)
                 if self.resize_corner == 'top-left':
-                    new_x = min(event.x, bx + bw - 1)
-                    new_y = min(event.y, by + bh - 1)
+                    new_x = min(x, bx + bw - 1)
+                    new_y = min(y, by + bh - 1)
                     new_w = (bx + bw) - new_x
                     new_h = (by + bh) - new_y
                     self.resizing_bbox['coords'] = ((new_x / self.scale_factor), (new_y / self.scale_factor), max(1, new_w / self.scale_factor), max(1, new_h / self.scale_factor))
                 elif self.resize_corner == 'bottom-right':
-                    new_w = max(1, event.x - bx)
-                    new_h = max(1, event.y - by)
+                    new_w = max(1, x - bx)
+                    new_h = max(1, y - by)
                     self.resizing_bbox['coords'] = (bx / self.scale_factor, by / self.scale_factor, new_w / self.scale_factor, new_h / self.scale_factor)
                 elif self.resize_corner == 'top-right':
-                    new_w = max(1, event.x - bx)
-                    new_h = max(1, (by + bh) - event.y)
-                    self.resizing_bbox['coords'] = (bx / self.scale_factor, event.y / self.scale_factor, new_w / self.scale_factor, new_h / self.scale_factor)
+                    new_w = max(1, x - bx)
+                    new_h = max(1, (by + bh) - y)
+                    self.resizing_bbox['coords'] = (bx / self.scale_factor, y / self.scale_factor, new_w / self.scale_factor, new_h / self.scale_factor)
                 elif self.resize_corner == 'bottom-left':
-                    new_w = max(1, (bx + bw) - event.x)
-                    new_h = max(1, event.y - by)
-                    self.resizing_bbox['coords'] = (event.x / self.scale_factor, by / self.scale_factor, new_w / self.scale_factor, new_h / self.scale_factor)
-                self.display_frame()  # Redraw everything
+                    new_w = max(1, (bx + bw) - x)
+                    new_h = max(1, y - by)
+                    self.resizing_bbox['coords'] = (x / self.scale_factor, by / self.scale_factor, new_w / self.scale_factor, new_h / self.scale_factor)
+                # Only this box's items move; the info text is refreshed on release
+                start = time.perf_counter()
+                self.update_bbox_items(self.resizing_bbox)
+                self.record_redraw('drag', start)
 
     def on_mouse_release(self, event):
+        x, y = self.canvas_point(event)
         if self.drawing:
             self.drawing = False
             if self.current_rect:
                 self.canvas.delete(self.current_rect)
             # Create a new bounding box
-            x1, y1 = min(self.start_x, event.x), min(self.start_y, event.y)
-            x2, y2 = max(self.start_x, event.x), max(self.start_y, event.y)
+            x1, y1 = min(self.start_x, x), min(self.start_y, y)
+            x2, y2 = max(self.start_x, x), max(self.start_y, y)
             # Store original coordinates before scaling
             original_x1, original_y1 = x1 / self.scale_factor, y1 / self.scale_factor
             original_x2, original_y2 = x2 / self.scale_factor, y2 / self.scale_factor
             new_bbox = {'coords': (original_x1, original_y1, original_x2 - original_x1, original_y2 - original_y1), 'class_id': 0, 'type': '', 'color': '', 'gender': ''}  # Default class_id to 0
+            before = self.frame_state()
             self.bboxes.append(new_bbox)
-            self.display_frame()  # Redraw everything
+            self.journal_edit('add', before)
+            start = time.perf_counter()
+            self.draw_bbox(new_bbox)
+            self.display_bbox_info()
+            self.record_redraw('edit', start)
             self.open_edit_dialog(new_bbox)  # Prompt to set ID
         elif self.resizing:
             self.resizing = False
             self.resizing_bbox = None
-
-    def undo_delete(self):
-        """Undo the last delete action for the current frame."""
-        # Get the current frame name
-        frame_name = self.frames[self.current_frame_index]
-        
-        # Check if there are any deleted bboxes for this frame
-        if frame_name in self.deleted_bboxes and self.deleted_bboxes[frame_name]:
-            # Restore the last deleted bounding box
-            last_deleted_bbox = self.deleted_bboxes[frame_name].pop()
-            self.bboxes.append(last_deleted_bbox)
-            self.display_frame()
+            self.display_bbox_info()
+            if self.press_state is not None:
+                self.journal_edit('resize', self.press_state)
+                self.press_state = None
 
     def open_edit_dialog(self, bbox):
         # Create a new top-level window
@@ -575,7 +944,7 @@ class LabelTool:
         gender_entry.insert(0, bbox.get('gender', ''))  # Pre-fill with current gender
         def update_values():
             # Get the new ID
-            self.save()
+            before = self.frame_state()
             new_id = id_entry.get()
             input_color = color_entry.get()
             input_action = action_entry.get()
@@ -592,32 +961,13 @@ class LabelTool:
                 # Update the bounding box ID
                 bbox['class_id'] = new_id
                 
-                # Check if this ID exists in the elements_dict to auto-fill details
-                elements_dict = {}
-                # Read the existing elements data from the elements file
-                if os.path.exists(self.elements_file):
-                    with open(self.elements_file, mode='r', newline='') as file:
-                        reader = csv.DictReader(file)
-                        for row in reader:
-                            frame_id = int(row['frame_id'])
-                            cls_id = int(row['class_id'])
-                            elements_dict[(frame_id, cls_id)] = row
-                
-                # Initialize variables for auto-filling
-                auto_color = ''
-                auto_action = ''
-                auto_gender = ''
-                found_existing = False
-
-                # Find the nearest previous frame with the same ID
-                for frame_index in range(self.current_frame_index - 1, -1, -1):
-                    if (frame_index, new_id) in elements_dict:
-                        data = elements_dict[(frame_index, new_id)]
-                        auto_action = data['type']
-                        auto_color = data['color']
-                        auto_gender = data['gender']
-                        found_existing = True
-                        break
+                # Find the nearest previous frame with the same ID to auto-fill details
+                data = self.elements.latest_before(new_id, self.current_frame_index)
+                found_existing = data is not None
+                if found_existing:
+                    auto_action = data['type']
+                    auto_color = data['color']
+                    auto_gender = data['gender']
                 
                 # Use the values provided by the user, or auto-fill if they didn't provide anything
                 if input_color:
@@ -641,32 +991,32 @@ class LabelTool:
                 else:
                     bbox['gender'] = ''
                 
-                self.display_frame()
+                self.journal_edit('edit', before)
+                start = time.perf_counter()
+                self.update_bbox_items(bbox)
+                self.display_bbox_info()
+                self.record_redraw('edit', start)
                 edit_window.destroy()
 
 
         def delete_bbox():
-            """Remove the bounding box and store it for undo."""
-            # Get the current frame name
-            self.save()
-            frame_name = self.frames[self.current_frame_index]
-            
-            # Initialize the list if this frame has no deleted bboxes yet
-            if frame_name not in self.deleted_bboxes:
-                self.deleted_bboxes[frame_name] = []
-            
-            # Save the bbox for undo
-            self.deleted_bboxes[frame_name].append(bbox)
+            """Remove the bounding box; the journal keeps it for undo."""
+            before = self.frame_state()
             
             # Remove the bounding box
             self.bboxes.remove(bbox)
-            self.display_frame()
+            self.journal_edit('delete', before)
+            start = time.perf_counter()
+            self.erase_bbox(bbox)
+            self.display_bbox_info()
+            self.record_redraw('edit', start)
             edit_window.destroy()
         
         def enable_edit_mode():
             # Close the dialog and enter resizing mode
             self.resizing = True
             self.resizing_bbox = bbox
+            self.press_state = self.frame_state()
             edit_window.destroy()
 
         Button(edit_window, text="Update Values", command=update_values).pack(side=tk.LEFT, padx=5)
@@ -687,72 +1037,52 @@ class LabelTool:
 
     def on_mouse_move(self, event):
         """Change cursor when hovering over resize handles."""
-        cursor = ""
-        for bbox in self.bboxes:
-            bx = int(bbox['coords'][0] * self.scale_factor)
-            by = int(bbox['coords'][1] * self.scale_factor)
-            bw = int(bbox['coords'][2] * self.scale_factor)
-            bh = int(bbox['coords'][3] * self.scale_factor)
-            if self.is_near_corner(event.x, event.y, bx, by, bw, bh):
-                cursor = "hand2"  # Change to a hand cursor
-                break
+        # Change to a hand cursor over a handle
+        cursor = "hand2" if self.hit_index.handle_at(*self.canvas_point(event)) is not None else ""
         self.canvas.config(cursor=cursor)
 
-    def is_near_corner(self, x, y, bx, by, bw, bh):
-        """Check if the click is near a corner of the bounding box."""
-        return (
-            (abs(x - bx) <= self.handle_size and abs(y - by) <= self.handle_size) or  # Top-left corner
-            (abs(x - (bx + bw)) <= self.handle_size and abs(y - (by + bh)) <= self.handle_size) or  # Bottom-right corner
-            (abs(x - (bx + bw)) <= self.handle_size and abs(y - by) <= self.handle_size) or  # Top-right corner
-            (abs(x - bx) <= self.handle_size and abs(y - (by + bh)) <= self.handle_size)  # Bottom-left corner
-        )
-
-    def get_resize_corner(self, x, y, bx, by, bw, bh):
-        """Determine which corner of the bounding box is being clicked."""
-        if abs(x - bx) <= self.handle_size and abs(y - by) <= self.handle_size:
-            return 'top-left'
-        elif abs(x - (bx + bw)) <= self.handle_size and abs(y - (by + bh)) <= self.handle_size:
-            return 'bottom-right'
-        elif abs(x - (bx + bw)) <= self.handle_size and abs(y - by) <= self.handle_size:
-            return 'top-right'
-        elif abs(x - bx) <= self.handle_size and abs(y - (by + bh)) <= self.handle_size:
-            return 'bottom-left'
-        return None
-
 def get_bounding_boxes(txt_path, img_w, img_h):
     """Read bounding boxes from txt file."""
-    boxes = []
     with open(txt_path, 'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            parts = line.strip().split()
-            cls_id = int(parts[1])
-            x_center = float(parts[2]) * img_w
-            y_center = float(parts[3]) * img_h
-            width = float(parts[4]) * img_w
-            height = float(parts[5]) * img_h
-
-            # Convert from center x,y,width,height to top-left x,y,width,height
-            x = int(x_center - (width / 2))
-            y = int(y_center - (height / 2))
-            w = int(width)
-            h = int(height)
-
-            boxes.append({'coords': (x, y, w, h), 'class_id': cls_id})
+        return parse_bounding_boxes(f.readlines(), img_w, img_h)
+
+def parse_bounding_boxes(lines, img_w, img_h):
+    """Parse the lines of a label file into bounding boxes."""
+    boxes = []
+    for line in lines:
+        parts = line.strip().split()
+        cls_id = int(parts[1])
+        x_center = float(parts[2]) * img_w
+        y_center = float(parts[3]) * img_h
+        width = float(parts[4]) * img_w
+        height = float(parts[5]) * img_h
+
+        # Convert from center x,y,width,height to top-left x,y,width,height
+        x = int(x_center - (width / 2))
+        y = int(y_center - (height / 2))
+        w = int(width)
+        h = int(height)
+
+        boxes.append({'coords': (x, y, w, h), 'class_id': cls_id})
     return boxes
 
-def update_txt_file(txt_path, boxes, img_w, img_h):
-    """Update the .txt file with new bounding boxes."""
-    with open(txt_path, 'w') as f:
-        for box in boxes:
-            x, y, w, h = box['coords']
-            cls_id = box['class_id']
-            # Convert coordinates back to YOLO format (normalized)
-            x_center = (x + w / 2) / img_w
-            y_center = (y + h / 2) / img_h
-            width = w / img_w
-            height = h / img_h
-            f.write(f"0 {cls_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+def bbox_lines(boxes, img_w, img_h):
+    """Label file lines of bounding boxes."""
+    lines = []
+    for box in boxes:
+        x, y, w, h = box['coords']
+        cls_id = box['class_id']
+        # Convert coordinates back to YOLO format (normalized)
+        x_center = (x + w / 2) / img_w
+        y_center = (y + h / 2) / img_h
+        width = w / img_w
+        height = h / img_h
+        lines.append(f"0 {cls_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
+    return lines
+
+def write_label_file(txt_path, lines):
+    """Replace a label file with lines, atomically."""
+    write_atomic(txt_path, ''.join(line + '\n' for line in lines))
 
 def main():
     # Set up the main application window
@@ -1,97 +1,647 @@
+import argparse
+import csv
 import cv2
+import multiprocessing
+import numpy as np
 import os
-from ultralytics import YOLO
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from tqdm import tqdm
 
-def extract_and_detect(video_path, frame_output_folder, label_output_folder, frame_interval=0.5):
+from detector_backends import BACKENDS, create_detector, export_model
+from frame_pipeline import BoundedExecutor, iter_queue, start_producer
+from instrumentation import VideoStats, append_summary, format_summary
+from prelabel_manifest import (MANIFEST_NAME, cached_fingerprint, count_written_frames, load_manifest, manifest_key,
+                               save_manifest)
+from shard_io import SHARD_NAME, ShardWriter
+from tracker import ByteTracker
+
+SAMPLING_MODES = ('read', 'grab', 'seek', 'adaptive')
+THUMBNAIL_SIZE = (64, 36)  # Size of the grayscale thumbnails compared by the adaptive sampling mode
+FRAME_INDEX_NAME = 'frames.csv'  # Original frame index and timestamp of every saved frame, next to the images
+SUMMARY_NAME = 'prelabel_summary.jsonl'  # One JSON summary line per processed video
+IMAGE_FORMATS = {
+    # format: (file extension, OpenCV quality flag, default quality)
+    'png': ('.png', cv2.IMWRITE_PNG_COMPRESSION, 3),  # Quality is the zlib compression level 0-9
+    'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 95),  # Quality 0-100
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 95),  # Quality 1-100
+    'raw': ('.bmp', None, None),  # Uncompressed BMP: cheapest to encode and to decode in label_tool
+}
+# 'files' writes one image and one label file per frame, 'shard' packs them into one tar per video (see shard_io)
+OUTPUT_LAYOUTS = ('files', 'shard')
+DEFAULT_MODEL = 'yolov8l.pt'  # You can replace this with a different model version (yolov8s.pt, yolov8m.pt,...)
+
+# Loaded detectors keyed by model name and backend, so every video in a process shares the same weights
+_model_cache = {}
+
+def load_model(model_name=DEFAULT_MODEL, backend='torch', int8=False, imgsz=640, progress=True):
+    """Load a YOLO model once per process and return the cached handle; progress=False prints nothing."""
+    key = (model_name, backend, int8)
+    if key not in _model_cache:
+        start = time.perf_counter()
+        _model_cache[key] = create_detector(model_name, backend, imgsz, int8)
+        if progress:
+            tqdm.write(f"Loaded {model_name} ({backend}{', int8' if int8 else ''}) in "
+                       f"{time.perf_counter() - start:.2f}s")
+    return _model_cache[key]
+
+def frame_thumbnail(frame):
+    """Small grayscale version of a frame, cheap to compare with another one."""
+    small = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+def iter_keyframes(cap, fps, min_step, max_gap=5.0, diff_threshold=8.0, start_sample=0, stats=None):
+    """Yield (frame_index, timestamp, frame) for the frames where the scene changed.
+
+    A candidate is checked every min_step frames and kept when the mean absolute
+    difference of its thumbnail with the last kept one reaches diff_threshold
+    (0-255 gray levels), or when max_gap seconds passed since the last kept frame.
+    The frames not kept are counted in stats as for iter_sampled_frames().
+    """
+    max_step = max(max_gap * fps, min_step)
+    frame_count = 0
+    sample_count = 0
+    next_candidate = 0.0
+    last_kept_index = None
+    last_thumbnail = None
+    while cap.isOpened():
+        is_candidate = frame_count >= int(round(next_candidate))
+        ret = cap.grab()
+        frame = None
+        if ret and is_candidate:
+            ret, frame = cap.retrieve()
+        if not ret:
+            break
+
+        kept = False
+        if is_candidate:
+            next_candidate += min_step
+            thumbnail = frame_thumbnail(frame)
+            if (last_thumbnail is None or frame_count - last_kept_index >= max_step
+                    or cv2.absdiff(thumbnail, last_thumbnail).mean() >= diff_threshold):
+                kept = True
+                last_kept_index, last_thumbnail = frame_count, thumbnail
+                if sample_count >= start_sample:
+                    yield frame_count, frame_count / fps, frame
+                sample_count += 1
+        if not kept and sample_count >= start_sample and stats is not None:
+            stats.count('frames_skipped')
+
+        frame_count += 1
+
+def iter_sampled_frames(cap, frame_interval=0.5, sampling='grab', start_sample=0, max_gap=5.0, diff_threshold=8.0,
+                        stats=None):
+    """Yield (frame_index, timestamp, frame) for every frame_interval seconds of the video.
+
+    sampling='read' decodes every frame (old behaviour), 'grab' only grabs the
+    skipped frames and retrieves the kept ones, 'seek' jumps straight to each
+    sample position with a seek, which is the fastest for long videos with a
+    large interval. 'adaptive' checks a frame every frame_interval seconds but
+    only keeps it when the scene changed (see iter_keyframes). The first
+    start_sample samples are skipped without being yielded, to resume an
+    interrupted run. With stats (a VideoStats), every frame passed over after
+    them is counted in its frames_skipped.
+    """
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling} (expected one of {SAMPLING_MODES})")
+    if frame_interval <= 0:
+        raise ValueError(f"frame_interval must be positive, got {frame_interval}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)  # Get frames per second of the video
+    if not fps or fps <= 0:
+        raise ValueError("Could not read FPS from video")
+    # Frames between each cut, kept as a float so fractional intervals do not drift or round to 0
+    step = max(frame_interval * fps, 1.0)
+
+    if sampling == 'adaptive':
+        yield from iter_keyframes(cap, fps, step, max_gap, diff_threshold, start_sample, stats)
+        return
+
+    if sampling == 'seek':
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        sample_index = start_sample
+        last_target = int(round((start_sample - 1) * step)) if start_sample else -1
+        while True:
+            target = int(round(sample_index * step))
+            if total_frames > 0 and target >= total_frames:
+                # The frames after the last sample are skipped too
+                if stats is not None:
+                    stats.count('frames_skipped', max(0, total_frames - last_target - 1))
+                break
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if stats is not None:
+                stats.count('frames_skipped', target - last_target - 1)
+            yield target, target / fps, frame
+            last_target = target
+            sample_index += 1
+        return
+
+    frame_count = 0
+    sample_count = 0
+    next_target = 0.0
+    while cap.isOpened():
+        keep = frame_count >= int(round(next_target))
+        wanted = keep and sample_count >= start_sample
+        if sampling == 'read':
+            ret, frame = cap.read()
+        else:
+            ret = cap.grab()
+            frame = None
+            if ret and wanted:
+                ret, frame = cap.retrieve()
+        if not ret:
+            break
+
+        if keep:
+            if wanted:
+                yield frame_count, frame_count / fps, frame
+            sample_count += 1
+            next_target += step
+        elif sample_count >= start_sample and stats is not None:
+            stats.count('frames_skipped')
+
+        frame_count += 1
+
+PERSON_CLASS = 0  # COCO class id of "person"
+
+def person_boxes(result, frame_shape):
+    """Return the person boxes of one YOLO result as an (N, 4) float32 array of normalized xc, yc, w, h,
+    together with their (N,) confidences."""
+    img_h, img_w = frame_shape[:2]  # Get image height and width
+    boxes = result.boxes  # Get bounding box results
+    cls = boxes.cls.cpu().numpy()
+    xywh = boxes.xywh.cpu().numpy()
+    scores = boxes.conf.cpu().numpy()
+    # Only keep bounding boxes for class "person", normalized in float32 like the tensors themselves
+    is_person = cls == PERSON_CLASS
+    scale = np.array([img_w, img_h, img_w, img_h], dtype=np.float32)
+    return xywh[is_person] / scale, scores[is_person]
+
+def format_label_lines(class_ids, boxes):
+    """Format the rows "0 class_id x_center y_center width height" of one label file as a single string."""
+    table = np.column_stack([class_ids, boxes]).tolist()
+    return "".join(f"0 {int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for c, x, y, w, h in table)
+
+def label_rows(result, frame_shape, tracker=None, conf=0.25):
+    """Class ids and normalized boxes to write for one frame.
+
+    Without a tracker every box gets class id 0 and the real IDs are assigned in
+    label_tool; with one, the class id is the box's track ID (0 if unmatched).
+    Frames must be passed in video order when tracking. A tracker sees the
+    detections down to its low_thresh (see detection_conf()), but only those
+    above conf or matched to a track are written.
+    """
+    boxes, scores = person_boxes(result, frame_shape)
+    if tracker is None:
+        return np.zeros(len(boxes), dtype=np.int64), boxes
+    class_ids = tracker.update(boxes, scores)
+    keep = (scores >= conf) | (class_ids != 0)
+    return class_ids[keep], boxes[keep]
+
+def detection_conf(conf, tracker=None):
+    """Confidence threshold to run the detector at: lower when tracking, for the tracker's low-score association."""
+    return conf if tracker is None else min(conf, tracker.low_thresh)
+
+def write_label_file(txt_path, class_ids, boxes, shard=None):
+    """Write the boxes of one frame to a .txt label file, or to the video's shard when one is given."""
+    if shard is not None:
+        shard.add(os.path.basename(txt_path), format_label_lines(class_ids, boxes).encode())
+        return
+    with open(txt_path, 'w') as f:
+        f.write(format_label_lines(class_ids, boxes))
+
+def detect_batch(model, frames, imgsz=640, conf=0.25):
+    """Run the model once on a list of frames, returns one result per frame."""
+    return model(frames, imgsz=imgsz, conf=conf, verbose=False)
+
+def flush_batch(model, batch, label_output_folder, stats, imgsz=640, conf=0.25, tracker=None, shard=None):
+    """Run inference on a batch of (save_count, frame) and write each label file, timed in stats (a VideoStats)."""
+    results = stats.call('infer', detect_batch, model, [frame for _, frame in batch], imgsz,
+                         detection_conf(conf, tracker))
+    # Results come back in the same order as the frames, so zip maps them to their save_count
+    for (save_count, frame), result in zip(batch, results):
+        txt_path = os.path.join(label_output_folder, f"{save_count:06}.txt")
+        class_ids, boxes = label_rows(result, frame.shape, tracker, conf)
+        stats.count('boxes', len(boxes))
+        stats.call('label_write', write_label_file, txt_path, class_ids, boxes, shard)
+
+def frame_image_path(frame_output_folder, save_count, image_format='png'):
+    """Path of the image file for the save_count-th sampled frame."""
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format: {image_format} (expected one of {tuple(IMAGE_FORMATS)})")
+    return os.path.join(frame_output_folder, f"{save_count:06}{IMAGE_FORMATS[image_format][0]}")
+
+def save_frame_image(frame_output_folder, save_count, frame, image_format='png', image_quality=None, shard=None):
+    """Encode and write one sampled frame in the chosen format, to its own file or to the video's shard."""
+    frame_name = frame_image_path(frame_output_folder, save_count, image_format)
+    ext, flag, default_quality = IMAGE_FORMATS[image_format]
+    params = [] if flag is None else [flag, default_quality if image_quality is None else image_quality]
+    if shard is not None:
+        ok, encoded = cv2.imencode(ext, frame, params)
+        if not ok:
+            raise IOError(f"Could not encode {frame_name}")
+        shard.add(os.path.basename(frame_name), encoded.tobytes())
+    elif not cv2.imwrite(frame_name, frame, params):
+        raise IOError(f"Could not write {frame_name}")
+    return frame_name
+
+def write_frame_outputs(frame_output_folder, label_output_folder, save_count, frame, class_ids, boxes, stats,
+                        image_format='png', image_quality=None, shard=None):
+    """Write the image and the label file of one sampled frame, timed in stats (a VideoStats)."""
+    stats.call('image_write', save_frame_image, frame_output_folder, save_count, frame, image_format, image_quality,
+               shard)
+    stats.call('label_write', write_label_file, os.path.join(label_output_folder, f"{save_count:06}.txt"), class_ids,
+               boxes, shard)
+
+def open_frame_index(frame_output_folder, start_at=0):
+    """Open the frames.csv of a video for appending, keeping only the rows of the first start_at frames."""
+    index_path = os.path.join(frame_output_folder, FRAME_INDEX_NAME)
+    rows = []
+    if start_at and os.path.exists(index_path):
+        with open(index_path, 'r', newline='') as f:
+            rows = [row for row in csv.DictReader(f) if int(row['save_id']) < start_at]
+    index_file = open(index_path, 'w', newline='')
+    writer = csv.writer(index_file)
+    writer.writerow(['save_id', 'frame_index', 'timestamp'])
+    writer.writerows([row['save_id'], row['frame_index'], row['timestamp']] for row in rows)
+    return index_file, writer
+
+def count_indexed_frames(frame_output_folder):
+    """Number of leading frames (save_id 0, 1, ...) with a complete row in the video's frames.csv."""
+    index_path = os.path.join(frame_output_folder, FRAME_INDEX_NAME)
+    if not os.path.exists(index_path):
+        return 0
+    with open(index_path, 'r', newline='') as f:
+        lines = f.read().split('\n')
+    # The last line is torn, or empty when the file ends with a newline
+    save_ids = {int(row['save_id']) for row in csv.DictReader(lines[:-1]) if row['timestamp']}
+    count = 0
+    while count in save_ids:
+        count += 1
+    return count
+
+def run_pipeline(cap, model, frame_output_folder, label_output_folder, stats, frame_interval=0.5, sampling='grab',
+                 batch_size=8, imgsz=640, conf=0.25, queue_size=32, writer_threads=4, image_format='png',
+                 image_quality=None, tracker=None, start_at=0, max_gap=5.0, diff_threshold=8.0, on_sample=None,
+                 shard=None):
+    """Decode, infer and write one video concurrently, returns the per-stage stats.
+
+    A decoder thread feeds sampled frames into a bounded queue, the calling thread
+    runs inference batch by batch, and a pool of writer threads saves the images
+    and labels. Both the queue and the writer pool block when full, so memory
+    stays flat however long the video is. File names come from the decode order,
+    so the output is identical to the sequential path. on_sample(frame_index) is
+    called for every sampled frame, in order, on the calling thread. Images and
+    labels go to shard instead of loose files when one is given. Every stage is
+    timed in stats (the video's VideoStats), once.
+    """
+    decode_stats = stats.stage('decode')
+    infer_stats = stats.stage('infer', queue_size)
+    write_stats = stats.stage('write', queue_size)
+    frame_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    # The decoder thread charges its busy time to the decode stage
+    sampled = iter_sampled_frames(cap, frame_interval, sampling, start_at, max_gap, diff_threshold, stats)
+    numbered = ((save_count,) + sample for save_count, sample in enumerate(sampled, start_at))
+    decoder = start_producer(numbered, frame_queue, decode_stats, stop, name="decoder")
+
+    def infer_and_submit(batch):
+        start = time.perf_counter()
+        results = detect_batch(model, [frame for _, frame in batch], imgsz, detection_conf(conf, tracker))
+        infer_stats.add(busy=time.perf_counter() - start, items=len(batch))
+        for (save_count, frame), result in zip(batch, results):
+            # Labels (and track IDs) are built here, in frame order; only the file writes run out of order
+            class_ids, boxes = label_rows(result, frame.shape, tracker, conf)
+            stats.count('boxes', len(boxes))
+            writer.submit(write_frame_outputs, frame_output_folder, label_output_folder, save_count, frame,
+                          class_ids, boxes, stats, image_format, image_quality, shard)
+
+    index_file, index_writer = open_frame_index(frame_output_folder, start_at)
+    try:
+        with BoundedExecutor(writer_threads, queue_size, write_stats, infer_stats) as writer:
+            batch = []
+            for save_count, frame_index, timestamp, frame in iter_queue(frame_queue, infer_stats):
+                index_writer.writerow([save_count, frame_index, f"{timestamp:.3f}"])
+                if on_sample is not None:
+                    on_sample(frame_index)
+                batch.append((save_count, frame))
+                if len(batch) >= batch_size:
+                    infer_and_submit(batch)
+                    batch = []
+                    # Keep the index on disk in step with the images, for a resume after a kill
+                    index_file.flush()
+            if batch:
+                infer_and_submit(batch)
+    finally:
+        # Stop the decoder before the capture is released, also when a stage failed
+        stop.set()
+        decoder.join()
+        index_file.close()
+    return [stage.as_dict() for stage in (decode_stats, infer_stats, write_stats)]
+
+def print_stage_stats(stage_stats):
+    """Print one line per pipeline stage; the stage with the highest utilisation is the bottleneck."""
+    for stats in stage_stats:
+        tqdm.write(f"{stats['stage']:>7}: {stats['items']:>6} items, busy {stats['busy_s']:.2f}s, "
+              f"starved {stats['starved_s']:.2f}s, blocked {stats['blocked_s']:.2f}s, "
+              f"utilisation {stats['utilisation']:.0%}, mean queue {stats['mean_queue']}/{stats['queue_capacity']}")
+
+def extract_and_detect(video_path, frame_output_folder, label_output_folder, frame_interval=0.5, sampling='grab',
+                       batch_size=8, imgsz=640, conf=0.25, model=None, model_name=DEFAULT_MODEL, backend='torch',
+                       int8=False, pipeline=False, queue_size=32, writer_threads=4, image_format='png',
+                       image_quality=None, track=False, start_at=0, max_gap=5.0, diff_threshold=8.0, progress=True,
+                       output_layout='files'):
+    """Sample frames of one video, detect people and write the images and label files.
+
+    start_at resumes an interrupted run: the first start_at sampled frames are
+    assumed to be written already and are skipped. The original frame index and
+    timestamp of every saved frame are written to frames.csv in the image folder.
+    Returns the video's summary: seconds per stage (decode, infer, image_write,
+    label_write) and frame/box counters. progress=True shows a progress bar over
+    the video's frames, progress=False prints nothing. output_layout='shard' packs
+    every image and label of the video into one uncompressed tar (shard.tar, with
+    an offset index) in the image folder instead of one file per frame; shards
+    are always written from the first frame.
+    """
     # Create directories if they don't exist
     if not os.path.exists(frame_output_folder):
         os.makedirs(frame_output_folder)
     if not os.path.exists(label_output_folder):
         os.makedirs(label_output_folder)
 
+    frame_image_path(frame_output_folder, 0, image_format)  # Fail on an unknown format before decoding anything
+    if output_layout not in OUTPUT_LAYOUTS:
+        raise ValueError(f"Unknown output layout: {output_layout} (expected one of {OUTPUT_LAYOUTS})")
+    if output_layout == 'shard':
+        # A tar cannot be appended to safely after a crash, so a shard is rewritten from scratch
+        start_at = 0
+
     # Open video
     cap = cv2.VideoCapture(str(video_path))  # Convert video_path to string
-    fps = cap.get(cv2.CAP_PROP_FPS)  # Get frames per second of the video
-    frame_count = 0
-    save_count = 0
-    frame_time = 1 / fps  # Time of each frame
-    interval_frame_count = int(frame_interval / frame_time)  # Number of frames between each cut
-    # Load YOLOv8 model
-    model = YOLO('yolov8l.pt')  # You can replace this with a different model version (yolov8s.pt, yolov8m.pt,...)
+    save_count = start_at
+    # Reuse the caller's model, otherwise load (or fetch the cached) YOLOv8 model
+    if model is None:
+        model = load_model(model_name, backend, int8, imgsz, progress)
+    # One tracker per video, so track IDs restart at 1 in every labels_with_ids folder
+    tracker = ByteTracker() if track else None
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    stats = VideoStats(Path(video_path).name)
+    progress_bar = tqdm(total=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None, desc=Path(video_path).name,
+                        unit='frame', leave=False, disable=not progress)
+    last_frame_index = -1
 
-        # Save frame every 0.5 seconds
-        if frame_count % interval_frame_count == 0:
-            # Save frame as an image
-            frame_name = os.path.join(frame_output_folder, f"{save_count:06}.png")
-            cv2.imwrite(frame_name, frame)
-            print(f"Saved {frame_name}")
-            
-            # Run YOLOv8 model on the frame
-            results = model(frame)
-            
-            # Create corresponding .txt file
-            txt_path = os.path.join(label_output_folder, f"{save_count:06}.txt")
-
-            # Save bounding box to .txt file in the required format
-            with open(txt_path, 'w') as f:
-                for result in results:
-                    boxes = result.boxes  # Get bounding box results
-                    for box in boxes:
-                        cls = int(box.cls[0])  # Class ID
-                        
-                        # Only save bounding box for class "person" (ID = 0)
-                        if cls == 0:
-                            # Normalize coordinates: Divide values by the size of the image
-                            img_h, img_w = frame.shape[:2]  # Get image height and width
-                            x_center = box.xywh[0][0] / img_w
-                            y_center = box.xywh[0][1] / img_h
-                            width = box.xywh[0][2] / img_w
-                            height = box.xywh[0][3] / img_h
-                            
-                            # Save to .txt file with format "0 class_id x_center y_center width height"
-                            f.write(f"0 {cls} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
-            
-            print(f"Saved {txt_path}")
-            save_count += 1
-        
-        frame_count += 1
+    def on_sample(frame_index):
+        nonlocal last_frame_index
+        stats.count('frames_kept')
+        progress_bar.update(frame_index - last_frame_index)
+        last_frame_index = frame_index
+
+    shard = ShardWriter(os.path.join(frame_output_folder, SHARD_NAME)) if output_layout == 'shard' else None
+    try:
+        if pipeline:
+            stage_stats = run_pipeline(cap, model, frame_output_folder, label_output_folder, stats, frame_interval,
+                                       sampling, batch_size, imgsz, conf, queue_size, writer_threads, image_format,
+                                       image_quality, tracker, start_at, max_gap, diff_threshold, on_sample, shard)
+            if progress:
+                print_stage_stats(stage_stats)
+        else:
+            batch = []  # Sampled (save_count, frame) pairs waiting for inference
+            index_file, index_writer = open_frame_index(frame_output_folder, start_at)
+            sampled = stats.timed_iter(iter_sampled_frames(cap, frame_interval, sampling, start_at, max_gap,
+                                                           diff_threshold, stats), 'decode')
+            # Images are encoded by a pool of writer threads while the next frames are decoded and detected
+            with index_file, BoundedExecutor(writer_threads, queue_size) as writer:
+                # Save frame every frame_interval seconds
+                for frame_index, timestamp, frame in sampled:
+                    index_writer.writerow([save_count, frame_index, f"{timestamp:.3f}"])
+                    on_sample(frame_index)
+                    # Save frame as an image
+                    writer.submit(stats.call, 'image_write', save_frame_image, frame_output_folder, save_count,
+                                  frame, image_format, image_quality, shard)
 
-    cap.release()
-
-def find_next_available_folder(base_folder):
-    folder_index = 0
-    while True:
-        folder_name = os.path.join(base_folder, f"{folder_index:04}")
-        if not os.path.exists(folder_name):
-            return folder_name
-        folder_index += 1
-
-def process_all_videos(input_folder, frame_output_base, label_output_base, frame_interval=0.5):
-    print("---PREPARING---")
-    video_files = list(Path(input_folder).glob('*.mp4'))  # Get all .mp4 videos in the directory
-    for video_path in tqdm(video_files, desc="Processing videos", unit="video"):
-        # Find next available subfolder
-        frame_output_folder = find_next_available_folder(frame_output_base)
-        label_output_folder = find_next_available_folder(label_output_base)
-        print((video_path.name).upper())
+                    # Run YOLOv8 model once the batch is full
+                    batch.append((save_count, frame))
+                    if len(batch) >= batch_size:
+                        flush_batch(model, batch, label_output_folder, stats, imgsz, conf, tracker, shard)
+                        batch = []
+                        index_file.flush()
+                    save_count += 1
+
+                # Run the model on the last, partially filled batch
+                if batch:
+                    flush_batch(model, batch, label_output_folder, stats, imgsz, conf, tracker, shard)
+    finally:
+        cap.release()
+        progress_bar.close()
+        if shard is not None:
+            shard.close()
+
+    return stats.summary(frame_folder=frame_output_folder, label_folder=label_output_folder)
+
+def allocate_output_indices(base_folders, count, reserved=()):
+    """Hand out count consecutive folder indices that are free in every base folder.
+
+    Each base folder is listed once, and the new indices start after the highest
+    existing (or reserved) one, so the same index is used for images and labels
+    and the result only depends on what is already on disk.
+    """
+    used = set(reserved)
+    for base_folder in base_folders:
+        if os.path.isdir(base_folder):
+            used.update(int(name) for name in os.listdir(base_folder) if name.isdigit())
+    first_index = max(used) + 1 if used else 0
+    return list(range(first_index, first_index + count))
+
+def limit_worker_threads(threads):
+    """Cap the intra-op threads of torch and OpenCV so parallel workers do not oversubscribe the CPU.
+
+    ONNX Runtime and OpenVINO sessions are not capped, so those backends run with a single worker.
+    """
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+def _init_worker(threads, model_name, backend, int8, imgsz, progress):
+    # Runs once in every pool process: limit threads, then load the model for all its videos
+    limit_worker_threads(threads)
+    load_model(model_name, backend, int8, imgsz, progress)
+
+def _process_video_job(job):
+    video_path, key, frame_output_folder, label_output_folder, start_at, options = job
+    model = load_model(options['model_name'], options['backend'], options['int8'], options['imgsz'], False)
+    # Per-video progress bars of parallel workers would overwrite each other, only the coordinator shows one
+    summary = extract_and_detect(video_path, frame_output_folder, label_output_folder, model=model, start_at=start_at,
+                                 progress=False, **options)
+    return key, summary
+
+def process_all_videos(input_folder, frame_output_base, label_output_base, frame_interval=0.5, sampling='grab',
+                       batch_size=8, imgsz=640, conf=0.25, model_name=DEFAULT_MODEL, workers=1, threads_per_worker=None,
+                       pipeline=False, queue_size=32, writer_threads=4, image_format='png', image_quality=None,
+                       track=False, resume=True, manifest_path=None, max_gap=5.0, diff_threshold=8.0, backend='torch',
+                       int8=False, progress=True, summary_path=None, output_layout='files'):
+    """Pre-label every mp4 of input_folder into its own images/NNNN and labels_with_ids/NNNN folders.
+
+    A manifest (by default images/prelabel_manifest.json) maps each video's
+    fingerprint and output-affecting options to its folder: with resume=True,
+    videos already done are skipped and interrupted ones continue in the same
+    folder from their last written frames. With several workers, a video that
+    fails is reported and the others still finish; a RuntimeError naming the
+    failed ones is raised at the end. The summary of every processed video
+    is appended as a JSON line to summary_path (by default
+    images/prelabel_summary.jsonl); progress=False turns off all progress output.
+    The onnx and openvino backends always run with one worker: their sessions
+    use every core, and ultralytics gives no way to cap their threads.
+    """
+    options = {'frame_interval': frame_interval, 'sampling': sampling, 'batch_size': batch_size,
+               'imgsz': imgsz, 'conf': conf, 'model_name': model_name,
+               'pipeline': pipeline, 'queue_size': queue_size, 'writer_threads': writer_threads,
+               'image_format': image_format, 'image_quality': image_quality, 'track': track,
+               'max_gap': max_gap, 'diff_threshold': diff_threshold, 'backend': backend, 'int8': int8,
+               'output_layout': output_layout}
+    manifest_path = manifest_path or os.path.join(frame_output_base, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    summary_path = summary_path or os.path.join(frame_output_base, SUMMARY_NAME)
+    frame_image_path(frame_output_base, 0, image_format)  # Fail on an unknown format before fingerprinting
+    extension = IMAGE_FORMATS[image_format][0]
+    if backend != 'torch' and workers > 1:
+        # Each worker's ONNX Runtime / OpenVINO session would use every core, oversubscribing the CPU workers times
+        if progress:
+            tqdm.write(f"The {backend} backend uses every core in one process, running with 1 worker instead of "
+                       f"{workers}")
+        workers = 1
+
+    video_files = sorted(Path(input_folder).glob('*.mp4'))  # Get all .mp4 videos in the directory
+    pending = []
+    for video_path in tqdm(video_files, desc="Fingerprinting videos", unit="video", disable=not progress):
+        key = manifest_key(cached_fingerprint(video_path, manifest), options)
+        entry = manifest['videos'].get(key) if resume else None
+        if entry and entry['status'] == 'done' and os.path.isdir(os.path.join(frame_output_base, entry['folder'])):
+            if progress:
+                tqdm.write(f"Skipping unchanged video: {video_path.name} -> {entry['folder']}")
+            continue
+        pending.append((video_path, key, entry))
+
+    # Give every new video its output folder index up front, in sorted order, before any worker starts
+    reserved = [entry['folder_index'] for entry in manifest['videos'].values()]
+    new_indices = iter(allocate_output_indices([frame_output_base, label_output_base],
+                                               sum(entry is None for _, _, entry in pending), reserved))
+    jobs = []
+    for video_path, key, entry in pending:
+        folder_index = entry['folder_index'] if entry else next(new_indices)
+        frame_output_folder = os.path.join(frame_output_base, f"{folder_index:04}")
+        label_output_folder = os.path.join(label_output_base, f"{folder_index:04}")
+        start_at = 0
+        # Track IDs depend on every earlier frame, so a tracked video is always redone from the start; so is a shard
+        if entry and not track and output_layout == 'files':
+            # A frame is done once its image, label and frames.csv row are all on disk; up to queue_size writes
+            # can be in flight when a run dies, so those frames are redone too
+            written = min(count_written_frames(frame_output_folder, label_output_folder, extension),
+                          count_indexed_frames(frame_output_folder))
+            start_at = max(0, written - queue_size)
+            if progress:
+                tqdm.write(f"Resuming {video_path.name} in {entry['folder']} from frame {start_at}")
+        manifest['videos'][key] = {'video': video_path.name, 'folder': f"{folder_index:04}",
+                                   'folder_index': folder_index, 'status': 'in_progress',
+                                   'options': {name: options[name] for name in sorted(options)}}
+        jobs.append((video_path, key, frame_output_folder, label_output_folder, start_at, options))
+    save_manifest(manifest, manifest_path)
+    if not jobs:
+        return
+    # Export the model for the backend here, once, rather than racing in every worker
+    export_model(model_name, backend, imgsz, int8)
+
+    def mark_done(key, summary):
+        append_summary(summary, summary_path)
+        manifest['videos'][key]['status'] = 'done'
+        save_manifest(manifest, manifest_path)
+        if progress:
+            tqdm.write(format_summary(summary))
+
+    if workers > 1:
+        # Split the cores between the workers so torch threads never exceed the CPU count
+        if threads_per_worker is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(threads_per_worker, model_name, backend, int8, imgsz, progress)) as executor:
+            futures = {executor.submit(_process_video_job, job): job[0] for job in jobs}
+            failed = []
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing videos", unit="video",
+                               disable=not progress):
+                # One failing video must not keep the ones finished after it from being marked done
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append(futures[future].name)
+                    tqdm.write(f"Failed {futures[future].name}: {type(e).__name__}: {e}")
+                    continue
+                mark_done(*result)
+        if failed:
+            raise RuntimeError(f"{len(failed)} videos failed and are resumed on the next run: {', '.join(failed)}")
+        return
+
+    if threads_per_worker is not None:
+        limit_worker_threads(threads_per_worker)
+    # Load the detector once for the whole folder instead of once per video
+    model = load_model(model_name, backend, int8, imgsz, progress)
+    for video_path, key, frame_output_folder, label_output_folder, start_at, _ in tqdm(
+            jobs, desc="Processing videos", unit="video", disable=not progress):
         # Call the processing function for each video
-        extract_and_detect(video_path, frame_output_folder, label_output_folder, frame_interval)
-        print("--------------------------------------------------")
-        print(f"Video completed: {video_path.name}")
-        print(f"Video path: {frame_output_folder} and {label_output_folder}")
-        print("--------------------------------------------------")
-
-# Paths to the input folder containing videos, and the base directories for saving frames and labels
-input_folder = "video_data"
-frame_output_base = "images"
-label_output_base = "labels_with_ids"
-
-# Call the function to process all videos in the input directory
-process_all_videos(input_folder, frame_output_base, label_output_base, frame_interval=0.5)
+        summary = extract_and_detect(video_path, frame_output_folder, label_output_folder, model=model,
+                                     start_at=start_at, progress=progress, **options)
+        mark_done(key, summary)
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract frames from videos and pre-label people with YOLOv8")
+    # Paths to the input folder containing videos, and the base directories for saving frames and labels
+    parser.add_argument('--input-folder', default="video_data")
+    parser.add_argument('--frame-output-base', default="images")
+    parser.add_argument('--label-output-base', default="labels_with_ids")
+    parser.add_argument('--frame-interval', type=float, default=0.5, help="Seconds between sampled frames")
+    parser.add_argument('--sampling', choices=SAMPLING_MODES, default='grab')
+    parser.add_argument('--max-gap', type=float, default=5.0,
+                        help="adaptive sampling: longest time in seconds between two kept frames")
+    parser.add_argument('--diff-threshold', type=float, default=8.0,
+                        help="adaptive sampling: mean thumbnail difference (0-255) that counts as a scene change")
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Run the model in PyTorch, or exported to ONNX Runtime / OpenVINO")
+    parser.add_argument('--int8', action='store_true', help="int8-quantize the exported model (onnx/openvino)")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Videos processed in parallel (torch backend only: onnx and openvino use 1 worker, "
+                             "with every core)")
+    parser.add_argument('--threads-per-worker', type=int, default=None, help="torch and OpenCV threads per worker")
+    parser.add_argument('--pipeline', action='store_true', help="Decode, infer and write in separate threads")
+    parser.add_argument('--queue-size', type=int, default=32)
+    parser.add_argument('--writer-threads', type=int, default=4)
+    parser.add_argument('--image-format', choices=tuple(IMAGE_FORMATS), default='png')
+    parser.add_argument('--image-quality', type=int, default=None)
+    parser.add_argument('--track', action='store_true', help="Write persistent track IDs instead of 0")
+    parser.add_argument('--output-layout', choices=OUTPUT_LAYOUTS, default='files',
+                        help="shard: one tar of images and labels per video instead of one file per frame")
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help="Reprocess every video instead of skipping the ones in the manifest")
+    parser.add_argument('--manifest', default=None)
+    parser.add_argument('--summary', default=None, help="JSON lines file receiving one summary per video")
+    parser.add_argument('--quiet', action='store_true', help="No progress bars or per-video summaries")
+    args = parser.parse_args()
+
+    # Call the function to process all videos in the input directory
+    process_all_videos(args.input_folder, args.frame_output_base, args.label_output_base, args.frame_interval,
+                       args.sampling, args.batch_size, args.imgsz, args.conf, args.model, args.workers,
+                       args.threads_per_worker, args.pipeline, args.queue_size, args.writer_threads,
+                       args.image_format, args.image_quality, args.track, args.resume, args.manifest, args.max_gap,
+                       args.diff_threshold, args.backend, args.int8, not args.quiet, args.summary, args.output_layout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "prelabel_manifest.json"
+# Bytes hashed from each of the sampled chunks of a video file
+CHUNK_SIZE = 1 << 20
+CHUNK_COUNT = 16
+
+# Options that change what pre_label_tool writes; the others (batch size, workers, ...) only change speed
+OUTPUT_OPTIONS = ('frame_interval', 'sampling', 'imgsz', 'conf', 'model_name', 'image_format', 'image_quality', 'track',
+                  'max_gap', 'diff_threshold', 'backend', 'int8', 'output_layout')
+
+
+def video_fingerprint(video_path):
+    """Hash the size and CHUNK_COUNT evenly spread 1 MB chunks of a video.
+
+    Reading a few MB instead of the whole file keeps re-runs over thousands of
+    multi-GB videos cheap, while any re-encode, trim or replacement still changes
+    the size or the sampled bytes.
+    """
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(video_path, 'rb') as f:
+        if size <= CHUNK_SIZE * CHUNK_COUNT:
+            digest.update(f.read())
+        else:
+            for i in range(CHUNK_COUNT):
+                f.seek((size - CHUNK_SIZE) * i // (CHUNK_COUNT - 1))
+                digest.update(f.read(CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def cached_fingerprint(video_path, manifest):
+    """video_fingerprint() of a video, reused from the manifest while its size and mtime stay the same.
+
+    Re-runs then only stat the videos already fingerprinted, instead of reading
+    CHUNK_COUNT MB from each of them.
+    """
+    stat = os.stat(video_path)
+    fingerprints = manifest.setdefault('fingerprints', {})  # Absolute path -> [size, mtime_ns, fingerprint]
+    path = os.path.abspath(video_path)
+    entry = fingerprints.get(path)
+    if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+    fingerprint = video_fingerprint(video_path)
+    fingerprints[path] = [stat.st_size, stat.st_mtime_ns, fingerprint]
+    return fingerprint
+
+
+def manifest_key(fingerprint, options):
+    """Key of a video processed with the given options, so changed sampling parameters are reprocessed."""
+    params = json.dumps({name: options.get(name) for name in OUTPUT_OPTIONS}, sort_keys=True)
+    return f"{fingerprint}-{hashlib.sha1(params.encode()).hexdigest()[:12]}"
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {'videos': {}}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path):
+    """Write the manifest to a temporary file and rename it, so a crash never leaves it half written."""
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def count_written_frames(frame_output_folder, label_output_folder, extension):
+    """Number of leading frames (000000, 000001, ...) that have both their image and label file."""
+    if not os.path.isdir(frame_output_folder) or not os.path.isdir(label_output_folder):
+        return 0
+    images = set(os.listdir(frame_output_folder))
+    labels = set(os.listdir(label_output_folder))
+    count = 0
+    while f"{count:06}{extension}" in images and f"{count:06}.txt" in labels:
+        count += 1
+    return count
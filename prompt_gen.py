@@ -3,6 +3,7 @@ import os
 import random
 import pandas as pd 
 from pathlib import Path
+from label_db import LabelDB
 
 def sort_elements_csv(file_path):
     # Read the CSV data into a DataFrame
@@ -16,7 +17,23 @@ def sort_elements_csv(file_path):
     return file_path
 
 
-def generate_prompts(elements_folder, prompts_output_folder):
+def iter_element_sources(elements_folder, db_path=None):
+    """Yield (elements file name, rows sorted by frame_id) for every video, from the CSVs or a label database."""
+    if db_path:
+        db = LabelDB(db_path, readonly=True)
+        try:
+            for video in db.videos():
+                yield f"elements_{video}.csv", db.element_rows(video, sort=True)
+        finally:
+            db.close()
+        return
+    for elements_file in [f for f in os.listdir(elements_folder) if f.endswith('.csv')]:
+        csv_sorted_path = sort_elements_csv(os.path.join(elements_folder, elements_file))
+        with open(csv_sorted_path, mode='r') as file:
+            yield elements_file, list(csv.DictReader(file))
+
+
+def generate_prompts(elements_folder, prompts_output_folder, db_path=None):
     # Tạo folder đầu ra nếu nó không tồn tại
     if not os.path.exists(prompts_output_folder):
         os.makedirs(prompts_output_folder)
@@ -37,27 +54,21 @@ def generate_prompts(elements_folder, prompts_output_folder):
         
     ]
 
-    # Lấy danh sách tất cả các file .csv trong folder elements
-    csv_files = [f for f in os.listdir(elements_folder) if f.endswith('.csv')]
-    # Xử lý từng file CSV
-    for elements_file in csv_files:
+    # Each video's elements come from elements/elements_NNNN.csv, or from the label database when db_path is set
+    for elements_file, rows in iter_element_sources(elements_folder, db_path):
         prompts = []
-        csv_path = os.path.join(elements_folder, elements_file)
-        csv_sorted_path = sort_elements_csv(csv_path)
-        with open(csv_sorted_path, mode='r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                color = row.get('color', '').strip().lower()
-                type = row.get('type', '').strip().lower()
-                gender = row.get('gender', '').strip().lower()
-
-                # Chọn ngẫu nhiên một template
-                template = random.choice(templates)
-
-                # Điền vào template với dữ liệu từ CSV
-                prompt = template.format(color=color, type=type, gender=gender)
-                if prompt not in prompts: 
-                    prompts.append(prompt)
+        for row in rows:
+            color = row.get('color', '').strip().lower()
+            type = row.get('type', '').strip().lower()
+            gender = row.get('gender', '').strip().lower()
+
+            # Chọn ngẫu nhiên một template
+            template = random.choice(templates)
+
+            # Điền vào template với dữ liệu từ CSV
+            prompt = template.format(color=color, type=type, gender=gender)
+            if prompt not in prompts: 
+                prompts.append(prompt)
 
         # Lưu các prompt vào một file mới trong folder đầu ra
         prompts_file_name = f"{os.path.splitext(elements_file)[0]}_prompts.txt"
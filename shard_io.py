@@ -0,0 +1,155 @@
+import argparse
+import io
+import json
+import os
+import tarfile
+import threading
+
+# Inside a video's image folder: one uncompressed tar with every frame and label, plus its offset index
+SHARD_NAME = "shard.tar"
+SHARD_INDEX_NAME = "shard.idx.json"
+LABEL_EXTENSION = ".txt"
+
+
+def build_shard_index(shard_path):
+    """Map every member of a tar to the (offset, size) of its data, reading only the headers.
+
+    A tar cut short by an interrupted run is indexed up to its last complete member.
+    """
+    tar_size = os.path.getsize(shard_path)
+    index = {}
+    try:
+        with tarfile.open(shard_path, 'r:') as tar:
+            for member in tar:
+                if member.isfile() and member.offset_data + member.size <= tar_size:
+                    index[member.name] = (member.offset_data, member.size)
+    except tarfile.ReadError:
+        pass
+    return index
+
+
+def shard_index_path(shard_path):
+    return os.path.join(os.path.dirname(shard_path), SHARD_INDEX_NAME)
+
+
+class ShardWriter:
+    """webdataset-style tar shard: frame NNNNNN is stored as NNNNNN.<image ext> and NNNNNN.txt.
+
+    add() can be called from several writer threads. The offset index is
+    written next to the tar on close(), so readers can seek straight to a member.
+    The index of an earlier shard is removed first, so a run that dies before
+    close() leaves no index pointing into the new tar.
+    """
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        if os.path.exists(shard_index_path(shard_path)):
+            os.remove(shard_index_path(shard_path))
+        self._tar = tarfile.open(shard_path, 'w', format=tarfile.GNU_FORMAT)
+        self._lock = threading.Lock()
+
+    def add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        with self._lock:
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._tar.close()
+        index = build_shard_index(self.shard_path)
+        index_path = shard_index_path(self.shard_path)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ShardReader:
+    """Random access to the members of a shard through its offset index.
+
+    Reads seek and read under a lock, so a prefetch thread and the UI thread can
+    share one reader (os.pread would avoid the lock, but Windows has none).
+    """
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        index_path = shard_index_path(shard_path)
+        self.index = None
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                self.index = {name: tuple(entry) for name, entry in json.load(f).items()}
+            # An index whose members run past the end of the tar belongs to another version of it
+            if max((offset + size for offset, size in self.index.values()), default=0) > os.path.getsize(shard_path):
+                self.index = None
+        if self.index is None:
+            # Shards from an interrupted run have no index yet: rebuild it from the tar headers
+            self.index = build_shard_index(shard_path)
+        self._file = open(shard_path, 'rb')
+        self._lock = threading.Lock()
+
+    def read(self, name):
+        offset, size = self.index[name]
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def frame_names(self, extensions):
+        """Sorted names of the image members with one of the given extensions."""
+        return sorted(name for name in self.index if name.lower().endswith(extensions))
+
+    def label_text(self, frame_name):
+        """Text of the label member of a frame, '' when it has none."""
+        name = os.path.splitext(frame_name)[0] + LABEL_EXTENSION
+        return self.read(name).decode() if name in self.index else ''
+
+    def close(self):
+        self._file.close()
+
+
+def find_shard(frame_folder):
+    """Path of the shard of an image folder, None when the folder holds loose image files."""
+    shard_path = os.path.join(frame_folder, SHARD_NAME)
+    return shard_path if os.path.exists(shard_path) else None
+
+
+def export_shard(shard_path, frame_output_folder, label_output_folder, overwrite_labels=False):
+    """Unpack a shard into the loose layout: images into frame_output_folder, .txt labels into label_output_folder.
+
+    Label files already in label_output_folder are annotator edits made on top
+    of the shard, so they are kept unless overwrite_labels is set.
+    """
+    os.makedirs(frame_output_folder, exist_ok=True)
+    os.makedirs(label_output_folder, exist_ok=True)
+    reader = ShardReader(shard_path)
+    try:
+        for name in sorted(reader.index):
+            is_label = name.endswith(LABEL_EXTENSION)
+            path = os.path.join(label_output_folder if is_label else frame_output_folder, name)
+            if is_label and os.path.exists(path) and not overwrite_labels:
+                continue
+            with open(path, 'wb') as f:
+                f.write(reader.read(name))
+    finally:
+        reader.close()
+    return len(reader.index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a pre-labeling shard back to loose image and label files")
+    parser.add_argument('shard', help="Path to images/NNNN/shard.tar")
+    parser.add_argument('frame_output_folder')
+    parser.add_argument('label_output_folder')
+    parser.add_argument('--overwrite-labels', action='store_true',
+                        help="Replace label files already edited in label_tool with the shard's pre-labels")
+    args = parser.parse_args()
+    count = export_shard(args.shard, args.frame_output_folder, args.label_output_folder, args.overwrite_labels)
+    print(f"Exported {count} files from {args.shard}")
+
+
+if __name__ == '__main__':
+    main()
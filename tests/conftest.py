@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_video(tmp_path):
+    """make_video({frame_id: label lines}, frame_count, elements rows) lays out one video, returns its images folder.
+
+    The dataset is images/0001, labels_with_ids/0001 and elements/elements_0001.csv
+    under tmp_path; elements rows are (frame_id, class_id, type, color, gender).
+    """
+    def make(frames, frame_count, elements=()):
+        image_folder = tmp_path / "images" / "0001"
+        label_folder = tmp_path / "labels_with_ids" / "0001"
+        image_folder.mkdir(parents=True)
+        label_folder.mkdir(parents=True)
+        (tmp_path / "elements").mkdir()
+        for frame_id in range(frame_count):
+            (image_folder / f"{frame_id:06}.png").write_bytes(b"")
+        for frame_id, lines in frames.items():
+            (label_folder / f"{frame_id:06}.txt").write_text("".join(line + "\n" for line in lines))
+        rows = "".join(",".join(str(value) for value in row) + "\n" for row in elements)
+        (tmp_path / "elements" / "elements_0001.csv").write_text("frame_id,class_id,type,color,gender\n" + rows)
+        return str(image_folder)
+    return make
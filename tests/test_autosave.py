@@ -0,0 +1,70 @@
+import threading
+import time
+
+from autosave import Autosaver
+
+
+class Writer:
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.written = threading.Event()
+
+    def __call__(self, pending):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.batches.append(pending)
+        self.written.set()
+
+
+def test_edits_within_the_delay_are_one_write():
+    writer = Writer()
+    saver = Autosaver(writer, delay=0.2)
+    saver.mark('a', 1)
+    saver.mark('b', 1)
+    saver.mark('a', 2)
+    assert saver.get('a') == 2 and saver.pending_count() == 2
+    assert not writer.batches
+    assert writer.written.wait(5)
+    saver.close()
+    assert writer.batches == [{'a': 2, 'b': 1}]
+    assert saver.writes == 1
+    assert saver.get('a', 'on disk') == 'on disk'
+
+
+def test_flush_writes_now():
+    writer = Writer()
+    saver = Autosaver(writer, delay=60)
+    saver.mark('a', 1)
+    start = time.monotonic()
+    saver.flush()
+    assert time.monotonic() - start < 5
+    assert writer.batches == [{'a': 1}]
+    assert saver.pending_count() == 0
+    saver.flush()
+    saver.close()
+    assert saver.writes == 1
+
+
+def test_close_writes_what_is_pending():
+    writer = Writer()
+    saver = Autosaver(writer, delay=60)
+    saver.mark('a', 1)
+    saver.close()
+    assert writer.batches == [{'a': 1}]
+
+
+def test_failed_write_is_retried_without_losing_newer_edits():
+    writer = Writer(failures=1)
+    saver = Autosaver(writer, delay=0.05)
+    saver.mark('a', 1)
+    saver.mark('b', 1)
+    saver.flush()
+    assert isinstance(saver.error, OSError)
+    assert saver.get('a') == 1 and saver.pending_count() == 2
+    saver.mark('a', 2)
+    assert writer.written.wait(5)
+    saver.close()
+    assert writer.batches == [{'a': 2, 'b': 1}]
+    assert saver.error is None
@@ -0,0 +1,69 @@
+from edit_journal import EditJournal, applied_edits
+
+
+def test_undo_and_redo_follow_the_stacks(tmp_path):
+    journal = EditJournal(str(tmp_path / "journal.jsonl"))
+    journal.record('label', frame='a')
+    journal.record('label', frame='b')
+    applied = []
+    assert journal.undo(applied.append)['frame'] == 'b'
+    assert journal.undo(applied.append)['frame'] == 'a'
+    assert journal.undo(applied.append) is None
+    assert journal.redo(applied.append)['frame'] == 'a'
+    assert [edit['frame'] for edit in applied] == ['b', 'a', 'a']
+    assert journal.last_edit()['frame'] == 'a'
+    journal.close()
+
+
+def test_record_clears_the_redo_stack(tmp_path):
+    journal = EditJournal(str(tmp_path / "journal.jsonl"))
+    journal.record('label', frame='a')
+    journal.undo(lambda edit: None)
+    journal.record('label', frame='b')
+    assert journal.redo(lambda edit: None) is None
+    assert journal.last_edit()['frame'] == 'b'
+    assert journal.last_edit()['prev'] is None
+    journal.close()
+
+
+def test_reopening_restores_the_state(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = EditJournal(path)
+    journal.record('label', frame='a')
+    journal.record('label', frame='b')
+    journal.undo(lambda edit: None)
+    journal.close()
+
+    journal = EditJournal(path)
+    edit, undone = journal.last_applied()
+    assert (edit['frame'], undone) == ('b', True)
+    assert journal.redo(lambda edit: None)['frame'] == 'b'
+    assert journal.last_applied()[1] is False
+    journal.close()
+    assert [edit['frame'] for edit in applied_edits(path)] == ['a', 'b']
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = EditJournal(str(path))
+    journal.record('label', frame='a')
+    journal.close()
+    complete = path.read_bytes()
+    path.write_bytes(complete + b'{"type": "edit", "op": "la')
+
+    assert [edit['frame'] for edit in applied_edits(str(path))] == ['a']
+    journal = EditJournal(str(path))
+    assert path.read_bytes() == complete
+    assert journal.last_edit()['frame'] == 'a'
+    journal.record('label', frame='b')
+    journal.close()
+    assert [edit['frame'] for edit in applied_edits(str(path))] == ['a', 'b']
+
+
+def test_partial_first_line_empties_the_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    path.write_bytes(b'{"type": "ed')
+    journal = EditJournal(str(path))
+    assert path.read_bytes() == b''
+    assert journal.last_applied() is None
+    journal.close()
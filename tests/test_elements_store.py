@@ -0,0 +1,80 @@
+from elements_store import ElementsStore
+
+HEADER = "frame_id,class_id,type,color,gender\r\n"
+
+
+def make_store(tmp_path, text=HEADER + "0,1,car,red,\r\n1,1,car,red,\r\n"):
+    path = tmp_path / "elements_0001.csv"
+    path.write_bytes(text.encode())
+    return path, ElementsStore(str(path))
+
+
+def test_new_rows_are_appended(tmp_path):
+    path, store = make_store(tmp_path)
+    before = path.read_bytes()
+    store.set(2, 1, {'type': 'car', 'color': 'blue'})
+    assert store.is_dirty()
+    store.flush()
+    assert path.read_bytes() == before + b"2,1,car,blue,\r\n"
+    assert not store.is_dirty()
+
+
+def test_unchanged_values_are_not_dirty(tmp_path):
+    _, store = make_store(tmp_path)
+    store.set(0, 1, {'type': 'car', 'color': 'red'})
+    assert not store.is_dirty()
+
+
+def test_changed_and_removed_rows_rewrite_the_file(tmp_path):
+    path, store = make_store(tmp_path)
+    store.set(0, 1, {'type': 'van'})
+    store.remove(1, 1)
+    store.flush()
+    assert path.read_bytes() == (HEADER + "0,1,van,,\r\n").encode()
+
+
+def test_restore_changes_keeps_them_pending(tmp_path):
+    _, store = make_store(tmp_path)
+    store.set(0, 1, {'type': 'van'})
+    store.set(5, 2, {'type': 'bus'})
+    store.remove(1, 1)
+    upserts, deletes = store.take_changes()
+    assert [upsert[:2] for upsert in upserts] == [(5, 2), (0, 1)]
+    assert deletes == [(1, 1)]
+    assert not store.is_dirty()
+
+    store.restore_changes(upserts, deletes)
+    assert store.is_dirty()
+    upserts, deletes = store.take_changes()
+    assert sorted(upsert[:2] for upsert in upserts) == [(0, 1), (5, 2)]
+    assert deletes == [(1, 1)]
+
+
+def test_restore_changes_skips_what_was_edited_since(tmp_path):
+    _, store = make_store(tmp_path)
+    store.set(5, 2, {'type': 'bus'})
+    store.remove(1, 1)
+    upserts, deletes = store.take_changes()
+    store.remove(5, 2)
+    store.set(1, 1, {'type': 'car'})
+    store.take_changes()
+    store.restore_changes(upserts, deletes)
+    assert store.take_changes() == ([], [])
+
+
+def test_torn_row_is_dropped_and_rewritten(tmp_path):
+    path, store = make_store(tmp_path, HEADER + "0,1,car,red,\r\n1,")
+    assert list(store.rows) == [(0, 1)]
+    assert store.is_dirty()
+    store.flush()
+    assert path.read_bytes() == (HEADER + "0,1,car,red,\r\n").encode()
+
+
+def test_nearest_and_frames_in(tmp_path):
+    _, store = make_store(tmp_path, HEADER + "2,1,car,,\r\n6,1,van,,\r\n")
+    assert store.nearest(1, 0)['type'] == 'car'
+    assert store.nearest(1, 5)['type'] == 'car'
+    assert store.nearest(1, 9)['type'] == 'van'
+    assert store.latest_before(1, 2) is None
+    assert store.frames_in(1, 3) == [6]
+    assert store.nearest(2, 0) is None
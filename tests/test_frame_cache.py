@@ -0,0 +1,103 @@
+import threading
+import time
+
+from frame_cache import FrameCache
+
+
+class _Image:
+    """Stands in for a PIL image: only its size and bands are used."""
+    def __init__(self, name, size=(10, 10)):
+        self.name = name
+        self.size = size
+
+    def getbands(self):
+        return ('R', 'G', 'B')
+
+
+class Loader:
+    def __init__(self):
+        self.loaded = []
+        self.gate = {}  # name -> threading.Event a load of that name waits for
+
+    def __call__(self, name):
+        if name in self.gate:
+            self.gate[name].wait(5)
+        self.loaded.append(name)
+        return _Image(name), [{'class_id': 1, 'name': name}]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_miss_then_hit_with_copied_boxes():
+    loader = Loader()
+    cache = FrameCache(loader)
+    image, boxes = cache.get('a')
+    boxes[0]['class_id'] = 7
+    image_again, boxes_again = cache.get('a')
+    assert image_again is image
+    assert boxes_again == [{'class_id': 1, 'name': 'a'}]
+    assert loader.loaded == ['a']
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+    cache.close()
+
+
+def test_least_recently_used_frame_is_evicted():
+    loader = Loader()
+    cache = FrameCache(loader, max_bytes=2 * 300)
+    cache.get('a')
+    cache.get('b')
+    cache.get('a')
+    cache.get('c')
+    assert cache.stats()['frames'] == 2
+    cache.get('a')
+    assert loader.loaded == ['a', 'b', 'c']
+    cache.get('b')
+    assert loader.loaded == ['a', 'b', 'c', 'b']
+    cache.close()
+
+
+def test_prefetched_frames_are_hits():
+    loader = Loader()
+    cache = FrameCache(loader)
+    cache.prefetch(['b', 'c'])
+    wait_for(lambda: cache.stats()['prefetched'] == 2)
+    cache.get('b')
+    cache.get('c')
+    assert cache.stats()['hits'] == 2
+    assert loader.loaded == ['b', 'c']
+    cache.close()
+
+
+def test_prefetch_racing_an_edit_is_dropped():
+    loader = Loader()
+    loader.gate['a'] = threading.Event()
+    cache = FrameCache(loader)
+    cache.prefetch(['a'])
+    wait_for(lambda: cache._loading == 'a')
+    # The labels were saved while the old boxes were being loaded
+    cache.put_boxes('a', [{'class_id': 2}])
+    loader.gate['a'].set()
+    wait_for(lambda: cache._loading is None)
+    assert cache.stats()['prefetched'] == 0
+    del loader.gate['a']
+    assert cache.get('a')[1] == [{'class_id': 1, 'name': 'a'}]
+    assert cache.stats()['misses'] == 1
+    cache.close()
+
+
+def test_put_boxes_and_discard():
+    loader = Loader()
+    cache = FrameCache(loader)
+    image, _ = cache.get('a')
+    cache.put_boxes('a', [{'class_id': 3}])
+    assert cache.get('a') == (image, [{'class_id': 3}])
+    cache.discard('a')
+    assert cache.stats()['frames'] == 0
+    cache.get('a')
+    assert loader.loaded == ['a', 'a']
+    cache.close()
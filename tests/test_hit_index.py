@@ -0,0 +1,71 @@
+import random
+
+from hit_index import CORNERS, BoxGridIndex, box_corners
+
+
+class Box:
+    def __init__(self, rect):
+        self.rect = rect
+
+
+def brute_box_at(boxes, x, y):
+    inside = [(b.rect[2] * b.rect[3], -i, b) for i, b in enumerate(boxes)
+              if b.rect[0] <= x <= b.rect[0] + b.rect[2] and b.rect[1] <= y <= b.rect[1] + b.rect[3]]
+    return min(inside, key=lambda entry: entry[:2])[2] if inside else None
+
+
+def test_smallest_then_topmost_box_wins():
+    index = BoxGridIndex(cell_size=32)
+    big, small, twin = Box((0, 0, 200, 200)), Box((50, 50, 20, 20)), Box((50, 50, 20, 20))
+    for box in (big, small, twin):
+        index.set(box, box.rect)
+    assert index.box_at(60, 60) is twin
+    assert index.box_at(150, 150) is big
+    assert index.box_at(250, 10) is None
+    index.remove(twin)
+    assert index.box_at(60, 60) is small
+    assert len(index) == 2
+
+
+def test_moved_box_leaves_its_old_cells():
+    index = BoxGridIndex(cell_size=32)
+    box = Box((0, 0, 10, 10))
+    index.set(box, box.rect)
+    index.set(box, (300, 300, 10, 10))
+    assert index.box_at(5, 5) is None
+    assert index.handle_at(0, 0) is None
+    assert index.box_at(305, 305) is box
+    index.remove(box)
+    assert not index._box_cells and not index._handle_cells
+
+
+def test_nearest_handle_wins():
+    index = BoxGridIndex(cell_size=32, handle_size=8)
+    left, right = Box((0, 0, 100, 50)), Box((104, 0, 100, 50))
+    index.set(left, left.rect)
+    index.set(right, right.rect)
+    assert index.handle_at(101, 1) == (left, 'top-right')
+    assert index.handle_at(103, 49) == (right, 'bottom-left')
+    assert index.handle_at(50, 25) is None
+
+
+def test_matches_a_brute_force_scan():
+    rng = random.Random(0)
+    index = BoxGridIndex(cell_size=50, handle_size=6)
+    boxes = []
+    for _ in range(200):
+        box = Box((rng.uniform(0, 900), rng.uniform(0, 600), rng.uniform(5, 150), rng.uniform(5, 150)))
+        boxes.append(box)
+        index.set(box, box.rect)
+    for box in boxes[::3]:
+        box.rect = (rng.uniform(0, 900), rng.uniform(0, 600), rng.uniform(5, 150), rng.uniform(5, 150))
+        index.set(box, box.rect)
+    # Moving keeps a box's stacking order
+    for _ in range(2000):
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 700)
+        assert index.box_at(x, y) is brute_box_at(boxes, x, y)
+        handle = index.handle_at(x, y)
+        if handle is not None:
+            corner = box_corners(*handle[0].rect)[handle[1]]
+            assert abs(x - corner[0]) <= 6 and abs(y - corner[1]) <= 6
+            assert handle[1] in CORNERS
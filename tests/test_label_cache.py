@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+
+from label_cache import CACHE_NAME, LabelCache
+from label_db import format_label_line
+
+
+def line(class_id, x=0.5):
+    return format_label_line(0, class_id, x, 0.5, 0.1, 0.1)
+
+
+def write_labels(folder, name, lines):
+    with open(os.path.join(folder, f"{name}.txt"), 'w') as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+def test_merged_replaces_adds_and_drops_names(tmp_path):
+    folder = str(tmp_path)
+    write_labels(folder, "a", [line(1)])
+    write_labels(folder, "b", [line(2)])
+    write_labels(folder, "c", [line(3), line(4)])
+    cache = LabelCache(folder)
+    table = np.array([[0, 5, 0.1, 0.2, 0.3, 0.4], [0, 6, 0.5, 0.6, 0.7, 0.8]])
+    names, index, stats, columns, offsets = cache._merged(cache._state, {'b': table, 'd': table[:1]}, ['a'],
+                                                          {'b': [1, 2], 'd': [3, 4]})
+    assert names == ['b', 'c', 'd']
+    assert index == {'b': 0, 'c': 1, 'd': 2}
+    assert stats[0] == [1, 2] and stats[2] == [3, 4]
+    assert offsets.tolist() == [0, 2, 4, 5]
+    assert columns['frame'].tolist() == [0, 0, 1, 1, 2]
+    assert columns['class_id'].tolist() == [5, 6, 3, 4, 5]
+    assert columns['height'][:2].tolist() == [0.4, 0.8]
+
+
+def test_reopening_parses_only_changed_files(tmp_path):
+    folder = str(tmp_path)
+    for name in "abc":
+        write_labels(folder, name, [line(1)])
+    assert LabelCache(folder).parsed == 3
+    write_labels(folder, "b", [line(1), line(2)])
+    os.remove(os.path.join(folder, "c.txt"))
+    cache = LabelCache(folder)
+    assert cache.parsed == 1
+    assert cache.names() == ['a', 'b']
+    assert cache.frame_lines('b') == [line(1), line(2)]
+    assert cache.frame_lines('c') is None
+
+
+def test_update_is_written_on_save(tmp_path):
+    folder = str(tmp_path)
+    write_labels(folder, "a", [line(1)])
+    cache = LabelCache(folder)
+    write_labels(folder, "a", [line(7)])
+    mtime = os.stat(os.path.join(folder, CACHE_NAME)).st_mtime_ns
+    cache.update({'a': [line(7)]})
+    assert cache.frame_lines('a') == [line(7)]
+    assert os.stat(os.path.join(folder, CACHE_NAME)).st_mtime_ns == mtime
+    cache.save()
+    assert LabelCache(folder).parsed == 0
+    assert LabelCache(folder).frame_lines('a') == [line(7)]
+
+
+def test_readonly_cache_writes_nothing(tmp_path):
+    folder = str(tmp_path)
+    write_labels(folder, "a", [line(1)])
+    cache = LabelCache(folder, readonly=True)
+    assert cache.frame_lines('a') == [line(1)]
+    assert not os.path.exists(os.path.join(folder, CACHE_NAME))
+
+
+def test_malformed_lines_are_skipped_and_reported(tmp_path):
+    folder = str(tmp_path)
+    write_labels(folder, "a", [line(1), "0 2 0.5 0.5 0.1", "not a label", line(3)])
+    write_labels(folder, "b", [line(4)])
+    cache = LabelCache(folder)
+    assert cache.malformed == {'a': ["0 2 0.5 0.5 0.1", "not a label"]}
+    assert cache.frame_lines('a') == [line(1), line(3)]
+    assert cache.frame_lines('b') == [line(4)]
+    # Reported again on the next open, until the file is rewritten
+    cache = LabelCache(folder)
+    assert cache.parsed == 1 and list(cache.malformed) == ['a']
+    write_labels(folder, "a", [line(1)])
+    cache.update({'a': [line(1)]})
+    cache.save()
+    assert cache.malformed == {}
+    assert LabelCache(folder).parsed == 0
+
+
+def test_save_does_not_keep_the_file_mapped(tmp_path):
+    folder = str(tmp_path)
+    write_labels(folder, "a", [line(1)])
+    LabelCache(folder)
+    cache = LabelCache(folder)
+    assert isinstance(cache._state[3]['frame'], np.memmap)
+    cache._save()
+    assert not any(isinstance(array, np.memmap) for array in cache._state[3].values())
+    assert not isinstance(cache._state[4], np.memmap)
+    assert cache.frame_lines('a') == [line(1)]
+
+    write_labels(folder, "b", [line(2)])
+    cache.refresh()
+    assert not any(isinstance(array, np.memmap) for array in cache._state[3].values())
+    assert LabelCache(folder).frame_lines('b') == [line(2)]
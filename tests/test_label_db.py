@@ -0,0 +1,52 @@
+import os
+import sqlite3
+
+from label_db import LabelDB, export_dataset, import_dataset
+
+LINE = "0 1 0.500000 0.500000 0.100000 0.100000"
+
+
+def make_dataset(tmp_path):
+    (tmp_path / "labels" / "0001").mkdir(parents=True)
+    (tmp_path / "labels" / "0001" / "000000.txt").write_text(LINE + "\n")
+    (tmp_path / "elements").mkdir()
+    (tmp_path / "elements" / "elements_0001.csv").write_text("frame_id,class_id,type,color,gender\n0,1,car,red,\n")
+    db_path = str(tmp_path / "labels.db")
+    assert import_dataset(db_path, str(tmp_path / "labels"), str(tmp_path / "elements")) == ['0001']
+    return db_path
+
+
+def test_import_then_export_round_trip(tmp_path):
+    db_path = make_dataset(tmp_path)
+    assert export_dataset(db_path, str(tmp_path / "out" / "labels"), str(tmp_path / "out" / "elements")) == ['0001']
+    assert (tmp_path / "out" / "labels" / "0001" / "000000.txt").read_text() == LINE + "\n"
+    assert (tmp_path / "out" / "elements" / "elements_0001.csv").read_text().splitlines() == [
+        "frame_id,class_id,type,color,gender", "0,1,car,red,"]
+
+
+def test_readonly_connection_writes_nothing(tmp_path):
+    db_path = make_dataset(tmp_path)
+    # Back to a rollback journal: a writable LabelDB would switch it to WAL again
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    before = open(db_path, 'rb').read()
+    db = LabelDB(db_path, readonly=True)
+    assert db.videos() == ['0001']
+    assert db.frame_lines('0001', '000000') == [LINE]
+    assert db.element_rows('0001')[0]['type'] == 'car'
+    db.close()
+    assert open(db_path, 'rb').read() == before
+    assert sorted(os.listdir(tmp_path)) == ['elements', 'labels', 'labels.db']
+
+
+def test_save_frames_and_elements_in_one_transaction(tmp_path):
+    db_path = make_dataset(tmp_path)
+    db = LabelDB(db_path)
+    db.save_frames('0001', {'000001': [LINE]}, [(1, 1, {'type': 'van', 'color': '', 'gender': ''})], [(0, 1)])
+    db.close()
+    db = LabelDB(db_path, readonly=True)
+    assert db.frame_names('0001') == ['000000', '000001']
+    assert [(row['frame_id'], row['type']) for row in db.element_rows('0001')] == [('1', 'van')]
+    db.close()
+    assert os.path.exists(db_path)
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from label_db import format_label_line
+from label_ops import open_video, range_edit, remap_ids
+
+
+def line(class_id, x=0.5):
+    return format_label_line(0, class_id, x, 0.5, 0.1, 0.1)
+
+
+def test_remap_swaps_ids(make_video):
+    labels, _ = open_video(make_video({0: [line(1), line(2)], 1: [line(1)]}, 2))
+    assert labels.remap({1: 2, 2: 1}).tolist() == [0, 1]
+    assert labels.class_id.tolist() == [2, 1, 2]
+
+
+def test_remap_only_touches_the_range(make_video):
+    labels, _ = open_video(make_video({0: [line(1)], 1: [line(1)], 2: [line(1)]}, 3))
+    assert labels.remap({1: 5}, 1, 1).tolist() == [1]
+    assert labels.class_id.tolist() == [1, 5, 1]
+
+
+def test_remap_clash_raises_and_leaves_the_labels(make_video):
+    labels, _ = open_video(make_video({0: [line(1)], 1: [line(1), line(2)]}, 2))
+    with pytest.raises(ValueError, match="frames 1"):
+        labels.remap({1: 2})
+    assert labels.class_id.tolist() == [1, 1, 2]
+    assert labels.changes() == {}
+
+
+def test_remap_allows_frames_that_already_repeat_an_id(make_video):
+    labels, _ = open_video(make_video({0: [line(2), line(2, 0.2), line(1)]}, 1))
+    assert labels.remap({1: 2}).tolist() == [0]
+    assert labels.class_id.tolist() == [2, 2, 2]
+
+
+def test_save_writes_only_the_changed_frames(make_video):
+    image_folder = make_video({0: [line(1)], 1: [line(2)]}, 2, [(0, 1, 'car', 'red', ''), (1, 2, 'bus', '', '')])
+    labels, elements = open_video(image_folder)
+    rows_before = dict(elements.rows)
+    remap_ids(labels, elements, {2: 3})
+    edit = range_edit(labels, rows_before, elements)
+    assert edit['frames'] == [{'frame': '000001.png', 'frame_id': 1, 'before': [line(2)], 'after': [line(3)]}]
+    assert edit['elements'] == [[1, 2, {'type': 'bus', 'color': '', 'gender': ''}, None],
+                                [1, 3, None, {'type': 'bus', 'color': '', 'gender': ''}]]
+
+    assert labels.save(elements) == ['000001.png']
+    label_folder = os.path.join(os.path.dirname(os.path.dirname(image_folder)), "labels_with_ids", "0001")
+    with open(os.path.join(label_folder, "000001.txt")) as f:
+        assert f.read() == line(3) + "\n"
+    labels, elements = open_video(image_folder)
+    assert labels.class_id.tolist() == [1, 3]
+    assert sorted(elements.rows) == [(0, 1), (1, 3)]
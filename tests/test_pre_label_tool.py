@@ -0,0 +1,268 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("ultralytics")
+import pre_label_tool
+from instrumentation import VideoStats
+from pre_label_tool import (FRAME_INDEX_NAME, allocate_output_indices, count_indexed_frames, detection_conf,
+                            extract_and_detect, format_label_lines, iter_sampled_frames, label_rows,
+                            process_all_videos)
+from prelabel_manifest import MANIFEST_NAME
+from tracker import ByteTracker
+
+
+class _Tensor:
+    """Just enough of a torch tensor for person_boxes()."""
+    def __init__(self, values):
+        self.values = np.array(values, dtype=np.float32).reshape(-1, *np.shape(values)[1:])
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Result:
+    def __init__(self, cls, xywh, conf):
+        self.boxes = type('Boxes', (), {'cls': _Tensor(cls), 'xywh': _Tensor(xywh), 'conf': _Tensor(conf)})()
+
+
+class FakeDetector:
+    """Detects one person whose x position is the frame's brightness, and one car."""
+    def __init__(self):
+        self.frames = 0
+
+    def __call__(self, frames, imgsz=640, conf=0.25, verbose=False):
+        self.frames += len(frames)
+        results = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            x = float(frame.mean()) / 255 * w
+            results.append(_Result([0, 2], [[x, h / 2, 10, 20], [5, 5, 4, 4]], [0.9, 0.8]))
+        return results
+
+
+def write_video(path, frame_count, fps=10, shade=0):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), fps, (64, 48))
+    for i in range(frame_count):
+        writer.write(np.full((48, 64, 3), (shade + i * 8) % 256, np.uint8))
+    writer.release()
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    detector = FakeDetector()
+    monkeypatch.setattr(pre_label_tool, 'load_model', lambda *args, **kwargs: detector)
+    monkeypatch.setattr(pre_label_tool, 'export_model', lambda *args, **kwargs: None)
+    return detector
+
+
+def run(tmp_path, **options):
+    process_all_videos(str(tmp_path / "videos"), str(tmp_path / "images"), str(tmp_path / "labels"),
+                       progress=False, **options)
+
+
+def test_manifest_skips_done_videos(tmp_path, detector):
+    (tmp_path / "videos").mkdir()
+    write_video(tmp_path / "videos" / "a.mp4", 30)
+    run(tmp_path)
+    assert detector.frames == 6
+    run(tmp_path)
+    assert detector.frames == 6
+    # An option that changes the output makes it a new video
+    run(tmp_path, conf=0.5)
+    assert detector.frames == 12
+    assert sorted(os.listdir(tmp_path / "images")) == ['0000', '0001', MANIFEST_NAME, 'prelabel_summary.jsonl']
+
+
+def test_resume_redoes_frames_missing_from_the_index(tmp_path, detector):
+    (tmp_path / "videos").mkdir()
+    write_video(tmp_path / "videos" / "a.mp4", 30)
+    run(tmp_path, queue_size=1, batch_size=2)
+    image_folder = tmp_path / "images" / "0000"
+    index_path = image_folder / FRAME_INDEX_NAME
+    complete = index_path.read_bytes()
+    labels = {name: (tmp_path / "labels" / "0000" / name).read_bytes() for name in os.listdir(tmp_path / "labels" / "0000")}
+    assert count_indexed_frames(str(image_folder)) == 6
+
+    # A kill with every image on disk, but frames.csv only written up to a torn third row
+    manifest_path = tmp_path / "images" / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text())
+    for entry in manifest['videos'].values():
+        entry['status'] = 'in_progress'
+    manifest_path.write_text(json.dumps(manifest))
+    lines = complete.split(b'\r\n')
+    index_path.write_bytes(b'\r\n'.join(lines[:3]) + b'\r\n' + lines[3][:4])
+    assert count_indexed_frames(str(image_folder)) == 2
+
+    run(tmp_path, queue_size=1, batch_size=2)
+    # Resumed from frame 1: the frame before the first one missing from the index, less the in-flight queue
+    assert detector.frames == 6 + 5
+    assert index_path.read_bytes() == complete
+    assert {name: (tmp_path / "labels" / "0000" / name).read_bytes() for name in labels} == labels
+
+
+def test_output_indices_are_free_in_every_base_folder(tmp_path):
+    images, labels = tmp_path / "images", tmp_path / "labels"
+    (images / "0000").mkdir(parents=True)
+    (labels / "0003").mkdir(parents=True)
+    (images / "notes").mkdir()
+    assert allocate_output_indices([str(images), str(labels)], 2) == [4, 5]
+    assert allocate_output_indices([str(images), str(labels)], 1, reserved=[7]) == [8]
+    assert allocate_output_indices([str(tmp_path / "missing")], 3) == [0, 1, 2]
+
+
+class _ThreadPool(ThreadPoolExecutor):
+    """ProcessPoolExecutor stand-in running the jobs in threads, so the test's patches apply."""
+    def __init__(self, max_workers, mp_context=None, initializer=None, initargs=()):
+        super().__init__(max_workers)
+
+
+def test_failed_video_does_not_stop_the_others(tmp_path, detector, monkeypatch):
+    (tmp_path / "videos").mkdir()
+    for shade, name in enumerate("abc"):
+        write_video(tmp_path / "videos" / f"{name}.mp4", 10, shade=shade * 50)
+    process_video_job = pre_label_tool._process_video_job
+
+    def fail_on_b(job):
+        if job[0].name == "b.mp4":
+            raise IOError("disk full")
+        return process_video_job(job)
+    monkeypatch.setattr(pre_label_tool, 'ProcessPoolExecutor', _ThreadPool)
+    monkeypatch.setattr(pre_label_tool, '_process_video_job', fail_on_b)
+    with pytest.raises(RuntimeError, match="b.mp4"):
+        run(tmp_path, workers=2)
+    manifest = json.loads((tmp_path / "images" / MANIFEST_NAME).read_text())
+    status = {entry['video']: entry['status'] for entry in manifest['videos'].values()}
+    assert status == {'a.mp4': 'done', 'b.mp4': 'in_progress', 'c.mp4': 'done'}
+
+
+@pytest.mark.parametrize('sampling', ['read', 'grab', 'seek', 'adaptive'])
+@pytest.mark.parametrize('start_at, kept, skipped', [(0, 6, 24), (2, 4, 20)])
+def test_skipped_frames_are_counted_by_the_sampler(tmp_path, sampling, start_at, kept, skipped):
+    write_video(tmp_path / "a.mp4", 30)
+    cap = cv2.VideoCapture(str(tmp_path / "a.mp4"))
+    stats = VideoStats("a.mp4")
+    # Every frame differs from the last kept one, so adaptive sampling keeps every candidate
+    sampled = list(iter_sampled_frames(cap, 0.5, sampling, start_at, diff_threshold=0, stats=stats))
+    cap.release()
+    assert len(sampled) == kept
+    assert stats.counters['frames_skipped'] == skipped
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_resumed_summary_counts_only_its_own_frames(tmp_path, detector, pipeline):
+    write_video(tmp_path / "a.mp4", 30)
+    summary = extract_and_detect(str(tmp_path / "a.mp4"), str(tmp_path / "images"), str(tmp_path / "labels"),
+                                 start_at=2, pipeline=pipeline, progress=False)
+    assert (summary['frames_kept'], summary['frames_skipped']) == (4, 20)
+
+
+def test_load_model_is_quiet_without_progress(monkeypatch, capsys):
+    monkeypatch.setattr(pre_label_tool, 'create_detector', lambda *args: FakeDetector())
+    monkeypatch.setattr(pre_label_tool, '_model_cache', {})
+    model = pre_label_tool.load_model('quiet.pt', progress=False)
+    assert pre_label_tool.load_model('quiet.pt') is model
+    assert capsys.readouterr().out == ""
+    pre_label_tool.load_model('loud.pt')
+    assert "Loaded loud.pt" in capsys.readouterr().out
+
+
+def test_tracked_labels_keep_their_id_below_conf():
+    tracker = ByteTracker()
+    assert detection_conf(0.25, tracker) == tracker.low_thresh
+    assert detection_conf(0.25) == 0.25
+    shape = (100, 100, 3)
+    result = _Result([0, 0, 2], [[50, 50, 10, 20], [20, 20, 10, 20], [5, 5, 4, 4]], [0.9, 0.2, 0.9])
+    class_ids, boxes = label_rows(result, shape, tracker, conf=0.25)
+    # The weak, unmatched person is only seen by the tracker, the car is never written
+    assert class_ids.tolist() == [1]
+    assert np.allclose(boxes, [[0.5, 0.5, 0.1, 0.2]])
+    class_ids, boxes = label_rows(_Result([0], [[51, 50, 10, 20]], [0.2]), shape, tracker, conf=0.25)
+    assert class_ids.tolist() == [1]
+
+
+def read_samples(path, frame_interval, sampling, start_sample=0):
+    cap = cv2.VideoCapture(str(path))
+    samples = list(iter_sampled_frames(cap, frame_interval, sampling, start_sample))
+    cap.release()
+    return samples
+
+
+@pytest.mark.parametrize('frame_interval', [0.5, 0.15, 0.05])
+def test_sampling_modes_keep_the_same_frames(tmp_path, frame_interval):
+    write_video(tmp_path / "a.mp4", 40)
+    # Fractional steps are rounded per sample instead of truncated once, so they do not drift
+    step = max(frame_interval * 10, 1.0)
+    expected = [int(round(k * step)) for k in range(40) if int(round(k * step)) < 40]
+    read = read_samples(tmp_path / "a.mp4", frame_interval, 'read')
+    assert [frame_index for frame_index, _, _ in read] == expected
+    assert [timestamp for _, timestamp, _ in read] == [frame_index / 10 for frame_index in expected]
+    for sampling in ('grab', 'seek'):
+        samples = read_samples(tmp_path / "a.mp4", frame_interval, sampling)
+        assert [frame_index for frame_index, _, _ in samples] == expected
+        assert all(np.array_equal(a[2], b[2]) for a, b in zip(samples, read))
+
+
+@pytest.mark.parametrize('sampling', ['read', 'grab', 'seek', 'adaptive'])
+def test_resume_yields_the_remaining_samples(tmp_path, sampling):
+    write_video(tmp_path / "a.mp4", 30)
+    full = [frame_index for frame_index, _, _ in read_samples(tmp_path / "a.mp4", 0.3, sampling)]
+    resumed = [frame_index for frame_index, _, _ in read_samples(tmp_path / "a.mp4", 0.3, sampling, 4)]
+    assert resumed == full[4:]
+
+
+def test_bad_sampling_arguments_are_rejected(tmp_path):
+    write_video(tmp_path / "a.mp4", 5)
+    with pytest.raises(ValueError, match="sampling mode"):
+        read_samples(tmp_path / "a.mp4", 0.5, 'skip')
+    with pytest.raises(ValueError, match="frame_interval"):
+        read_samples(tmp_path / "a.mp4", 0, 'grab')
+
+
+def read_outputs(folder):
+    return {name: (folder / name).read_bytes() for name in sorted(os.listdir(folder))}
+
+
+@pytest.mark.parametrize('batch_size, pipeline', [(3, False), (8, False), (3, True)])
+def test_batched_labels_belong_to_their_frame(tmp_path, detector, batch_size, pipeline):
+    write_video(tmp_path / "a.mp4", 30)
+    extract_and_detect(str(tmp_path / "a.mp4"), str(tmp_path / "one" / "images"), str(tmp_path / "one" / "labels"),
+                       batch_size=1, progress=False)
+    extract_and_detect(str(tmp_path / "a.mp4"), str(tmp_path / "batched" / "images"),
+                       str(tmp_path / "batched" / "labels"), batch_size=batch_size, pipeline=pipeline, progress=False)
+    assert read_outputs(tmp_path / "batched" / "labels") == read_outputs(tmp_path / "one" / "labels")
+    assert read_outputs(tmp_path / "batched" / "images") == read_outputs(tmp_path / "one" / "images")
+    # The person's x position is the brightness of the frame it was detected in
+    for save_count in range(6):
+        image = cv2.imread(str(tmp_path / "batched" / "images" / f"{save_count:06}.png"))
+        label = (tmp_path / "batched" / "labels" / f"{save_count:06}.txt").read_text().split()
+        assert float(label[2]) == pytest.approx(image.mean() / 255, abs=1e-6)
+
+
+def baseline_label_text(result, frame_shape):
+    # How pre_label_tool wrote a label file before vectorization, box by box
+    text = ""
+    for cls, xywh in zip(result.boxes.cls.numpy(), result.boxes.xywh.numpy()):
+        if int(cls) == 0:
+            img_h, img_w = frame_shape[:2]
+            x_center, y_center, width, height = (xywh[0] / img_w, xywh[1] / img_h, xywh[2] / img_w,
+                                                 xywh[3] / img_h)
+            text += f"0 {int(cls)} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n"
+    return text
+
+
+def test_label_text_matches_the_baseline():
+    rng = np.random.default_rng(0)
+    shape = (720, 1280, 3)
+    for _ in range(50):
+        count = int(rng.integers(0, 12))
+        xywh = rng.uniform(0, 1, (count, 4)).astype(np.float32) * [1280, 720, 1280, 720]
+        result = _Result(rng.integers(0, 4, count), xywh, rng.uniform(0.25, 1, count))
+        assert format_label_lines(*label_rows(result, shape)) == baseline_label_text(result, shape)
@@ -0,0 +1,37 @@
+import os
+
+from prelabel_manifest import cached_fingerprint, count_written_frames, manifest_key, video_fingerprint
+
+
+def test_fingerprint_is_reused_while_size_and_mtime_stay(tmp_path, monkeypatch):
+    video = tmp_path / "a.mp4"
+    video.write_bytes(b"video" * 100)
+    manifest = {'videos': {}}
+    fingerprint = cached_fingerprint(video, manifest)
+    assert fingerprint == video_fingerprint(video)
+
+    monkeypatch.setattr('prelabel_manifest.video_fingerprint', lambda path: "read again")
+    assert cached_fingerprint(video, manifest) == fingerprint
+    video.write_bytes(b"other" * 101)
+    assert cached_fingerprint(video, manifest) == "read again"
+
+
+def test_only_output_options_change_the_key():
+    options = {'frame_interval': 0.5, 'conf': 0.25, 'batch_size': 8, 'workers': 1}
+    key = manifest_key("abc", options)
+    assert manifest_key("abc", {**options, 'batch_size': 32, 'workers': 4}) == key
+    assert manifest_key("abc", {**options, 'conf': 0.5}) != key
+    assert manifest_key("abd", options) != key
+
+
+def test_written_frames_need_an_image_and_a_label(tmp_path):
+    images, labels = tmp_path / "images", tmp_path / "labels"
+    images.mkdir()
+    labels.mkdir()
+    for i in range(4):
+        (images / f"{i:06}.png").write_bytes(b"")
+    for i in (0, 1, 3):
+        (labels / f"{i:06}.txt").write_bytes(b"")
+    assert count_written_frames(str(images), str(labels), '.png') == 2
+    assert count_written_frames(str(images), str(labels), '.jpg') == 0
+    assert count_written_frames(os.path.join(str(tmp_path), "missing"), str(labels), '.png') == 0
@@ -0,0 +1,73 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from shard_io import SHARD_NAME, ShardReader, ShardWriter, export_shard, find_shard, shard_index_path
+
+
+def write_shard(folder, frames):
+    shard_path = os.path.join(folder, SHARD_NAME)
+    with ShardWriter(shard_path) as shard:
+        for name, data in frames.items():
+            shard.add(name, data)
+    return shard_path
+
+
+def test_round_trip(tmp_path):
+    shard_path = write_shard(str(tmp_path), {'000000.png': b'image 0', '000000.txt': b'0 1 0.5 0.5 0.1 0.1\n',
+                                             '000001.png': b'image 1' * 100})
+    assert find_shard(str(tmp_path)) == shard_path
+    assert os.path.exists(shard_index_path(shard_path))
+    reader = ShardReader(shard_path)
+    assert reader.frame_names(('.png',)) == ['000000.png', '000001.png']
+    assert reader.read('000001.png') == b'image 1' * 100
+    assert reader.label_text('000000.png') == '0 1 0.5 0.5 0.1 0.1\n'
+    assert reader.label_text('000001.png') == ''
+    reader.close()
+
+
+def test_export_keeps_edited_labels(tmp_path):
+    shard_path = write_shard(str(tmp_path), {'000000.png': b'image', '000000.txt': b'pre-label\n'})
+    frames, labels = tmp_path / "frames", tmp_path / "labels"
+    labels.mkdir()
+    (labels / "000000.txt").write_bytes(b'edited\n')
+    assert export_shard(shard_path, str(frames), str(labels)) == 2
+    assert (frames / "000000.png").read_bytes() == b'image'
+    assert (labels / "000000.txt").read_bytes() == b'edited\n'
+
+
+def test_missing_index_is_rebuilt_from_a_cut_tar(tmp_path):
+    shard_path = write_shard(str(tmp_path), {'000000.png': b'a' * 1000, '000001.png': b'b' * 5000})
+    os.remove(shard_index_path(shard_path))
+    with open(shard_path, 'r+b') as f:
+        # Cut inside the data of the second member
+        f.truncate(512 + 1024 + 512 + 2000)
+    reader = ShardReader(shard_path)
+    assert list(reader.index) == ['000000.png']
+    assert reader.read('000000.png') == b'a' * 1000
+    reader.close()
+
+
+def test_new_writer_removes_the_old_index(tmp_path):
+    shard_path = write_shard(str(tmp_path), {'000000.png': b'a' * 5000})
+    ShardWriter(shard_path)
+    assert not os.path.exists(shard_index_path(shard_path))
+
+
+def test_index_past_the_end_of_the_tar_is_discarded(tmp_path):
+    shard_path = write_shard(str(tmp_path), {'000000.png': b'small'})
+    with open(shard_index_path(shard_path), 'w') as f:
+        json.dump({'000000.png': [512, 5], '000001.png': [100000, 5000]}, f)
+    reader = ShardReader(shard_path)
+    assert list(reader.index) == ['000000.png']
+    assert reader.read('000000.png') == b'small'
+    reader.close()
+
+
+def test_reads_from_several_threads(tmp_path):
+    frames = {f"{i:06}.png": bytes([i]) * (1000 + i) for i in range(20)}
+    reader = ShardReader(write_shard(str(tmp_path), frames))
+    with ThreadPoolExecutor(4) as executor:
+        read = list(executor.map(reader.read, list(frames) * 10))
+    assert read == list(frames.values()) * 10
+    reader.close()
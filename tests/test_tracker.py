@@ -0,0 +1,51 @@
+import numpy as np
+
+from tracker import ByteTracker, evaluate_tracker, iou_matrix, make_synthetic_sequence
+
+
+def test_iou_matrix():
+    iou = iou_matrix([[0.5, 0.5, 0.2, 0.2]], [[0.5, 0.5, 0.2, 0.2], [0.6, 0.5, 0.2, 0.2], [0.9, 0.9, 0.1, 0.1]])
+    assert np.allclose(iou, [[1.0, 1 / 3, 0.0]])
+
+
+def test_ids_stay_with_moving_people():
+    tracker = ByteTracker()
+    boxes = np.array([[0.2, 0.5, 0.05, 0.2], [0.8, 0.5, 0.05, 0.2]])
+    first = tracker.update(boxes, [0.9, 0.9])
+    assert sorted(first.tolist()) == [1, 2]
+    for frame in range(1, 30):
+        moved = boxes + [[0.005 * frame, 0, 0, 0], [-0.005 * frame, 0, 0, 0]]
+        # Detections come in any order
+        assert tracker.update(moved[::-1], [0.9, 0.9]).tolist() == first[::-1].tolist()
+
+
+def test_ids_survive_misses_and_low_scores():
+    tracker = ByteTracker(max_lost=5)
+    box = np.array([[0.5, 0.5, 0.05, 0.2]])
+    track_id = tracker.update(box, [0.9])[0]
+    # A low-score detection right after a match keeps the ID instead of being dropped
+    assert tracker.update(box, [0.3])[0] == track_id
+    for _ in range(3):
+        assert len(tracker.update(np.zeros((0, 4)), [])) == 0
+    assert tracker.update(box, [0.9])[0] == track_id
+    # Lost for longer than max_lost, a new ID starts
+    for _ in range(6):
+        tracker.update(np.zeros((0, 4)), [])
+    assert tracker.update(box, [0.9])[0] == track_id + 1
+
+
+def test_low_score_detections_start_no_track():
+    tracker = ByteTracker()
+    assert tracker.update([[0.5, 0.5, 0.05, 0.2]], [0.3]).tolist() == [0]
+    assert tracker.update([[0.5, 0.5, 0.05, 0.2]], [0.55]).tolist() == [0]
+    assert tracker.update([[0.5, 0.5, 0.05, 0.2]], [0.7]).tolist() == [1]
+
+
+def test_ids_are_stable_on_a_synthetic_crowd():
+    metrics = evaluate_tracker(ByteTracker(), make_synthetic_sequence())
+    assert metrics['coverage'] > 0.95
+    assert metrics['purity'] > 0.95
+    assert metrics['id_switches'] <= 5
+    clean = evaluate_tracker(ByteTracker(), make_synthetic_sequence(num_people=4, miss_rate=0, low_score_rate=0,
+                                                                      seed=1))
+    assert (clean['coverage'], clean['purity'], clean['id_switches']) == (1.0, 1.0, 0)
@@ -0,0 +1,99 @@
+import os
+
+from edit_journal import JOURNAL_NAME, EditJournal, applied_edits
+from label_cache import CACHE_NAME
+from label_db import format_label_line
+from label_ops import open_video
+from validate_labels import _validate_job, check_video, format_report, repair_video, validate_video
+
+
+def line(class_id, x=0.5):
+    return format_label_line(0, class_id, x, 0.5, 0.1, 0.1)
+
+
+def test_repeated_ids_get_new_ones(make_video):
+    labels, elements = open_video(make_video({0: [line(1), line(1, 0.2)], 1: [line(2)]}, 2))
+    issues = check_video(labels, elements)
+    assert issues['duplicate_rows'].tolist() == [1]
+    assert repair_video(labels, elements, issues)['duplicate_ids'] == 1
+    assert labels.class_id.tolist() == [1, 3, 2]
+    assert not len(check_video(labels, elements)['duplicate_rows'])
+
+
+def test_journaled_deletion_is_drift(make_video):
+    # Frame 1 was deleted after the row of frame 2 was written, so its box is now in frame 1
+    labels, elements = open_video(make_video({0: [line(1)], 1: [line(2)]}, 2,
+                                             [(0, 1, 'car', '', ''), (2, 2, 'bus', '', '')]))
+    issues = check_video(labels, elements, deletions=[1])
+    assert issues['drift'].tolist() == [[2, 2, 1]]
+    assert not len(issues['orphans'])
+    repair_video(labels, elements, issues)
+    assert sorted(elements.rows) == [(0, 1), (1, 2)]
+
+
+def test_unexplained_drift_is_only_guessed(make_video):
+    labels, elements = open_video(make_video({0: [line(1)], 1: [line(2)]}, 2,
+                                             [(0, 1, 'car', '', ''), (2, 2, 'bus', '', '')]))
+    issues = check_video(labels, elements)
+    assert not len(issues['drift'])
+    assert issues['guessed_drift'].tolist() == [[2, 2, 1]]
+    assert issues['orphans'].tolist() == [[2, 2]]
+
+
+def test_orphan_moves_to_the_next_box_of_its_id(make_video):
+    labels, elements = open_video(make_video({0: [line(1)], 3: [line(4)]}, 4,
+                                             [(0, 1, 'car', '', ''), (1, 4, 'van', 'white', '')]))
+    issues = check_video(labels, elements)
+    assert issues['orphans'].tolist() == [[1, 4]]
+    assert repair_video(labels, elements, issues)['orphan_elements'] == 1
+    assert elements.get(3, 4) == {'type': 'van', 'color': 'white', 'gender': ''}
+    assert elements.get(1, 4) is None
+
+
+def test_check_only_writes_nothing(make_video):
+    image_folder = make_video({0: [line(1)], 1: [line(1, 0.2), line(1)]}, 2, [(5, 1, 'car', '', '')])
+    dataset_folder = os.path.dirname(os.path.dirname(image_folder))
+    before = sorted(os.walk(dataset_folder))
+    report = validate_video(image_folder)
+    assert set(report['issues']) == {'duplicate_ids', 'orphan_elements'}
+    assert sorted(os.walk(dataset_folder)) == before
+    assert not os.path.exists(os.path.join(dataset_folder, "labels_with_ids", "0001", CACHE_NAME))
+
+
+def test_fix_journals_the_repairs(make_video):
+    image_folder = make_video({0: [line(1)], 1: [line(2)]}, 2, [(0, 1, 'car', '', ''), (2, 2, 'bus', '', '')])
+    journal_path = os.path.join(image_folder, JOURNAL_NAME)
+    journal = EditJournal(journal_path)
+    journal.record('delete_frame', index=1)
+    journal.close()
+
+    report = validate_video(image_folder, fix=True)
+    assert report['fixed']['frame_drift'] == 1
+    _, elements = open_video(image_folder)
+    assert sorted(elements.rows) == [(0, 1), (1, 2)]
+    edit = applied_edits(journal_path)[-1]
+    assert edit['op'] == 'repair'
+    assert edit['elements'] == [[1, 2, None, {'type': 'bus', 'color': '', 'gender': ''}],
+                                [2, 2, {'type': 'bus', 'color': '', 'gender': ''}, None]]
+
+
+def test_malformed_lines_are_reported_and_dropped(make_video):
+    image_folder = make_video({0: [line(1), "0 2 0.5 0.5 0.1"], 1: [line(2)]}, 2)
+    report = validate_video(image_folder)
+    assert report['issues'] == {'malformed_lines': {'lines': 1, 'frames': '0'}}
+
+    report = validate_video(image_folder, fix=True)
+    assert report['fixed'] == {'malformed_lines': 1, 'frame_drift': 0}
+    assert report['written'] == 1
+    assert validate_video(image_folder)['issues'] == {}
+    # The journal keeps the dropped line, so the repair can be undone
+    edit = applied_edits(os.path.join(image_folder, JOURNAL_NAME))[-1]
+    assert edit['frames'][0]['before'] == [line(1), "0 2 0.5 0.5 0.1"]
+    assert edit['frames'][0]['after'] == [line(1)]
+
+
+def test_unreadable_video_is_reported(tmp_path):
+    report = _validate_job((str(tmp_path / "images" / "0002"), False, False, 3))
+    assert report['video'] == '0002'
+    assert 'FileNotFoundError' in report['error']
+    assert format_report(report).startswith("0002: could not be checked")
@@ -0,0 +1,218 @@
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Noise of the Kalman filter, relative to the box size (same weights as ByteTrack)
+STD_WEIGHT_POSITION = 1. / 20
+STD_WEIGHT_VELOCITY = 1. / 160
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU between every box of boxes_a (N, 4) and boxes_b (M, 4), both as xc, yc, w, h."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    a_min, a_max = a[:, :2] - a[:, 2:] / 2, a[:, :2] + a[:, 2:] / 2
+    b_min, b_max = b[:, :2] - b[:, 2:] / 2, b[:, :2] + b[:, 2:] / 2
+    overlap = np.clip(np.minimum(a_max[:, None], b_max[None]) - np.maximum(a_min[:, None], b_min[None]), 0, None)
+    inter = overlap[..., 0] * overlap[..., 1]
+    area_a = np.clip(a[:, 2], 0, None) * np.clip(a[:, 3], 0, None)
+    area_b = np.clip(b[:, 2], 0, None) * np.clip(b[:, 3], 0, None)
+    union = area_a[:, None] + area_b[None] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def match_boxes(iou, min_iou):
+    """One-to-one assignment maximising total IoU, keeping only pairs with IoU >= min_iou.
+
+    Returns (matches as an (K, 2) array of row/column indices, unmatched rows, unmatched columns).
+    """
+    rows, cols = np.arange(iou.shape[0]), np.arange(iou.shape[1])
+    if iou.size == 0:
+        return np.empty((0, 2), dtype=int), rows, cols
+    matched_rows, matched_cols = linear_sum_assignment(-iou)
+    keep = iou[matched_rows, matched_cols] >= min_iou
+    matches = np.column_stack([matched_rows[keep], matched_cols[keep]])
+    return matches, np.setdiff1d(rows, matches[:, 0]), np.setdiff1d(cols, matches[:, 1])
+
+
+class KalmanBoxFilter:
+    """Constant velocity Kalman filter over (xc, yc, w, h), run on all tracks at once.
+
+    States are stacked as means (N, 8) and covariances (N, 8, 8), with the
+    velocities of the four box values in the last four columns.
+    """
+    def __init__(self):
+        self.motion = np.eye(8)
+        self.motion[:4, 4:] = np.eye(4)
+        self.observation = np.eye(4, 8)
+
+    @staticmethod
+    def _box_scale(boxes):
+        # Noise grows with the box: w for the x values, h for the y values
+        return np.stack([boxes[:, 2], boxes[:, 3], boxes[:, 2], boxes[:, 3]], axis=1)
+
+    def initiate(self, boxes):
+        scale = self._box_scale(boxes)
+        mean = np.concatenate([boxes, np.zeros_like(boxes)], axis=1)
+        std = np.concatenate([2 * STD_WEIGHT_POSITION * scale, 10 * STD_WEIGHT_VELOCITY * scale], axis=1)
+        cov = np.zeros((len(boxes), 8, 8))
+        cov[:, np.arange(8), np.arange(8)] = std ** 2
+        return mean, cov
+
+    def predict(self, mean, cov):
+        scale = self._box_scale(mean[:, :4])
+        std = np.concatenate([STD_WEIGHT_POSITION * scale, STD_WEIGHT_VELOCITY * scale], axis=1)
+        noise = np.zeros_like(cov)
+        noise[:, np.arange(8), np.arange(8)] = std ** 2
+        mean = mean @ self.motion.T
+        cov = self.motion @ cov @ self.motion.T + noise
+        return mean, cov
+
+    def update(self, mean, cov, boxes):
+        scale = self._box_scale(mean[:, :4])
+        noise = np.zeros((len(mean), 4, 4))
+        noise[:, np.arange(4), np.arange(4)] = (STD_WEIGHT_POSITION * scale) ** 2
+        projected_cov = self.observation @ cov @ self.observation.T + noise
+        gain = cov @ self.observation.T @ np.linalg.inv(projected_cov)
+        innovation = boxes - mean @ self.observation.T
+        mean = mean + np.einsum('nij,nj->ni', gain, innovation)
+        cov = cov - gain @ projected_cov @ gain.transpose(0, 2, 1)
+        return mean, cov
+
+
+class ByteTracker:
+    """ByteTrack-style IoU tracker that gives every person box a persistent ID.
+
+    Confident detections are matched to all tracks first, then the remaining
+    low-score detections are matched to tracks seen in the previous frame, which
+    keeps IDs through partial occlusions. Track IDs start at 1, since 0 means
+    "unassigned" in the labels_with_ids files.
+    """
+    def __init__(self, high_thresh=0.5, low_thresh=0.1, new_track_thresh=0.6, match_iou=0.2, low_match_iou=0.5,
+                 max_lost=30):
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.new_track_thresh = new_track_thresh
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.max_lost = max_lost  # Frames a track is kept without a matching detection
+        self.kalman = KalmanBoxFilter()
+        self.mean = np.zeros((0, 8))
+        self.cov = np.zeros((0, 8, 8))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.lost = np.zeros(0, dtype=np.int64)  # Frames since each track was last matched
+        self.next_id = 1
+
+    def update(self, boxes, scores):
+        """Associate one frame's detections with the tracks.
+
+        boxes is an (N, 4) array of xc, yc, w, h and scores its (N,) confidences.
+        Returns the track ID of every detection, 0 for detections left unassigned.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        det_ids = np.zeros(len(boxes), dtype=np.int64)
+        if len(self.ids):
+            self.mean, self.cov = self.kalman.predict(self.mean, self.cov)
+        predicted = self.mean[:, :4]
+
+        high = np.flatnonzero(scores >= self.high_thresh)
+        low = np.flatnonzero((scores >= self.low_thresh) & (scores < self.high_thresh))
+
+        # First association: every track against the confident detections
+        matches, unmatched_tracks, unmatched_high = match_boxes(iou_matrix(predicted, boxes[high]), self.match_iou)
+        # Second association: tracks seen last frame against the low-score detections
+        recent = unmatched_tracks[self.lost[unmatched_tracks] == 0]
+        low_matches, _, _ = match_boxes(iou_matrix(predicted[recent], boxes[low]), self.low_match_iou)
+
+        matched_tracks = np.concatenate([matches[:, 0], recent[low_matches[:, 0]]]).astype(int)
+        matched_dets = np.concatenate([high[matches[:, 1]], low[low_matches[:, 1]]]).astype(int)
+        if len(matched_tracks):
+            self.mean[matched_tracks], self.cov[matched_tracks] = self.kalman.update(
+                self.mean[matched_tracks], self.cov[matched_tracks], boxes[matched_dets])
+        self.lost += 1
+        self.lost[matched_tracks] = 0
+        det_ids[matched_dets] = self.ids[matched_tracks]
+
+        # Drop tracks that have been lost for too long
+        keep = self.lost <= self.max_lost
+        self.mean, self.cov, self.ids, self.lost = self.mean[keep], self.cov[keep], self.ids[keep], self.lost[keep]
+
+        # Start new tracks from confident detections nobody claimed
+        new = high[unmatched_high]
+        new = new[scores[new] >= self.new_track_thresh]
+        if len(new):
+            mean, cov = self.kalman.initiate(boxes[new])
+            new_ids = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            self.mean = np.concatenate([self.mean, mean])
+            self.cov = np.concatenate([self.cov, cov])
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.lost = np.concatenate([self.lost, np.zeros(len(new), dtype=np.int64)])
+            det_ids[new] = new_ids
+        return det_ids
+
+
+def make_synthetic_sequence(num_people=12, num_frames=300, miss_rate=0.1, noise=0.004, low_score_rate=0.2, seed=0):
+    """Ground-truth people walking across a normalized frame, with jitter, misses and low-score detections.
+
+    Returns one (gt_ids, boxes, scores) tuple per frame; detections are shuffled
+    so the tracker cannot rely on their order.
+    """
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0.1, 0.9, (num_people, 2))
+    velocity = rng.uniform(-0.004, 0.004, (num_people, 2))
+    size = np.column_stack([rng.uniform(0.04, 0.08, num_people), rng.uniform(0.15, 0.3, num_people)])
+    sequence = []
+    for frame in range(num_frames):
+        centers = start + velocity * frame
+        # People bounce off the frame borders so they stay in view and cross each other
+        centers = np.abs((centers + 1) % 2 - 1)
+        boxes = np.column_stack([centers, size]) + rng.normal(0, noise, (num_people, 4))
+        scores = rng.uniform(0.6, 0.95, num_people)
+        weak = rng.random(num_people) < low_score_rate
+        scores[weak] = rng.uniform(0.15, 0.5, weak.sum())
+        visible = rng.random(num_people) >= miss_rate
+        order = rng.permutation(np.flatnonzero(visible))
+        sequence.append((np.arange(1, num_people + 1)[order], boxes[order], scores[order]))
+    return sequence
+
+
+def evaluate_tracker(tracker, sequence):
+    """Run the tracker over a synthetic sequence and score its IDs against the ground truth.
+
+    coverage: share of detections that got an ID; purity: share of detections
+    whose ID is the one most used for their person; id_switches: times a
+    person's assigned ID changed.
+    """
+    assigned = {}
+    start = time.perf_counter()
+    for gt_ids, boxes, scores in sequence:
+        for gt_id, track_id in zip(gt_ids, tracker.update(boxes, scores)):
+            assigned.setdefault(int(gt_id), []).append(int(track_id))
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(ids) for ids in assigned.values())
+    covered = pure = switches = 0
+    for ids in assigned.values():
+        ids = np.array(ids)
+        ids = ids[ids > 0]
+        covered += len(ids)
+        if len(ids):
+            pure += int(np.bincount(ids).max())
+            switches += int(np.count_nonzero(np.diff(ids)))
+    return {
+        'frames': len(sequence),
+        'detections': total,
+        'coverage': covered / total if total else 0.0,
+        'purity': pure / total if total else 0.0,
+        'id_switches': switches,
+        'fps': len(sequence) / elapsed if elapsed else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    metrics = evaluate_tracker(ByteTracker(), make_synthetic_sequence())
+    for key, value in metrics.items():
+        print(f"{key:>12}: {value:.3f}" if isinstance(value, float) else f"{key:>12}: {value}")
@@ -0,0 +1,301 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from tqdm import tqdm
+
+from edit_journal import JOURNAL_NAME, EditJournal, applied_edits
+from label_ops import format_ranges, next_free_id, open_video, range_edit
+
+MAX_DRIFT = 3  # Largest frame_id shift guessed for elements rows when the journal does not explain it
+
+
+def _keys(frame, class_id, base):
+    return frame.astype(np.int64) * base + class_id
+
+
+def deletion_targets(frames, deletions):
+    """Where rows at frames would be now if written before the last k frame deletions, for k = 1, 2, ...
+
+    deletions are the indices of the deleted frames, oldest first, as
+    LabelTool journals them. Yields one array per k, with -1 for rows of a
+    frame that was itself deleted.
+    """
+    size = int(max(frames.max(initial=0), max(deletions, default=0))) + 1
+    suffix = np.arange(size)  # Frame now of every frame_id before the deletions gone through so far
+    for index in reversed(deletions):
+        # A row is first moved by the older deletion, then by the newer ones already in suffix
+        table = np.arange(size)
+        table[index] = -1
+        table[index + 1:] -= 1
+        suffix = np.where(table < 0, -1, suffix[np.maximum(table, 0)])
+        yield suffix[frames]
+
+
+def check_video(labels, elements, max_drift=MAX_DRIFT, deletions=()):
+    """Inconsistencies of one video, found with array operations over all its boxes and elements rows.
+
+    deletions are the indices of the frames LabelTool deleted, oldest first
+    (from the edit journal, see frame_deletions()). Returns a dict of arrays:
+      unassigned: rows of the boxes with class_id 0
+      duplicate_rows: rows of the boxes repeating an ID already used in their frame
+      orphans: (frame_id, class_id) elements rows with no box, and no journaled deletion moving them to one
+      drift: (frame_id, class_id, shift) elements rows whose box is shift frames earlier, because
+             of frames deleted before theirs
+      guessed_drift: (frame_id, class_id, shift) orphans with a box of their ID up to max_drift frames
+                     earlier that has no row; only a guess, so they are left to the orphan repair
+      malformed: frame_ids whose label file has lines that could not be parsed
+    """
+    rows = np.array(list(elements.rows), dtype=np.int64).reshape(-1, 2)
+    row_frame, row_class = rows[:, 0], rows[:, 1]
+    base = int(max(labels.class_id.max(initial=0), row_class.max(initial=0))) + 1
+
+    # Boxes sorted by frame, then ID, then position: a box with the same frame and ID as the one before repeats it
+    order = np.lexsort((np.arange(len(labels.frame)), labels.class_id, labels.frame))
+    frame, class_id = labels.frame[order], labels.class_id[order]
+    repeat = np.zeros(len(order), dtype=bool)
+    repeat[1:] = (frame[1:] == frame[:-1]) & (class_id[1:] == class_id[:-1]) & (class_id[1:] != 0)
+
+    box_keys = np.unique(_keys(labels.frame, labels.class_id, base))
+    row_keys = _keys(row_frame, row_class, base)
+    unresolved = ~np.isin(row_keys, box_keys) | (row_class == 0)
+    shift = np.zeros(len(rows), dtype=np.int64)
+    claimed = np.zeros(0, dtype=np.int64)
+    candidates = np.flatnonzero(unresolved & (row_class != 0))
+    open_rows = np.ones(len(candidates), dtype=bool)
+    # Fewest deletions first: a row is assumed to be written as late as its box allows
+    for frames_now in deletion_targets(row_frame[candidates], list(deletions)) if len(candidates) else ():
+        # The box must exist and have no row of its own (or one already moved to it)
+        target = _keys(frames_now, row_class[candidates], base)
+        moved = (open_rows & (frames_now >= 0) & np.isin(target, box_keys) & ~np.isin(target, row_keys)
+                 & ~np.isin(target, claimed))
+        shift[candidates[moved]] = row_frame[candidates[moved]] - frames_now[moved]
+        claimed = np.concatenate([claimed, target[moved]])
+        # A row of a frame deleted later may still belong to a box when written before older deletions
+        open_rows &= ~moved
+    unresolved &= shift == 0
+
+    guess = np.zeros(len(rows), dtype=np.int64)
+    for d in range(1, max_drift + 1):
+        # Same rule as above, for any shift up to max_drift
+        target = row_keys - d * base
+        moved = (unresolved & (guess == 0) & (row_frame >= d) & (row_class != 0) & np.isin(target, box_keys)
+                 & ~np.isin(target, row_keys) & ~np.isin(target, claimed))
+        guess[moved] = d
+        claimed = np.concatenate([claimed, target[moved]])
+    return {'unassigned': np.flatnonzero(labels.class_id == 0),
+            'duplicate_rows': order[repeat],
+            'orphans': rows[unresolved],
+            'drift': np.column_stack([rows[shift > 0], shift[shift > 0]]),
+            'guessed_drift': np.column_stack([rows[guess > 0], guess[guess > 0]]),
+            'malformed': np.array(sorted(labels.malformed), dtype=np.int64)}
+
+
+def frame_deletions(frame_folder):
+    """Indices of the frames LabelTool deleted from a video and did not restore, oldest first."""
+    return [edit['index'] for edit in applied_edits(os.path.join(frame_folder, JOURNAL_NAME))
+            if edit['op'] == 'delete_frame']
+
+
+def repair_video(labels, elements, issues, drop_unassigned=False):
+    """Fix what check_video() found; returns the number of fixes of each kind.
+
+    Repeated IDs get new, unused IDs (the first box of each keeps its ID),
+    drifted rows move to the frame of their box, and orphan rows (guessed
+    drift included) move to the next frame with a box of their ID that has no
+    row, so LabelTool shows the same attributes, or are dropped. Malformed
+    label lines are dropped (the edit journal keeps them). Unassigned boxes
+    are only dropped when drop_unassigned is set, since they usually still
+    need an ID.
+    """
+    fixed = {}
+    if len(issues['malformed']):
+        fixed['malformed_lines'] = labels.drop_malformed()
+    duplicate_rows = issues['duplicate_rows']
+    if len(duplicate_rows):
+        first_id = next_free_id(labels, elements)
+        labels.set_class_ids(duplicate_rows, np.arange(first_id, first_id + len(duplicate_rows)))
+        fixed['duplicate_ids'] = len(duplicate_rows)
+
+    for frame_id, class_id, shift in issues['drift'].tolist():
+        attributes = elements.get(frame_id, class_id)
+        elements.remove(frame_id, class_id)
+        elements.set(frame_id - shift, class_id, attributes)
+    fixed['frame_drift'] = len(issues['drift'])
+
+    orphans = issues['orphans']
+    if len(orphans):
+        frame_span = int(max(labels.frame.max(initial=0), orphans[:, 0].max())) + 1
+        # Boxes keyed by ID, then frame, so the next box of an ID is one searchsorted away
+        box_keys = np.unique(labels.class_id.astype(np.int64) * frame_span + labels.frame)
+        orphan_keys = orphans[:, 1] * frame_span + orphans[:, 0]
+        position = np.searchsorted(box_keys, orphan_keys, 'right')
+        following = box_keys[np.minimum(position, len(box_keys) - 1)] if len(box_keys) else orphan_keys
+        has_next = (position < len(box_keys)) & (following // frame_span == orphans[:, 1])
+        rows = np.array(list(elements.rows), dtype=np.int64).reshape(-1, 2)
+        has_next &= ~np.isin(following, rows[:, 1] * frame_span + rows[:, 0])
+        following, has_next = following.tolist(), has_next.tolist()
+        moves = {}
+        # Latest orphan first, so it is the one carried over when several precede the same box
+        for i in np.argsort(-orphans[:, 0], kind='stable').tolist():
+            frame_id, class_id = orphans[i].tolist()
+            attributes = elements.get(frame_id, class_id)
+            elements.remove(frame_id, class_id)
+            if has_next[i] and following[i] not in moves:
+                moves[following[i]] = (int(following[i] % frame_span), class_id, attributes)
+        for frame_id, class_id, attributes in moves.values():
+            elements.set(frame_id, class_id, attributes)
+        fixed['orphan_elements'] = len(orphans)
+
+    if drop_unassigned and len(issues['unassigned']):
+        labels.remove_rows(issues['unassigned'])
+        fixed['unassigned'] = len(issues['unassigned'])
+    return fixed
+
+
+def summarize(issues, labels):
+    """JSON-friendly report of check_video() results, with frame ranges."""
+    report = {}
+    if len(issues['malformed']):
+        report['malformed_lines'] = {'lines': sum(len(labels.malformed[frame_id]) for frame_id in
+                                                  issues['malformed'].tolist()),
+                                     'frames': format_ranges(issues['malformed'].tolist())}
+    if len(issues['unassigned']):
+        report['unassigned'] = {'boxes': len(issues['unassigned']),
+                                'frames': format_ranges(np.unique(labels.frame[issues['unassigned']]).tolist())}
+    if len(issues['duplicate_rows']):
+        frame = labels.frame[issues['duplicate_rows']]
+        class_id = labels.class_id[issues['duplicate_rows']]
+        report['duplicate_ids'] = {str(c): format_ranges(np.unique(frame[class_id == c]).tolist())
+                                   for c in np.unique(class_id).tolist()}
+    if len(issues['orphans']):
+        report['orphan_elements'] = {'rows': len(issues['orphans']),
+                                     'frames': format_ranges(np.unique(issues['orphans'][:, 0]).tolist()),
+                                     'ids': sorted(set(issues['orphans'][:, 1].tolist()))}
+    for kind, name in (('drift', 'frame_drift'), ('guessed_drift', 'guessed_drift')):
+        drift = issues[kind]
+        if len(drift):
+            report[name] = {'rows': len(drift),
+                            'frames': format_ranges(np.unique(drift[:, 0]).tolist()),
+                            'shifts': {str(d): int(n) for d, n in zip(*np.unique(drift[:, 2], return_counts=True))}}
+    return report
+
+
+def validate_video(frame_folder, fix=False, drop_unassigned=False, max_drift=MAX_DRIFT):
+    """Check one video (its images/NNNN folder) and optionally repair it; returns its report.
+
+    Without fix nothing is written. Repairs are journaled, so LabelTool can undo them.
+    """
+    labels, elements = open_video(frame_folder, readonly=not fix)
+    try:
+        issues = check_video(labels, elements, max_drift, frame_deletions(frame_folder))
+        report = {'video': os.path.basename(os.path.abspath(frame_folder)), 'frames': len(labels.frame_names),
+                  'boxes': len(labels.frame), 'elements': len(elements.rows),
+                  'issues': summarize(issues, labels)}
+        if fix and report['issues']:
+            rows_before = dict(elements.rows)
+            report['fixed'] = repair_video(labels, elements, issues, drop_unassigned)
+            edit = range_edit(labels, rows_before, elements)
+            if edit['frames'] or edit['elements']:
+                journal = EditJournal(os.path.join(frame_folder, JOURNAL_NAME))
+                journal.record('repair', **edit)
+                journal.close()
+            report['written'] = len(labels.save(elements))
+        return report
+    finally:
+        if labels.db is not None:
+            labels.db.close()
+
+
+def _validate_job(job):
+    # A video that cannot be read is reported, so the other videos are still checked
+    try:
+        return validate_video(*job)
+    except Exception as e:
+        return {'video': os.path.basename(os.path.abspath(job[0])), 'error': f"{type(e).__name__}: {e}",
+                'issues': {'error': str(e)}}
+
+
+def format_report(report):
+    if 'error' in report:
+        return f"{report['video']}: could not be checked: {report['error']}"
+    lines = [f"{report['video']}: {report['frames']} frames, {report['boxes']} boxes, {report['elements']} elements rows"]
+    issues = report['issues']
+    if not issues:
+        lines.append("  ok")
+    if 'malformed_lines' in issues:
+        lines.append(f"  {issues['malformed_lines']['lines']} malformed label lines in frames "
+                     f"{issues['malformed_lines']['frames']}")
+    if 'unassigned' in issues:
+        lines.append(f"  {issues['unassigned']['boxes']} boxes without an ID (class_id 0) in frames "
+                     f"{issues['unassigned']['frames']}")
+    for class_id, frames in issues.get('duplicate_ids', {}).items():
+        lines.append(f"  ID {class_id} repeated in frames {frames}")
+    if 'orphan_elements' in issues:
+        orphans = issues['orphan_elements']
+        lines.append(f"  {orphans['rows']} elements rows without a box in frames {orphans['frames']} "
+                     f"(IDs {', '.join(map(str, orphans['ids']))})")
+    if 'frame_drift' in issues:
+        drift = issues['frame_drift']
+        shifts = ", ".join(f"{n} by {d}" for d, n in drift['shifts'].items())
+        lines.append(f"  {drift['rows']} elements rows shifted ({shifts}) in frames {drift['frames']}")
+    if 'guessed_drift' in issues:
+        drift = issues['guessed_drift']
+        shifts = ", ".join(f"{n} by {d}" for d, n in drift['shifts'].items())
+        lines.append(f"  {drift['rows']} of the rows without a box may be shifted ({shifts}) in frames "
+                     f"{drift['frames']}; no deleted frame in the edit journal explains it")
+    if 'fixed' in report:
+        fixed = ", ".join(f"{kind} {n}" for kind, n in report['fixed'].items() if n)
+        lines.append(f"  fixed: {fixed}; {report['written']} label files written")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find (and fix) inconsistent labels and elements of labeled videos")
+    parser.add_argument('--images-base', default="images", help="Folder with one images/NNNN folder per video")
+    parser.add_argument('--videos', default=None, help="Comma-separated video folders to check (default: all)")
+    parser.add_argument('--fix', action='store_true', help="Repair what can be repaired automatically")
+    parser.add_argument('--drop-unassigned', action='store_true', help="With --fix, delete boxes with class_id 0")
+    parser.add_argument('--max-drift', type=int, default=MAX_DRIFT,
+                        help="Largest shift reported as a guess for rows the edit journal does not explain")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Videos checked in parallel")
+    parser.add_argument('--summary', default=None, help="JSON lines file receiving one report per video")
+    parser.add_argument('--quiet', action='store_true', help="Only print the videos with issues")
+    args = parser.parse_args()
+
+    videos = args.videos.split(',') if args.videos else sorted(
+        name for name in os.listdir(args.images_base) if os.path.isdir(os.path.join(args.images_base, name)))
+    jobs = [(os.path.join(args.images_base, video), args.fix, args.drop_unassigned, args.max_drift)
+            for video in videos]
+    reports = []
+    if args.workers > 1 and len(jobs) > 1:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+            futures = [executor.submit(_validate_job, job) for job in jobs]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Checking videos", unit="video",
+                               disable=args.quiet):
+                reports.append(future.result())
+    else:
+        for job in tqdm(jobs, desc="Checking videos", unit="video", disable=args.quiet):
+            reports.append(_validate_job(job))
+
+    reports.sort(key=lambda report: report['video'])
+    for report in reports:
+        if report['issues'] or not args.quiet:
+            print(format_report(report))
+    if args.summary:
+        with open(args.summary, 'a') as f:
+            for report in reports:
+                f.write(json.dumps(report) + '\n')
+    with_issues = sum(1 for report in reports if report['issues'])
+    print(f"{with_issues} of {len(reports)} videos with issues{' (fixed what could be)' if args.fix else ''}")
+    if with_issues and not args.fix:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()